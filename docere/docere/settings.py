@@ -25,6 +25,9 @@ REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.IsAuthenticated',
     ),
+    # keyset-пагинация списков: ?cursor=...&page_size=... (см. main.pagination)
+    'DEFAULT_PAGINATION_CLASS': 'main.pagination.KeysetPagination',
+    'PAGE_SIZE': 50,
 }
 
 
@@ -141,6 +144,28 @@ CELERY_ACCEPT_CONTENT = ['json']
 CELERY_TASK_SERIALIZER = 'json'
 CELERY_TIMEZONE = 'UTC'
 CELERY_BROKER_CONNECTION_RETRY_ON_STARTUP = True
+# периодические задачи (сервис beat в docker-compose)
+CELERY_BEAT_SCHEDULE = {
+    # отложенные после ошибки события EventHub и всё, что не разбудило релей
+    'relay-event-outbox': {
+        'task': 'main.tasks.relay_event_outbox',
+        'schedule': float(os.getenv("EVENTHUB_OUTBOX_SWEEP_SEC", "30")),
+    },
+}
+
+# Кэш — тот же Redis, что и у Celery, отдельная база
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.getenv('CACHE_REDIS_URL', 'redis://redis:6379/1'),
+        'KEY_PREFIX': 'docere',
+    }
+}
+# сколько секунд кэшировать ответ «доктор ведёт пациента» (main.permissions)
+PATIENT_ACCESS_CACHE_TTL = int(os.getenv("PATIENT_ACCESS_CACHE_TTL", "300"))
+# сколько секунд живёт закэшированный ответ справочных эндпоинтов (main.caching);
+# при изменениях данных кэш сбрасывается сигналами раньше
+RESPONSE_CACHE_TIMEOUT = int(os.getenv("RESPONSE_CACHE_TIMEOUT", "3600"))
 
 CORS_ALLOW_ALL_ORIGINS = True
 CORS_ALLOW_CREDENTIALS = True
@@ -174,3 +199,49 @@ SPECTACULAR_SETTINGS['SECURITY_SCHEMES'] = {
 EVENTHUB_ENABLED = os.getenv("EVENTHUB_ENABLED", "1") == "1"
 EVENTHUB_GRPC_ADDR = os.getenv("EVENTHUB_GRPC_ADDR", "event-hub:50051")
 EVENTHUB_TIMEOUT_SEC = float(os.getenv("EVENTHUB_TIMEOUT_SEC", "5.0"))
+# долгоживущие каналы к EventHub (integrations.eventhub.channel):
+# сколько каналов на адрес в процессе и keepalive-пинги HTTP/2 во время
+# вызовов, мс. Меньше 5 мин — только если на сервере EventHub снижен
+# grpc.http2.min_ping_interval_without_data_ms, иначе GOAWAY too_many_pings
+EVENTHUB_CHANNEL_POOL_SIZE = int(os.getenv("EVENTHUB_CHANNEL_POOL_SIZE", "1"))
+EVENTHUB_KEEPALIVE_MS = int(os.getenv("EVENTHUB_KEEPALIVE_MS", "300000"))
+EVENTHUB_KEEPALIVE_TIMEOUT_MS = int(os.getenv("EVENTHUB_KEEPALIVE_TIMEOUT_MS", "10000"))
+# async-клиент (integrations.eventhub.aio): сколько PublishEvent одновременно в publish_events
+EVENTHUB_AIO_CONCURRENCY = int(os.getenv("EVENTHUB_AIO_CONCURRENCY", "32"))
+# outbox событий (main.outbox, задача relay_event_outbox): размер пачки,
+# сколько пачек за один запуск, задержка повтора после ошибки base·2^(n−1)
+# до max секунд, и с какой попытки ошибки пишутся как error
+EVENTHUB_OUTBOX_BATCH_SIZE = int(os.getenv("EVENTHUB_OUTBOX_BATCH_SIZE", "200"))
+EVENTHUB_OUTBOX_MAX_BATCHES = int(os.getenv("EVENTHUB_OUTBOX_MAX_BATCHES", "50"))
+EVENTHUB_OUTBOX_BACKOFF_SEC = float(os.getenv("EVENTHUB_OUTBOX_BACKOFF_SEC", "5"))
+EVENTHUB_OUTBOX_BACKOFF_MAX_SEC = float(os.getenv("EVENTHUB_OUTBOX_BACKOFF_MAX_SEC", "3600"))
+EVENTHUB_OUTBOX_ALERT_ATTEMPTS = int(os.getenv("EVENTHUB_OUTBOX_ALERT_ATTEMPTS", "10"))
+# на сколько секунд релей «арендует» взятую пачку (отправка идёт вне транзакции);
+# упал релей — через столько секунд пачку возьмёт следующий
+EVENTHUB_OUTBOX_LEASE_SEC = float(os.getenv("EVENTHUB_OUTBOX_LEASE_SEC", "300"))
+
+# Обработка ZIP-архивов (main.tasks.process_zip_task):
+# сколько файлов архива обрабатывать параллельно внутри одной задачи (1 — последовательно)
+ARCHIVE_WORKERS = int(os.getenv("ARCHIVE_WORKERS", "1"))
+# архивы, распакованный объём которых не меньше этого порога (в байтах), раздаются
+# по воркерам Celery кусками (group + chord); 0 — всегда одной задачей
+ARCHIVE_FANOUT_MIN_BYTES = int(os.getenv("ARCHIVE_FANOUT_MIN_BYTES", "0"))
+# примерный распакованный объём одного куска при раздаче
+ARCHIVE_CHUNK_BYTES = int(os.getenv("ARCHIVE_CHUNK_BYTES", str(256 * 1024 * 1024)))
+# размер пачки bulk_create для строк LabFile при импорте архива
+ARCHIVE_BULK_BATCH_SIZE = int(os.getenv("ARCHIVE_BULK_BATCH_SIZE", "500"))
+# как часто (в секундах) задача пишет прогресс обработки в ArchiveJobEvent
+ARCHIVE_PROGRESS_INTERVAL = float(os.getenv("ARCHIVE_PROGRESS_INTERVAL", "1.0"))
+# сколько секунд живут нарастающие счётчики прогресса задачи в Redis (main.progress.JobProgress)
+ARCHIVE_PROGRESS_TTL = int(os.getenv("ARCHIVE_PROGRESS_TTL", "86400"))
+
+# Push-статус задач (main.progress, /api/task-status/<id>/stream/ через ASGI):
+# Redis, в pub/sub которого Celery-задача публикует события; пусто — не публиковать
+ARCHIVE_EVENTS_REDIS_URL = os.getenv("ARCHIVE_EVENTS_REDIS_URL", CELERY_BROKER_URL)
+# интервал keepalive-комментариев в SSE-потоке, секунды
+ARCHIVE_EVENTS_HEARTBEAT = float(os.getenv("ARCHIVE_EVENTS_HEARTBEAT", "15"))
+# максимальная длительность одного SSE-соединения, секунды (клиент переподключится).
+# Django 4.2 не видит обрыв клиента под ASGI — поток без клиента живёт до этого срока
+ARCHIVE_EVENTS_STREAM_TIMEOUT = float(os.getenv("ARCHIVE_EVENTS_STREAM_TIMEOUT", "60"))
+# сколько секунд действует билет на SSE-поток (POST /api/task-status/<id>/stream-ticket/)
+ARCHIVE_EVENTS_TICKET_TTL = float(os.getenv("ARCHIVE_EVENTS_TICKET_TTL", "30"))
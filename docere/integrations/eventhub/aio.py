@@ -0,0 +1,81 @@
+import asyncio
+import logging
+import weakref
+from typing import Iterable
+
+import grpc
+from django.conf import settings
+
+from eventhub.v1 import events_pb2, events_pb2_grpc
+
+from .channel import _channel_options
+from .client import BatchResult, EventDTO, _to_pb_event
+
+
+logger = logging.getLogger(__name__)
+
+# grpc.aio-канал привязан к event loop, в котором создан: свой набор на цикл.
+# Цикл закрылся и собран — его каналы уходят из словаря вместе с ним.
+_channels: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, dict]" = weakref.WeakKeyDictionary()
+
+
+def _stub(addr: str) -> events_pb2_grpc.EventIngestStub:
+    per_loop = _channels.setdefault(asyncio.get_running_loop(), {})
+    if addr not in per_loop:
+        channel = grpc.aio.insecure_channel(addr, options=_channel_options())
+        per_loop[addr] = (channel, events_pb2_grpc.EventIngestStub(channel))
+        logger.info("EventHub: aio channel to %s opened", addr)
+    return per_loop[addr][1]
+
+
+async def close_channels() -> None:
+    """Закрыть каналы текущего event loop (на shutdown ASGI-приложения)."""
+    per_loop = _channels.pop(asyncio.get_running_loop(), {})
+    for channel, _ in per_loop.values():
+        await channel.close()
+
+
+async def publish_event(e: EventDTO) -> bool:
+    """Асинхронный аналог client.publish_event: RPC не занимает поток."""
+    if not getattr(settings, "EVENTHUB_ENABLED", True):
+        return False
+
+    addr = getattr(settings, "EVENTHUB_GRPC_ADDR", "127.0.0.1:50051")
+    timeout = float(getattr(settings, "EVENTHUB_TIMEOUT_SEC", 3.0))
+
+    req = events_pb2.PublishEventRequest(event=_to_pb_event(e))
+    resp = await _stub(addr).PublishEvent(req, timeout=timeout, wait_for_ready=True)
+    return bool(resp.ok)
+
+
+# безопасная обёртка — не кидает исключений наружу
+async def publish_event_safe(e: EventDTO) -> bool:
+    try:
+        return await publish_event(e)
+    except grpc.RpcError as exc:
+        logger.warning("EventHub gRPC publish failed: %s", exc)
+        return False
+    except Exception as exc:  # на всякий
+        logger.warning("EventHub publish unexpected error: %s", exc)
+        return False
+
+
+async def publish_events(events: Iterable[EventDTO], concurrency: int | None = None) -> BatchResult:
+    """
+    Каждое событие отдельным PublishEvent, но не больше concurrency
+    (EVENTHUB_AIO_CONCURRENCY) вызовов одновременно. В отличие от пачки
+    PublishEvents, результат известен по каждому событию.
+    """
+    events = list(events)
+    if not events or not getattr(settings, "EVENTHUB_ENABLED", True):
+        return BatchResult(sent=0, accepted=0, failed=0)
+
+    limit = asyncio.Semaphore(concurrency or int(getattr(settings, "EVENTHUB_AIO_CONCURRENCY", 32)))
+
+    async def send(e: EventDTO) -> bool:
+        async with limit:
+            return await publish_event_safe(e)
+
+    results = await asyncio.gather(*(send(e) for e in events))
+    accepted = sum(results)
+    return BatchResult(sent=len(events), accepted=accepted, failed=len(events) - accepted)
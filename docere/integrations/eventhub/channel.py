@@ -0,0 +1,112 @@
+import itertools
+import logging
+import os
+import threading
+
+import grpc
+from django.conf import settings
+
+from eventhub.v1 import events_pb2_grpc
+
+
+logger = logging.getLogger(__name__)
+
+
+def _channel_options() -> list[tuple[str, int]]:
+    # keepalive-пинги только пока идут вызовы: мёртвое соединение
+    # замечается посреди publish, а не по таймауту. Простаивающий канал не
+    # пингуем (permit_without_calls=0) — после обрыва NAT/балансировщиком
+    # gRPC переподключится на следующем вызове. Интервал не меньше
+    # GRPC_ARG_HTTP2_MIN_RECV_PING_INTERVAL_WITHOUT_DATA_MS сервера
+    # (по умолчанию 5 мин), иначе сервер ответит GOAWAY too_many_pings.
+    return [
+        ("grpc.keepalive_time_ms", int(getattr(settings, "EVENTHUB_KEEPALIVE_MS", 300_000))),
+        ("grpc.keepalive_timeout_ms", int(getattr(settings, "EVENTHUB_KEEPALIVE_TIMEOUT_MS", 10_000))),
+        ("grpc.keepalive_permit_without_calls", 0),
+    ]
+
+
+class ChannelPool:
+    """
+    Долгоживущие gRPC-каналы к EventHub на процесс: по адресу —
+    EVENTHUB_CHANNEL_POOL_SIZE каналов, раздаются по кругу. Канал
+    потокобезопасен и мультиплексирует вызовы по HTTP/2, так что соединение
+    и handshake — один раз на процесс, а не на каждое событие.
+
+    Каналы родителя в дочернем процессе не используются (gRPC это не
+    поддерживает): после fork (prefork-воркеры Celery, uWSGI) пул
+    пересоздаётся — по os.register_at_fork и, на случай fork() мимо
+    Python (uWSGI), по смене pid.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self) -> None:
+        # каналы родителя не закрываем: close() в дочернем процессе
+        # трогает общие с родителем сокеты
+        self._pid = os.getpid()
+        self._stubs: dict[str, list[events_pb2_grpc.EventIngestStub]] = {}
+        self._channels: list[grpc.Channel] = []
+        self._turn = itertools.count()
+        self.created = 0
+        self.reused = 0
+
+    def after_fork(self) -> None:
+        self._lock = threading.Lock()
+        self._reset()
+
+    def stub(self, addr: str) -> events_pb2_grpc.EventIngestStub:
+        if self._pid != os.getpid():
+            self.after_fork()
+
+        with self._lock:
+            stubs = self._stubs.get(addr)
+            if stubs is None:
+                stubs = self._stubs[addr] = self._connect(addr)
+            else:
+                self.reused += 1
+            return stubs[next(self._turn) % len(stubs)]
+
+    def _connect(self, addr: str) -> list[events_pb2_grpc.EventIngestStub]:
+        size = max(1, int(getattr(settings, "EVENTHUB_CHANNEL_POOL_SIZE", 1)))
+        stubs = []
+        for _ in range(size):
+            channel = grpc.insecure_channel(addr, options=_channel_options())
+            self._channels.append(channel)
+            stubs.append(events_pb2_grpc.EventIngestStub(channel))
+        self.created += size
+        logger.info("EventHub: %d channel(s) to %s opened (pid=%s)", size, addr, self._pid)
+        return stubs
+
+    def stats(self) -> dict:
+        """Счётчики текущего процесса: открыто каналов, вызовов на готовом канале."""
+        return {
+            "pid": self._pid,
+            "addresses": sorted(self._stubs),
+            "channels": len(self._channels),
+            "created": self.created,
+            "reused": self.reused,
+        }
+
+    def close(self) -> None:
+        with self._lock:
+            channels = self._channels
+            self._reset()
+        for channel in channels:
+            channel.close()
+
+
+pool = ChannelPool()
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=pool.after_fork)
+
+
+def get_stub(addr: str) -> events_pb2_grpc.EventIngestStub:
+    return pool.stub(addr)
+
+
+def channel_stats() -> dict:
+    return pool.stats()
@@ -1,14 +1,14 @@
 import logging
 from dataclasses import dataclass
 from datetime import datetime, timezone
-from typing import Mapping, Any
+from typing import Iterable, Mapping, Any
 
 import grpc
 from django.conf import settings
-from google.protobuf.struct_pb2 import Struct
-from google.protobuf.timestamp_pb2 import Timestamp
 
-from eventhub.v1 import events_pb2, events_pb2_grpc
+from eventhub.v1 import events_pb2
+
+from .channel import get_stub
 
 
 logger = logging.getLogger(__name__)
@@ -25,25 +25,82 @@ class EventDTO:
     props: Mapping[str, Any] | None = None
 
 
-def _to_pb_event(e: EventDTO) -> events_pb2.Event:
-    ts = Timestamp()
-    aware = e.ts if e.ts.tzinfo else e.ts.replace(tzinfo=timezone.utc)
-    ts.FromDatetime(aware.astimezone(timezone.utc))
+# ---------- EventDTO → protobuf ----------------------------------------------
+# Struct.update() и Timestamp.FromDatetime() идут через питоний код protobuf
+# на каждое значение; здесь значения props пишутся прямо в поля Value
+# сеттером по типу, а Timestamp — из целых секунд/наносекунд от эпохи.
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+def _set_string(value, v):
+    value.string_value = v
+
+
+def _set_number(value, v):
+    value.number_value = v
+
+
+def _set_bool(value, v):
+    value.bool_value = v
+
+
+def _set_null(value, v):
+    value.null_value = 0
+
+
+# тип значения → сеттер; None — вложенные dict/list и прочее, через Struct
+_CONVERTERS: dict[type, Any] = {
+    str: _set_string,
+    bool: _set_bool,
+    int: _set_number,
+    float: _set_number,
+    type(None): _set_null,
+}
+
+
+def _resolve_converter(cls: type):
+    # подклассы (SafeString, IntEnum, ...) разбираем один раз и запоминаем
+    for base in (bool, str, int, float):  # bool — раньше int
+        if issubclass(cls, base):
+            converter = _CONVERTERS[base]
+            break
+    else:
+        converter = None
+    _CONVERTERS[cls] = converter
+    return converter
 
-    s = Struct()
-    if e.props:
-        s.update(dict(e.props))
 
-    return events_pb2.Event(
+def _to_pb_event(e: EventDTO) -> events_pb2.Event:
+    event = events_pb2.Event(
         id=e.id,
         tenant_id=e.tenant_id,
         type=e.type,
         actor_id=e.actor_id or "",
         patient_id=e.patient_id or "",
-        ts=ts,
-        props=s,
     )
 
+    # обращение к подсообщению (event.ts, event.props) в upb не бесплатное —
+    # берём каждое один раз
+    delta = (e.ts if e.ts.tzinfo else e.ts.replace(tzinfo=timezone.utc)) - _EPOCH
+    ts = event.ts
+    ts.seconds = delta.days * 86400 + delta.seconds
+    ts.nanos = delta.microseconds * 1000
+
+    props = event.props
+    props.SetInParent()  # пустой Struct тоже передаётся, как раньше
+    if e.props:
+        fields = props.fields
+        for key, v in e.props.items():
+            try:
+                converter = _CONVERTERS[type(v)]
+            except KeyError:
+                converter = _resolve_converter(type(v))
+            if converter is None:
+                props[key] = v
+            else:
+                converter(fields[key], v)
+    return event
+
 
 def publish_event(e: EventDTO) -> bool:
     """Синхронный вызов. Для нагруженных путей лучше через Celery задачу."""
@@ -53,12 +110,37 @@ def publish_event(e: EventDTO) -> bool:
     addr = getattr(settings, "EVENTHUB_GRPC_ADDR", "127.0.0.1:50051")
     timeout = float(getattr(settings, "EVENTHUB_TIMEOUT_SEC", 3.0))
 
-    logger.info("EventHub: sending to %s", addr)
-    with grpc.insecure_channel(addr) as channel:
-        stub = events_pb2_grpc.EventIngestStub(channel)
-        req = events_pb2.PublishEventRequest(event=_to_pb_event(e))
-        resp = stub.PublishEvent(req, timeout=timeout)
-        return bool(resp.ok)
+    logger.debug("EventHub: sending to %s", addr)
+    # канал из пула процесса (см. .channel); wait_for_ready — переподключение
+    # после обрыва ждём в пределах timeout, а не падаем сразу UNAVAILABLE
+    stub = get_stub(addr)
+    req = events_pb2.PublishEventRequest(event=_to_pb_event(e))
+    resp = stub.PublishEvent(req, timeout=timeout, wait_for_ready=True)
+    return bool(resp.ok)
+
+
+@dataclass(slots=True)
+class BatchResult:
+    sent: int
+    accepted: int
+    failed: int
+
+
+def publish_events(events: Iterable[EventDTO]) -> BatchResult:
+    """Пачка событий одним client-streaming вызовом PublishEvents."""
+    events = list(events)
+    if not events or not getattr(settings, "EVENTHUB_ENABLED", True):
+        return BatchResult(sent=0, accepted=0, failed=0)
+
+    addr = getattr(settings, "EVENTHUB_GRPC_ADDR", "127.0.0.1:50051")
+    timeout = float(getattr(settings, "EVENTHUB_TIMEOUT_SEC", 3.0))
+
+    logger.debug("EventHub: sending %d events to %s", len(events), addr)
+    stub = get_stub(addr)
+    resp = stub.PublishEvents(
+        (_to_pb_event(e) for e in events), timeout=timeout, wait_for_ready=True,
+    )
+    return BatchResult(sent=len(events), accepted=resp.accepted, failed=resp.failed)
 
 
 # безопасная обёртка — не кидает исключений наружу
@@ -0,0 +1,107 @@
+import hashlib
+import json
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from rest_framework import status
+from rest_framework.response import Response
+
+
+# ---------- группы кэша -----------------------------------------------------
+# Ключи ответов содержат версию группы: сброс группы — это новая версия,
+# старые ключи просто перестают читаться и истекают по таймауту.
+def _version_key(group: str) -> str:
+    return f'cache-version:{group}'
+
+
+def group_version(group: str) -> str:
+    version = cache.get(_version_key(group))
+    if version is None:
+        version = str(time.time_ns())
+        if not cache.add(_version_key(group), version, None):
+            version = cache.get(_version_key(group))
+    return version
+
+
+def invalidate_group(group: str) -> None:
+    """Сбросить все закэшированные ответы группы (после коммита текущей транзакции)."""
+    transaction.on_commit(
+        lambda: cache.set(_version_key(group), str(time.time_ns()), None)
+    )
+
+
+# ---------- кэш ответов вьюх ------------------------------------------------
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    tags = {tag.strip() for tag in if_none_match.split(',')}
+    return '*' in tags or etag in tags or f'W/{etag}' in tags
+
+
+class CachedResponseMixin:
+    """
+    Кэширует GET-ответ вьюхи в Redis и отдаёт ETag; на совпавший
+    If-None-Match отвечает 304 без тела.
+
+      cache_group        — имя группы; сбрасывается invalidate_group() из сигналов
+      cache_vary_on_role — разные ключи для разных ролей пользователя
+      cache_timeout      — сек., по умолчанию RESPONSE_CACHE_TIMEOUT
+
+    Ключ — группа, её версия, роль и полный URL (с cursor / page_size).
+    """
+    cache_group = None
+    cache_vary_on_role = True
+    cache_timeout = None
+
+    def response_cache_key(self, request) -> str:
+        role = getattr(request.user, 'role', '') if self.cache_vary_on_role else '*'
+        url = hashlib.md5(request.build_absolute_uri().encode()).hexdigest()
+        return f'response:{self.cache_group}:{group_version(self.cache_group)}:{role}:{url}'
+
+    def get(self, request, *args, **kwargs):
+        key = self.response_cache_key(request)
+        cached = cache.get(key)
+        if cached is None:
+            response = super().get(request, *args, **kwargs)
+            if response.status_code != status.HTTP_200_OK:
+                return response
+            body = json.dumps(response.data, cls=DjangoJSONEncoder, sort_keys=True)
+            cached = ('"%s"' % hashlib.md5(body.encode()).hexdigest(), response.data)
+            timeout = self.cache_timeout or settings.RESPONSE_CACHE_TIMEOUT
+            cache.set(key, cached, timeout)
+
+        etag, data = cached
+        headers = {'ETag': etag, 'Cache-Control': 'private, no-cache'}
+        if _etag_matches(request.headers.get('If-None-Match', ''), etag):
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers=headers)
+        return Response(data, headers=headers)
+
+
+# ---------- условный GET карточек -------------------------------------------
+class ConditionalRetrieveMixin:
+    """
+    Сильный ETag для detail-эндпоинта из отметок времени объекта
+    (etag_parts() вьюхи). Если клиент прислал тот же If-None-Match —
+    304 сразу после get_object(), без сериализации.
+
+    Вьюха обязана определить etag_parts(instance) -> tuple: всё, от чего
+    зависит ответ. Без него as_view() падает ещё при загрузке urls.
+    """
+
+    @classmethod
+    def as_view(cls, **initkwargs):
+        if not callable(getattr(cls, 'etag_parts', None)):
+            raise ImproperlyConfigured(f'{cls.__name__} must define etag_parts(instance)')
+        return super().as_view(**initkwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        instance = self.get_object()
+        etag = '"%s"' % hashlib.md5(repr(self.etag_parts(instance)).encode()).hexdigest()
+        headers = {'ETag': etag, 'Cache-Control': 'private, no-cache'}
+        if _etag_matches(request.headers.get('If-None-Match', ''), etag):
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+        serializer = self.get_serializer(instance)
+        return Response(serializer.data, headers=headers)
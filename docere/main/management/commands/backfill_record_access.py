@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from main.models import MedicalRecord, RecordAccess
+
+
+def record_id_batches(batch_size: int):
+    """id всех MedicalRecord пачками по batch_size (keyset по id, без OFFSET)."""
+    last_id = 0
+    while True:
+        ids = list(
+            MedicalRecord.objects.filter(id__gt=last_id).order_by('id')
+            .values_list('id', flat=True)[:batch_size]
+        )
+        if not ids:
+            return
+        yield ids
+        last_id = ids[-1]
+
+
+class Command(BaseCommand):
+    help = 'Заполняет/пересчитывает RecordAccess (кто видит какую MedicalRecord) по владельцам и принятым шарингам'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='сколько записей пересчитывать за транзакцию')
+
+    def handle(self, *args, batch_size, **options):
+        added = removed = records = 0
+        for ids in record_id_batches(batch_size):
+            with transaction.atomic():
+                a, r = RecordAccess.objects.sync(ids)
+            added += a
+            removed += r
+            records += len(ids)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Записей: {records}; строк доступа добавлено: {added}, удалено: {removed}'
+        ))
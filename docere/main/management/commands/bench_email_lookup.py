@@ -0,0 +1,74 @@
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from main.models import User
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        'Бенчмарк поиска получателя шаринга User.objects.filter(email__iexact=...): '
+        'наполняет таблицу синтетическими пользователями и меряет время запроса. '
+        'Всё выполняется в транзакции и откатывается в конце'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1_000_000, help='сколько синтетических пользователей вставить')
+        parser.add_argument('--lookups', type=int, default=2000, help='сколько поисков замерить')
+        parser.add_argument('--batch-size', type=int, default=10_000)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, users, lookups, batch_size, seed, **options):
+        if connection.vendor != 'postgresql':
+            # на SQLite iexact — это LIKE, индекс по UPPER(email) ему не нужен
+            self.stderr.write(self.style.WARNING(
+                f'База {connection.vendor}: замер имеет смысл только на PostgreSQL'
+            ))
+        rnd = random.Random(seed)
+        try:
+            with transaction.atomic():
+                self.fill(users, batch_size)
+                self.measure(users, lookups, rnd)
+                raise _Rollback
+        except _Rollback:
+            self.stdout.write('Синтетические пользователи удалены (rollback)')
+
+    def fill(self, users, batch_size):
+        start = time.perf_counter()
+        for offset in range(0, users, batch_size):
+            User.objects.bulk_create(
+                User(username=f'bench-{i}', email=f'Bench.User{i}@Example.com', password='!')
+                for i in range(offset, min(offset + batch_size, users))
+            )
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute(f'ANALYZE {User._meta.db_table}')
+        self.stdout.write(f'{users} пользователей вставлено за {time.perf_counter() - start:.1f} s')
+
+    def measure(self, users, lookups, rnd):
+        # адрес как его вводят в форме шаринга: другой регистр, чем в базе
+        emails = [f'bench.user{rnd.randrange(users)}@EXAMPLE.COM' for _ in range(lookups)]
+        self.stdout.write(User.objects.filter(email__iexact=emails[0]).explain())
+
+        timings = []
+        for email in emails:
+            start = time.perf_counter()
+            found = User.objects.filter(email__iexact=email).first()
+            timings.append(time.perf_counter() - start)
+            if found is None:
+                self.stderr.write(f'Не найден {email}')
+                return
+
+        timings.sort()
+        median = statistics.median(timings) * 1000
+        p99 = timings[int(len(timings) * 0.99) - 1] * 1000
+        self.stdout.write(f'{lookups} поисков email__iexact: медиана {median:.3f} ms, p99 {p99:.3f} ms')
+        style = self.style.SUCCESS if p99 < 1 else self.style.WARNING
+        self.stdout.write(style(f'  p99 {"<" if p99 < 1 else "≥"} 1 ms'))
@@ -0,0 +1,93 @@
+import random
+import time
+from datetime import datetime, timedelta, timezone
+
+from django.core.management.base import BaseCommand
+from google.protobuf.internal import api_implementation
+from google.protobuf.struct_pb2 import Struct
+from google.protobuf.timestamp_pb2 import Timestamp
+
+from eventhub.v1 import events_pb2
+from integrations.eventhub.client import EventDTO, _to_pb_event
+
+
+# Преобразование в том виде, в каком оно было до быстрого _to_pb_event:
+# Timestamp.FromDatetime и Struct.update на каждое событие.
+def _legacy_to_pb_event(e: EventDTO) -> events_pb2.Event:
+    ts = Timestamp()
+    aware = e.ts if e.ts.tzinfo else e.ts.replace(tzinfo=timezone.utc)
+    ts.FromDatetime(aware.astimezone(timezone.utc))
+
+    s = Struct()
+    if e.props:
+        s.update(dict(e.props))
+
+    return events_pb2.Event(
+        id=e.id,
+        tenant_id=e.tenant_id,
+        type=e.type,
+        actor_id=e.actor_id or "",
+        patient_id=e.patient_id or "",
+        ts=ts,
+        props=s,
+    )
+
+
+def synthetic_events(count: int, seed: int = 0) -> list[EventDTO]:
+    """События вида user.registered (как из main.signals) с разбросом типов props."""
+    rnd = random.Random(seed)
+    start = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    msk = timezone(timedelta(hours=3))
+    events = []
+    for i in range(count):
+        ts = start + timedelta(seconds=rnd.randrange(10**8), microseconds=rnd.randrange(10**6))
+        if rnd.random() < 0.3:
+            ts = ts.astimezone(msk)
+        props = {
+            'email': f'user{i}@example.com',
+            'phone': f'+7 9{rnd.randint(10, 99)} {rnd.randint(100, 999)}-{rnd.randint(10, 99)}-{rnd.randint(10, 99)}'
+                     if rnd.random() < 0.5 else None,
+            'role': rnd.choice(['doctor', 'patient']),
+            'username': f'user{i}',
+            'full_name': 'Иванов Иван Иванович',
+        }
+        if rnd.random() < 0.2:
+            props['records'] = rnd.randint(0, 500)
+            props['confirmed'] = rnd.random() < 0.5
+        if rnd.random() < 0.05:
+            props['tags'] = ['import', {'source': 'zip'}]
+        events.append(EventDTO(
+            id=str(i), tenant_id=str(i % 50), type='user.registered',
+            actor_id=str(i), patient_id=str(i) if rnd.random() < 0.5 else None,
+            ts=ts, props=props,
+        ))
+    return events
+
+
+class Command(BaseCommand):
+    help = 'Микробенчмарк EventDTO → protobuf: _to_pb_event против прежнего Struct.update/FromDatetime'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--count', type=int, default=100_000, help='сколько синтетических событий')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, count, seed, **options):
+        events = synthetic_events(count, seed)
+
+        start = time.perf_counter()
+        legacy_out = [_legacy_to_pb_event(e) for e in events]
+        legacy = time.perf_counter() - start
+
+        start = time.perf_counter()
+        fast_out = [_to_pb_event(e) for e in events]
+        fast = time.perf_counter() - start
+
+        for e, a, b in zip(events, legacy_out, fast_out):
+            if a.SerializeToString(deterministic=True) != b.SerializeToString(deterministic=True):
+                self.stderr.write(f'Результаты расходятся на событии {e.id}:\n{a}\n!=\n{b}')
+                return
+
+        self.stdout.write(f'{count} событий, protobuf: {api_implementation.Type()}')
+        self.stdout.write(f'  Struct.update + FromDatetime: {legacy:8.3f} s  ({legacy / count * 1e6:7.2f} µs/событие)')
+        self.stdout.write(f'  _to_pb_event:                {fast:8.3f} s  ({fast / count * 1e6:7.2f} µs/событие)')
+        self.stdout.write(self.style.SUCCESS(f'  ускорение: ×{legacy / fast:.2f}'))
@@ -0,0 +1,100 @@
+import random
+import re
+import time
+
+import dateparser
+from django.core.management.base import BaseCommand
+
+from main.utils import extract_entities, match_entities
+
+
+LAST_NAMES  = ['Иванов', 'Петрова', 'Смирнов', 'Кузнецова', 'Попов', 'Соколова', 'Лебедев', 'Римский-Корсаков']
+FIRST_NAMES = ['Иван', 'Мария', 'Алексей', 'Ольга', 'Дмитрий', 'Анна', 'Сергей', 'Елена']
+PATRONYMICS = ['Иванович', 'Петровна', 'Сергеевич', 'Алексеевна', 'Дмитриевич', 'Ильинична']
+MONTHS      = ['января', 'февраля', 'марта', 'апреля', 'мая', 'июня',
+               'июля', 'августа', 'сентября', 'октября', 'ноября', 'декабря']
+WORDS       = ['КТ', 'МРТ', 'снимок', 'грудной', 'клетки', 'серия', 'заключение', 'IMG', 'DICOM', 'scan']
+
+
+# Разбор имён в том виде, в каком он был до движка extract_entities:
+# четыре отдельные функции, шаблон — строка, повторно разбираемая на каждый вызов.
+_LEGACY_FIO = (
+    r'(?:^|[ \-_])'
+    r'([А-ЯЁ][а-яё]+(?:-[А-ЯЁ][а-яё]+)?'
+    r'[ \-_][А-ЯЁ][а-яё]+'
+    r'[ \-_][А-ЯЁ][а-яё]+(?:ович|евич|овна|евна|ична|инична))'
+)
+_LEGACY_DOB = r'\b(?:\d{1,2}\s[А-Яа-яЁё]+\s\d{4}|\d{1,2}[./]\d{1,2}[./]\d{4})\b'
+_LEGACY_PHONE = r'\+?\d{1,3}?[-.\s]?\(?\d{1,4}?\)?[-.\s]?\d{1,4}[-.\s]?\d{1,9}'
+_LEGACY_EMAIL = r'[A-Za-z0-9_.+-]+@[A-Za-z0-9-]+\.[A-Za-z0-9-.]+'
+
+
+def _legacy_extract(text: str, with_dates: bool) -> dict[str, list[str]]:
+    dobs = re.findall(_LEGACY_DOB, text)
+    if with_dates:
+        dobs = [dt.strftime('%d.%m.%Y') for dt in (dateparser.parse(s, languages=['ru']) for s in dobs) if dt]
+    return {
+        'fios':   re.findall(_LEGACY_FIO, text),
+        'dobs':   dobs,
+        'phones': re.findall(_LEGACY_PHONE, text),
+        'emails': re.findall(_LEGACY_EMAIL, text),
+    }
+
+
+def synthetic_filenames(count: int, seed: int = 0) -> list[str]:
+    """Имена файлов «как в архивах клиник»: ФИО, даты, телефоны, служебные слова."""
+    rnd = random.Random(seed)
+    names = []
+    for _ in range(count):
+        parts = rnd.sample(WORDS, rnd.randint(1, 3))
+        if rnd.random() < 0.7:
+            parts.append(f'{rnd.choice(LAST_NAMES)} {rnd.choice(FIRST_NAMES)} {rnd.choice(PATRONYMICS)}')
+        roll = rnd.random()
+        if roll < 0.4:
+            parts.append(f'{rnd.randint(1, 28)}.{rnd.randint(1, 12):02d}.{rnd.randint(1940, 2024)}')
+        elif roll < 0.6:
+            parts.append(f'{rnd.randint(1, 28)} {rnd.choice(MONTHS)} {rnd.randint(1940, 2024)}')
+        if rnd.random() < 0.2:
+            parts.append(f'+7 9{rnd.randint(10, 99)} {rnd.randint(100, 999)}-{rnd.randint(10, 99)}-{rnd.randint(10, 99)}')
+        if rnd.random() < 0.05:
+            parts.append(f'patient{rnd.randint(1, 999)}@mail.ru')
+        if rnd.random() < 0.5:
+            parts.append(f'{rnd.randint(1, 9999):04d}')
+        rnd.shuffle(parts)
+        names.append(rnd.choice(['_', ' ', '-']).join(parts))
+    return names
+
+
+class Command(BaseCommand):
+    help = 'Микробенчмарк разбора имён файлов: extract_entities против прежних extract_* по отдельности'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--count', type=int, default=100_000, help='сколько синтетических имён файлов')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument(
+            '--with-dates', action='store_true',
+            help='включить разбор найденных дат (без флага сравнивается только поиск по шаблонам)',
+        )
+
+    def handle(self, *args, count, seed, with_dates, **options):
+        names = synthetic_filenames(count, seed)
+        engine = extract_entities if with_dates else match_entities
+
+        start = time.perf_counter()
+        legacy_out = [_legacy_extract(name, with_dates) for name in names]
+        legacy = time.perf_counter() - start
+
+        start = time.perf_counter()
+        engine_out = [engine(name) for name in names]
+        fast = time.perf_counter() - start
+
+        if legacy_out != engine_out:
+            mismatch = next(i for i, (a, b) in enumerate(zip(legacy_out, engine_out)) if a != b)
+            self.stderr.write(f'Результаты расходятся на {names[mismatch]!r}: {legacy_out[mismatch]} != {engine_out[mismatch]}')
+            return
+
+        self.stdout.write(f'{count} имён файлов, даты {"разбираются" if with_dates else "не разбираются"}')
+        self.stdout.write(f'  extract_* по отдельности: {legacy:8.3f} s  ({legacy / count * 1e6:7.2f} µs/имя)')
+        self.stdout.write(f'  extract_entities:         {fast:8.3f} s  ({fast / count * 1e6:7.2f} µs/имя)')
+        self.stdout.write(self.style.SUCCESS(f'  ускорение: ×{legacy / fast:.2f}'))
+
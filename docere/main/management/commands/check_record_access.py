@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from main.models import RecordAccess
+from .backfill_record_access import record_id_batches
+
+
+class Command(BaseCommand):
+    help = 'Сверяет RecordAccess с владельцами записей и принятыми шарингами; падает, если есть расхождения'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--show', type=int, default=20, help='сколько расхождений вывести')
+        parser.add_argument('--fix', action='store_true', help='сразу исправить найденное')
+
+    def handle(self, *args, batch_size, show, fix, **options):
+        missing = stale = 0
+        for ids in record_id_batches(batch_size):
+            rows_missing, pks_stale = RecordAccess.objects.diff(ids)
+            if not rows_missing and not pks_stale:
+                continue
+
+            rows_stale = RecordAccess.objects.filter(pk__in=pks_stale).values_list('user_id', 'record_id', 'patient_id')
+            for kind, rows, shown in (('нет доступа', sorted(rows_missing), missing),
+                                      ('лишний доступ', rows_stale, stale)):
+                for user_id, record_id, patient_id in list(rows)[:max(show - shown, 0)]:
+                    self.stdout.write(f'  {kind}: user={user_id} record={record_id} patient={patient_id}')
+
+            missing += len(rows_missing)
+            stale += len(pks_stale)
+            if fix:
+                RecordAccess.objects.sync(ids)
+
+        if not missing and not stale:
+            self.stdout.write(self.style.SUCCESS('RecordAccess согласован'))
+        elif fix:
+            self.stdout.write(self.style.WARNING(f'Исправлено: добавлено {missing}, удалено {stale}'))
+        else:
+            raise CommandError(f'RecordAccess расходится: недостаёт {missing}, лишних {stale}')
@@ -0,0 +1,89 @@
+import re
+import subprocess
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+
+# Что делает процесс до первого запроса / первой задачи, и какие тяжёлые
+# библиотеки при этом грузиться не должны (они импортируются лениво)
+TARGETS = {
+    # uWSGI-воркер: wsgi-приложение + корневой urlconf (views грузятся на первом запросе)
+    'wsgi': (
+        'import docere.wsgi\n'
+        'from django.urls import get_resolver\n'
+        'get_resolver().url_patterns\n',
+        ('dateparser', 'PIL'),
+    ),
+    # Celery-воркер: приложение + autodiscover задач. PIL сюда тянут
+    # system checks самого Django (ImageField), которые запускает Celery
+    'celery': (
+        'import django, docere.celery\n'
+        'django.setup()\n'
+        'docere.celery.app.loader.import_default_modules()\n',
+        ('dateparser',),
+    ),
+}
+
+_LINE_RE = re.compile(r'^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|\s*(\S+)$')
+
+
+def profile_imports(code: str) -> list[tuple[str, int, int]]:
+    """
+    Запускает code в отдельном интерпретаторе с `-X importtime`.
+    Возвращает (модуль, self µs, cumulative µs) по каждому импортированному модулю.
+    """
+    proc = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', code],
+        cwd=settings.BASE_DIR, capture_output=True, text=True,
+    )
+    if proc.returncode:
+        raise CommandError(proc.stderr.strip().splitlines()[-1] if proc.stderr else 'import failed')
+
+    modules = []
+    for line in proc.stderr.splitlines():
+        m = _LINE_RE.match(line)
+        if m:
+            modules.append((m[3], int(m[1]), int(m[2])))
+    return modules
+
+
+class Command(BaseCommand):
+    help = 'Профиль времени импорта при старте uWSGI (docere.wsgi) и Celery (docere.celery) воркеров'
+
+    def add_arguments(self, parser):
+        parser.add_argument('targets', nargs='*', help=f'что профилировать: {", ".join(TARGETS)} (по умолчанию всё)')
+        parser.add_argument('--top', type=int, default=15, help='сколько самых тяжёлых модулей показать')
+        parser.add_argument(
+            '--max-ms', type=float, default=None,
+            help='бюджет на старт в мс: если превышен — команда падает (для CI)',
+        )
+
+    def handle(self, *args, targets, top, max_ms, **options):
+        unknown = set(targets) - set(TARGETS)
+        if unknown:
+            raise CommandError(f'Неизвестные цели: {", ".join(sorted(unknown))}')
+
+        failures = []
+        for target in targets or TARGETS:
+            code, lazy_modules = TARGETS[target]
+            modules = profile_imports(code)
+            total_ms = sum(self_us for _, self_us, _ in modules) / 1000
+            heavy = sorted(modules, key=lambda m: m[2], reverse=True)
+
+            self.stdout.write(self.style.MIGRATE_HEADING(f'{target}: {total_ms:.0f} ms, {len(modules)} модулей'))
+            for name, _, cumulative in heavy[:top]:
+                self.stdout.write(f'  {cumulative / 1000:8.1f} ms  {name}')
+
+            loaded = sorted({
+                name for name, _, _ in modules
+                if name.split('.')[0] in lazy_modules
+            })
+            if loaded:
+                failures.append(f'{target}: при старте загружаются {", ".join(loaded[:5])}')
+            if max_ms is not None and total_ms > max_ms:
+                failures.append(f'{target}: {total_ms:.0f} ms > бюджета {max_ms:.0f} ms')
+
+        if failures:
+            raise CommandError('; '.join(failures))
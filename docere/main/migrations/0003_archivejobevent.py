@@ -0,0 +1,40 @@
+# Generated by Django 4.2.1 on 2026-10-17 20:45
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0002_remove_recordshare_main_record_doctor__d3191d_idx_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='archivejob',
+            name='bytes_total',
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='archivejob',
+            name='members_total',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.CreateModel(
+            name='ArchiveJobEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('phase', models.CharField(blank=True, max_length=20)),
+                ('message', models.TextField(blank=True)),
+                ('members_done', models.PositiveIntegerField(default=0)),
+                ('bytes_done', models.PositiveBigIntegerField(default=0)),
+                ('job', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='events', to='main.archivejob')),
+            ],
+            options={
+                'ordering': ['id'],
+                'indexes': [models.Index(fields=['job', 'id'], name='main_archiv_job_id_4f99b3_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 4.2.1 on 2026-10-17 20:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0003_archivejobevent'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='doctor',
+            index=models.Index(fields=['last_name', 'first_name', 'id'], name='main_doctor_last_na_90ff88_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='medicalrecord',
+            index=models.Index(fields=['patient', '-visit_date', '-created_at', '-id'], name='main_medica_patient_55a2cc_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='patient',
+            index=models.Index(fields=['last_name', 'first_name', 'id'], name='main_patien_last_na_9eefec_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='sharerequest',
+            index=models.Index(fields=['from_user', '-created_at', '-id'], name='main_sharer_from_us_e1eb94_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='sharerequest',
+            index=models.Index(fields=['to_user', '-created_at', '-id'], name='main_sharer_to_user_df3cb9_idx'),
+        ),
+    ]
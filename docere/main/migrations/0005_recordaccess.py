@@ -0,0 +1,56 @@
+# Generated by Django 4.2.1 on 2026-10-17 20:56
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def backfill(apps, schema_editor):
+    """Строки доступа для уже существующих записей (то же, что manage.py backfill_record_access)."""
+    MedicalRecord = apps.get_model('main', 'MedicalRecord')
+    RecordShare = apps.get_model('main', 'RecordShare')
+    RecordAccess = apps.get_model('main', 'RecordAccess')
+
+    rows = {}
+    records = MedicalRecord.objects.values_list('id', 'patient_id', 'owner_primary_id', 'owner_second_id')
+    patient_of = {}
+    for record_id, patient_id, primary_id, second_id in records.iterator():
+        patient_of[record_id] = patient_id
+        for user_id in (primary_id, second_id):
+            if user_id:
+                rows[user_id, record_id] = patient_id
+    shares = RecordShare.objects.filter(status='accepted').values_list('record_id', 'to_user_id')
+    for record_id, user_id in shares.iterator():
+        rows[user_id, record_id] = patient_of[record_id]
+
+    RecordAccess.objects.bulk_create(
+        [RecordAccess(user_id=u, record_id=r, patient_id=p) for (u, r), p in rows.items()],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0004_list_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecordAccess',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('patient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='main.patient')),
+                ('record', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='access', to='main.medicalrecord')),
+                ('user', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='record_access', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', 'patient', 'record'], name='main_record_user_id_d5a6c3_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='recordaccess',
+            constraint=models.UniqueConstraint(fields=('user', 'record'), name='record_access_user_record'),
+        ),
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 4.2.1 on 2026-10-17 21:10
+
+import django.core.serializers.json
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0007_email_upper_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EventOutbox',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('event_id', models.CharField(max_length=64)),
+                ('tenant_id', models.CharField(max_length=64)),
+                ('type', models.CharField(max_length=100)),
+                ('actor_id', models.CharField(blank=True, max_length=64)),
+                ('patient_id', models.CharField(blank=True, max_length=64)),
+                ('ts', models.DateTimeField()),
+                ('props', models.JSONField(default=dict, encoder=django.core.serializers.json.DjangoJSONEncoder)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('next_attempt_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('last_error', models.TextField(blank=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['next_attempt_at', 'id'], name='main_evento_next_at_d60426_idx')],
+            },
+        ),
+    ]
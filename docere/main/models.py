@@ -1,7 +1,10 @@
 # main/models.py
 from django.conf        import settings
 from django.contrib.auth.models import AbstractUser
-from django.db          import models
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db          import models, transaction
+from django.db.models.functions import Upper
+from django.db.models.signals import m2m_changed
 from django.utils       import timezone
 
 
@@ -23,6 +26,13 @@ class User(AbstractUser):
     time_create  = models.DateTimeField(auto_now_add=True)
     time_update  = models.DateTimeField(auto_now=True)
 
+    class Meta(AbstractUser.Meta):
+        indexes = [
+            # email__iexact компилируется в UPPER(email) = UPPER(%s) и мимо
+            # уникального индекса по email — нужен индекс по выражению
+            models.Index(Upper('email'), name='user_email_upper_idx'),
+        ]
+
     # ― helpers ― -----------------------------------------------------------
     def get_full_name(self) -> str:
         parts = [self.last_name or '', self.first_name or '', self.middle_name or '']
@@ -50,6 +60,18 @@ class PersonBase(models.Model):
 
 
 # ---------- Пациент / Доктор / Админ ---------------------------------------
+class PatientQuerySet(models.QuerySet):
+    def with_record_stats(self):
+        """
+        record_count и last_visit одним запросом (LEFT JOIN + GROUP BY)
+        вместо двух запросов на каждого пациента в PatientSerializer.
+        """
+        return self.annotate(
+            record_count=models.Count('medical_records'),
+            last_visit=models.Max('medical_records__visit_date'),
+        )
+
+
 class Patient(PersonBase):
     user = models.OneToOneField(
         settings.AUTH_USER_MODEL,
@@ -62,6 +84,17 @@ class Patient(PersonBase):
     email       = models.EmailField(blank=True, null=True)
 
     created_at  = models.DateTimeField(auto_now_add=True)
+    updated_at  = models.DateTimeField(auto_now=True)
+
+    objects = PatientQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # keyset-пагинация списков пациентов (по алфавиту)
+            models.Index(fields=('last_name', 'first_name', 'id')),
+            # поиск пациента по email без учёта регистра (email__iexact)
+            models.Index(Upper('email'), name='patient_email_upper_idx'),
+        ]
 
     def __str__(self):
         return f'Пациент {self.get_full_name()}'
@@ -73,10 +106,17 @@ class Doctor(PersonBase):
                                          on_delete=models.CASCADE)
     specialization = models.CharField(max_length=200, blank=True, null=True)
     institution    = models.CharField(max_length=200, blank=True, null=True)
+    # входит в ETag карточки записи (доктор отдаётся в ней целиком)
+    updated_at     = models.DateTimeField(auto_now=True)
 
     # «свои» пациенты ― заполняем при первом создании записи или вручную
     patients       = models.ManyToManyField(Patient, related_name='doctors', blank=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=('last_name', 'first_name', 'id')),
+        ]
+
     def __str__(self):
         return f'Доктор {self.get_full_name()}'
 
@@ -88,6 +128,34 @@ class Admin(models.Model):
 
 
 # ---------- Мед-запись + файлы ---------------------------------------------
+class MedicalRecordQuerySet(models.QuerySet):
+    """
+    bulk_create() и update() идут мимо post_save, а значит и мимо сигналов
+    RecordAccess (main.signals) — строки доступа пересчитываем здесь же.
+    """
+    # поля, от которых зависит, кто видит запись
+    ACCESS_FIELDS = frozenset({
+        'owner_primary', 'owner_primary_id', 'owner_second', 'owner_second_id', 'patient', 'patient_id',
+    })
+
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = super().bulk_create(objs, *args, **kwargs)
+        record_ids = [obj.pk for obj in objs if obj.pk is not None]
+        if record_ids:
+            RecordAccess.objects.sync(record_ids)
+        return objs
+
+    def update(self, **kwargs):
+        if not self.ACCESS_FIELDS & kwargs.keys():
+            return super().update(**kwargs)
+        with transaction.atomic():
+            # id — до UPDATE: фильтр может быть по тому, что меняем
+            record_ids = list(self.values_list('pk', flat=True))
+            updated = super().update(**kwargs)
+            RecordAccess.objects.sync(record_ids)
+        return updated
+
+
 class MedicalRecord(models.Model):
     VIS_CHOICES = [
         ('draft', 'Draft'),  # только создатель, ещё не расшарено
@@ -112,12 +180,20 @@ class MedicalRecord(models.Model):
                                       null=True, blank=True)
 
     created_at   = models.DateTimeField(auto_now_add=True)
+    # меняется при save() и при добавлении/удалении LabFile (main.signals) — основа ETag
+    updated_at   = models.DateTimeField(auto_now=True)
     visit_date   = models.DateField(blank=True, null=True)
     appointment_location = models.TextField(blank=True)
     notes        = models.TextField(blank=True)
 
+    objects = MedicalRecordQuerySet.as_manager()
+
     class Meta:
         ordering = ['-visit_date', '-created_at']
+        indexes = [
+            # записи пациента в порядке ordering — keyset-пагинация без сортировки
+            models.Index(fields=('patient', '-visit_date', '-created_at', '-id')),
+        ]
 
     # удобное свойство: запись подтверждена?
     @property
@@ -173,11 +249,152 @@ class ArchiveJob(models.Model):
         related_name='archive_job'
     )
 
+    # объём архива по central directory — знаменатель прогресса
+    members_total = models.PositiveIntegerField(default=0)
+    bytes_total   = models.PositiveBigIntegerField(default=0)
+
     class Meta:
         ordering = ['-uploaded_at']
 
+    def get_progress(self) -> dict:
+        """Компактный прогресс: текущая фаза и сколько файлов/байт обработано."""
+        done = self.events.aggregate(
+            members=models.Sum('members_done'),
+            bytes=models.Sum('bytes_done'),
+        )
+        phase = None
+        if self.status not in ('done', 'failed'):
+            phase = (
+                self.events.exclude(phase='')
+                .order_by('-id')
+                .values_list('phase', flat=True)
+                .first()
+            )
+        return {
+            'phase':         phase or self.status,
+            'members_done':  done['members'] or 0,
+            'members_total': self.members_total,
+            'bytes_done':    done['bytes'] or 0,
+            'bytes_total':   self.bytes_total,
+        }
+
+
+class ArchiveJobEvent(models.Model):
+    """
+    Журнал обработки ArchiveJob — только INSERT, вместо перезаписи job.log.
+    Строка лога — message; прогресс — phase и приращения members_done /
+    bytes_done (их суммируем: куски архива пишут прогресс независимо).
+    """
+    job          = models.ForeignKey(ArchiveJob, on_delete=models.CASCADE,
+                                     related_name='events', db_index=False)
+    created_at   = models.DateTimeField(auto_now_add=True)
+    phase        = models.CharField(max_length=20, blank=True)
+    message      = models.TextField(blank=True)
+    members_done = models.PositiveIntegerField(default=0)
+    bytes_done   = models.PositiveBigIntegerField(default=0)
+
+    class Meta:
+        ordering = ['id']
+        indexes = [
+            models.Index(fields=('job', 'id')),
+        ]
+
 
 # ---------- Share / Access control -----------------------------------------
+class RecordShareQuerySet(models.QuerySet):
+    """
+    Ответ на пачку RecordShare за фиксированное число запросов — сколько бы
+    записей ни было в ShareRequest. post_save при bulk UPDATE не срабатывают,
+    поэтому RecordAccess и кэш Doctor.patients обновляются здесь же.
+    """
+
+    def accept(self) -> int:
+        """
+        Правила те же, что были у RecordShare.accept() по одному:
+          доктор ↔ пациент — получатель становится owner_second (если его ещё
+                             нет), visibility='confirmed', пара попадает
+                             в Doctor.patients;
+          в рамках одной роли — только visibility='shared'.
+        """
+        with transaction.atomic():
+            shares = list(self.exclude(status='accepted').values(
+                'id', 'record_id', 'to_user_id',
+                'to_user__role', 'record__owner_primary__role',
+                'to_user__doctor_profile', 'to_user__patient_profile',
+                'record__owner_primary__doctor_profile',
+                'record__owner_primary__patient_profile',
+            ))
+            if not shares:
+                return 0
+
+            confirm = {}                    # to_user_id -> {record_id}
+            shared = set()                  # record_id
+            links = {}                      # doctor_id -> {patient_id}
+            for share in shares:
+                roles = (share['record__owner_primary__role'], share['to_user__role'])
+                if roles == ('doctor', 'patient'):
+                    doctor = share['record__owner_primary__doctor_profile']
+                    patient = share['to_user__patient_profile']
+                elif roles == ('patient', 'doctor'):
+                    doctor = share['to_user__doctor_profile']
+                    patient = share['record__owner_primary__patient_profile']
+                else:
+                    shared.add(share['record_id'])
+                    continue
+                confirm.setdefault(share['to_user_id'], set()).add(share['record_id'])
+                if doctor and patient:
+                    links.setdefault(doctor, set()).add(patient)
+
+            now = timezone.now()
+            records = MedicalRecord.objects
+            # UPDATE идёт мимо auto_now — updated_at (ETag карточки) ставим сами
+            for user_id, record_ids in confirm.items():
+                records.filter(pk__in=record_ids, owner_second__isnull=True).update(
+                    owner_second=user_id, visibility='confirmed', updated_at=now,
+                )
+            if shared:
+                records.filter(pk__in=shared).exclude(visibility='shared').update(
+                    visibility='shared', updated_at=now,
+                )
+
+            share_ids = [share['id'] for share in shares]
+            RecordShare.objects.filter(pk__in=share_ids).update(status='accepted', updated=now)
+
+            if links:
+                self._link_patients(links)
+            RecordAccess.objects.sync({share['record_id'] for share in shares})
+        return len(shares)
+
+    def decline(self) -> int:
+        with transaction.atomic():
+            rows = list(self.values_list('pk', 'record_id'))
+            declined = RecordShare.objects.filter(pk__in=[pk for pk, _ in rows]).update(
+                status='declined', updated=timezone.now(),
+            )
+            record_ids = {record_id for _, record_id in rows}
+            # отклонение уже принятого шаринга забирает доступ
+            RecordAccess.objects.sync(record_ids)
+        return declined
+
+    @staticmethod
+    def _link_patients(links) -> None:
+        """
+        doctor.patients.add(...) для всех пар одной вставкой. Сигнал
+        m2m_changed шлём сами — на нём сброс кэша doctor_has_patient.
+        """
+        through = Doctor.patients.through
+        through.objects.bulk_create(
+            [through(doctor_id=d, patient_id=p) for d, patients in links.items() for p in patients],
+            ignore_conflicts=True,
+        )
+        for doctor in Doctor.objects.filter(pk__in=links):
+            for action in ('pre_add', 'post_add'):
+                m2m_changed.send(
+                    sender=through, action=action, instance=doctor, reverse=False,
+                    model=Patient, pk_set=links[doctor.pk], using=doctor._state.db,
+                )
+
+
 class RecordShare(models.Model):
     """
     Одна конкретная MedicalRecord расшарена конкретному пользователю (врач или пациент).
@@ -210,52 +427,92 @@ class RecordShare(models.Model):
             models.Index(fields=('record', 'status')),
         ]
 
+    objects = RecordShareQuerySet.as_manager()
+
     def accept(self):
         if self.status == 'accepted':
             return
-
-        # u1 — тот, кто создал запись (owner_primary)
-        # u2 — пользователь, который принимает шаринг
-        u1 = self.record.owner_primary
-        u2 = self.to_user
-
-        # проверяем, шарится ли между доктором и пациентом
-        is_doc2pat = (u1.role == 'doctor' and u2.role == 'patient')
-        is_pat2doc = (u1.role == 'patient' and u2.role == 'doctor')
-
-        if is_doc2pat or is_pat2doc:
-            # 1) проставляем второго владельца и делаем запись доступной
-            if not self.record.owner_second_id:
-                self.record.owner_second = u2
-                self.record.visibility   = 'confirmed'
-                self.record.save(update_fields=['owner_second', 'visibility'])
-
-            # 2) синхронизируем m2m doctor.patients
-            doc_user = u1 if is_doc2pat else u2
-            pat_user = u2 if is_doc2pat else u1
-
-            # на всякий случай проверяем, что профили точно существуют
-            doc_profile = getattr(doc_user, 'doctor_profile', None)
-            pat_profile = getattr(pat_user, 'patient_profile', None)
-            if doc_profile and pat_profile:
-                doc_profile.patients.add(pat_profile)
-
-        # В любых остальных случаях (доктор→доктор, пациент→пациент)
-        # мы НЕ трогаем owner_second
-        else:
-            # если шарим в рамках одной роли (доктор→доктор или пациент→пациент),
-            # просто делаем запись доступной ("shared")
-            if self.record.visibility != 'shared':
-                self.record.visibility = 'shared'
-                self.record.save(update_fields=['visibility'])
-
-        # 3) отмечаем сам RecordShare как принятый
-        self.status = 'accepted'
-        self.save(update_fields=['status'])
+        RecordShare.objects.filter(pk=self.pk).accept()
+        self.refresh_from_db(fields=['status', 'updated'])
 
     def decline(self):
-        self.status = 'declined'
-        self.save(update_fields=['status'])
+        RecordShare.objects.filter(pk=self.pk).decline()
+        self.refresh_from_db(fields=['status', 'updated'])
+
+
+class RecordAccessManager(models.Manager):
+    def expected(self, record_ids) -> set[tuple[int, int, int]]:
+        """
+        Какие строки (user_id, record_id, patient_id) должны быть у записей
+        record_ids: оба владельца + все принятые RecordShare.
+        """
+        rows = set()
+        records = MedicalRecord.objects.filter(id__in=record_ids).values_list(
+            'id', 'patient_id', 'owner_primary_id', 'owner_second_id'
+        )
+        patient_of = {}
+        for record_id, patient_id, primary_id, second_id in records:
+            patient_of[record_id] = patient_id
+            rows.update((user_id, record_id, patient_id) for user_id in (primary_id, second_id) if user_id)
+
+        shares = RecordShare.objects.filter(record_id__in=patient_of, status='accepted')
+        for record_id, user_id in shares.values_list('record_id', 'to_user_id'):
+            rows.add((user_id, record_id, patient_of[record_id]))
+        return rows
+
+    def diff(self, record_ids):
+        """(недостающие строки, id лишних строк) для записей record_ids."""
+        expected = self.expected(record_ids)
+        actual = {
+            (user_id, record_id, patient_id): pk
+            for pk, user_id, record_id, patient_id in self.filter(record_id__in=record_ids)
+            .values_list('pk', 'user_id', 'record_id', 'patient_id')
+        }
+        missing = expected - actual.keys()
+        stale = [pk for row, pk in actual.items() if row not in expected]
+        return missing, stale
+
+    def sync(self, record_ids) -> tuple[int, int]:
+        """Приводит строки доступа записей record_ids к expected(); (добавлено, удалено)."""
+        missing, stale = self.diff(record_ids)
+        if stale:
+            self.filter(pk__in=stale).delete()
+        if missing:
+            self.bulk_create(
+                [RecordAccess(user_id=u, record_id=r, patient_id=p) for u, r, p in missing],
+                ignore_conflicts=True,
+            )
+        return len(missing), len(stale)
+
+
+class RecordAccess(models.Model):
+    """
+    Денормализованное «кто видит запись»: владельцы MedicalRecord и получатели
+    принятых RecordShare. Списки и карточки записей фильтруются одним JOIN'ом
+    по (user, patient) вместо OR по owner_primary / owner_second / shares.
+
+    Поддерживается сигналами (main.signals) при сохранении MedicalRecord и
+    RecordShare, а для bulk_create()/update() — MedicalRecordQuerySet и
+    RecordShareQuerySet; заполнение/сверка — manage.py backfill_record_access /
+    check_record_access.
+    """
+    user    = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE,
+                                related_name='record_access', db_index=False)
+    record  = models.ForeignKey(MedicalRecord, on_delete=models.CASCADE,
+                                related_name='access')
+    patient = models.ForeignKey(Patient, on_delete=models.CASCADE,
+                                related_name='+')
+
+    objects = RecordAccessManager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=('user', 'record'), name='record_access_user_record'),
+        ]
+        indexes = [
+            # записи пациента, доступные пользователю (index-only scan)
+            models.Index(fields=('user', 'patient', 'record')),
+        ]
 
 
 # ---------- Уведомление ----------------------------------
@@ -282,16 +539,56 @@ class ShareRequest(models.Model):
 
     class Meta:
         unique_together = ('to_email', 'patient')
+        indexes = [
+            # входящие и исходящие, новые первыми
+            models.Index(fields=('from_user', '-created_at', '-id')),
+            models.Index(fields=('to_user', '-created_at', '-id')),
+        ]
 
-    # при ответе просто проксируем в RecordShare
+    # при ответе проксируем в RecordShare — всей пачкой (RecordShareQuerySet)
     def accept(self):
-        for rs in self.record_shares.all():
-            rs.accept()
-        self.status = 'accepted'
-        self.responded_at = timezone.now()
-        self.save(update_fields=['status', 'responded_at'])
+        with transaction.atomic():
+            self.record_shares.accept()
+            self.status = 'accepted'
+            self.responded_at = timezone.now()
+            self.save(update_fields=['status', 'responded_at'])
 
     def decline(self):
-        self.status = 'declined'
-        self.responded_at = timezone.now()
-        self.save(update_fields=['status', 'responded_at'])
+        with transaction.atomic():
+            # уже принятые раньше шаринги не отзываем — только ожидающие
+            self.record_shares.filter(status='pending').decline()
+            self.status = 'declined'
+            self.responded_at = timezone.now()
+            self.save(update_fields=['status', 'responded_at'])
+
+
+# ---------- EventHub outbox ---------------------------------------------------
+class EventOutbox(models.Model):
+    """
+    Исходящие события EventHub (transactional outbox): строка пишется в той же
+    транзакции, что и изменение, а отправляет её Celery-задача
+    relay_event_outbox (main.outbox). Отправленные строки удаляются; при
+    ошибке — attempts + 1 и next_attempt_at с экспоненциальной задержкой.
+    На время отправки next_attempt_at — срок аренды пачки релеем.
+    """
+    event_id   = models.CharField(max_length=64)
+    tenant_id  = models.CharField(max_length=64)
+    type       = models.CharField(max_length=100)
+    actor_id   = models.CharField(max_length=64, blank=True)
+    patient_id = models.CharField(max_length=64, blank=True)
+    ts         = models.DateTimeField()
+    props      = models.JSONField(default=dict, encoder=DjangoJSONEncoder)
+
+    created_at      = models.DateTimeField(auto_now_add=True)
+    attempts        = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error      = models.TextField(blank=True)
+
+    class Meta:
+        indexes = [
+            # выборка релеем: due-строки по порядку записи
+            models.Index(fields=('next_attempt_at', 'id')),
+        ]
+
+    def __str__(self):
+        return f'{self.type} {self.event_id}'
@@ -0,0 +1,155 @@
+import logging
+from datetime import timedelta
+
+import grpc
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from integrations.eventhub.client import EventDTO, publish_event, publish_events
+
+from .models import EventOutbox
+
+
+logger = logging.getLogger(__name__)
+
+
+# ---------- запись ------------------------------------------------------------
+def enqueue(event: EventDTO) -> EventOutbox | None:
+    """
+    Положить событие в outbox — в текущей транзакции. После коммита будим
+    релей; не получилось (брокер недоступен) — заберёт периодический проход.
+    При выключенном EventHub события не копим: релей их всё равно не отправит.
+    """
+    if not getattr(settings, 'EVENTHUB_ENABLED', True):
+        return None
+
+    row = EventOutbox.objects.create(
+        event_id=event.id,
+        tenant_id=event.tenant_id,
+        type=event.type,
+        actor_id=event.actor_id or '',
+        patient_id=event.patient_id or '',
+        ts=event.ts,
+        props=dict(event.props or {}),
+    )
+    transaction.on_commit(_wake_relay)
+    return row
+
+
+def _wake_relay() -> None:
+    from .tasks import relay_event_outbox
+    try:
+        relay_event_outbox.delay()
+    except Exception as exc:
+        logger.warning("EventHub outbox relay not scheduled: %s", exc)
+
+
+def _to_dto(row: EventOutbox) -> EventDTO:
+    return EventDTO(
+        id=row.event_id,
+        tenant_id=row.tenant_id,
+        type=row.type,
+        actor_id=row.actor_id or None,
+        patient_id=row.patient_id or None,
+        ts=row.ts,
+        props=row.props,
+    )
+
+
+# ---------- отправка ----------------------------------------------------------
+def backoff(attempts: int) -> timedelta:
+    """Задержка перед попыткой attempts + 1: base·2^(attempts−1), не больше max."""
+    base = float(getattr(settings, 'EVENTHUB_OUTBOX_BACKOFF_SEC', 5))
+    cap = float(getattr(settings, 'EVENTHUB_OUTBOX_BACKOFF_MAX_SEC', 3600))
+    return timedelta(seconds=min(cap, base * 2 ** max(attempts - 1, 0)))
+
+
+def relay_batch(batch_size: int) -> tuple[int, int]:
+    """
+    Отправить одну пачку due-строк через PublishEvents; (доставлено, отложено).
+
+    Три шага, RPC — вне транзакции:
+      1) короткая транзакция: берём due-строки (skip_locked) и сдвигаем их
+         next_attempt_at на EVENTHUB_OUTBOX_LEASE_SEC — это аренда: другие
+         релеи их не видят, а если этот упадёт, строки снова станут due;
+      2) отправка;
+      3) короткая транзакция: доставленные удаляем, остальные откладываем.
+    EventHub может получить событие повторно (упали между 2 и 3, аренда
+    истекла) — получатель дедуплицирует по id.
+    """
+    rows = _claim(batch_size)
+    if not rows:
+        return 0, 0
+
+    failed, error = _deliver(rows)
+
+    sent = [row.pk for row in rows if row not in failed]
+    with transaction.atomic():
+        if sent:
+            EventOutbox.objects.filter(pk__in=sent).delete()
+        if failed:
+            _postpone(failed, error)
+    return len(sent), len(failed)
+
+
+def _claim(batch_size: int) -> list[EventOutbox]:
+    lease = float(getattr(settings, 'EVENTHUB_OUTBOX_LEASE_SEC', 300))
+    with transaction.atomic():
+        now = timezone.now()
+        rows = list(
+            EventOutbox.objects.select_for_update(skip_locked=True)
+            .filter(next_attempt_at__lte=now)
+            .order_by('next_attempt_at', 'id')[:batch_size]
+        )
+        if rows:
+            EventOutbox.objects.filter(pk__in=[row.pk for row in rows]).update(
+                next_attempt_at=now + timedelta(seconds=lease),
+            )
+    return rows
+
+
+def _deliver(rows: list[EventOutbox]) -> tuple[list[EventOutbox], str]:
+    """Отправить строки; (не доставленные, текст ошибки)."""
+    try:
+        result = publish_events(_to_dto(row) for row in rows)
+    except grpc.RpcError as exc:
+        return rows, str(exc)
+    if not result.failed:
+        return [], ''
+
+    # какие именно не приняты, PublishEventsResponse не говорит — досылаем
+    # пачку по одному, чтобы одно плохое событие не держало остальные.
+    # Принятые пачкой придут второй раз (один раз: дальше их строк уже нет),
+    # получатель дедуплицирует по id
+    return _publish_one_by_one(rows)
+
+
+def _publish_one_by_one(rows):
+    failed, error = [], ''
+    for row in rows:
+        try:
+            if publish_event(_to_dto(row)):
+                continue
+            error = 'rejected by EventHub'
+        except grpc.RpcError as exc:
+            error = str(exc)
+        failed.append(row)
+    return failed, error
+
+
+def _postpone(rows, error: str) -> None:
+    now = timezone.now()
+    for row in rows:
+        row.attempts += 1
+        row.next_attempt_at = now + backoff(row.attempts)
+        row.last_error = error
+    EventOutbox.objects.bulk_update(rows, ['attempts', 'next_attempt_at', 'last_error'])
+
+    alert = int(getattr(settings, 'EVENTHUB_OUTBOX_ALERT_ATTEMPTS', 10))
+    stuck = [row.pk for row in rows if row.attempts >= alert]
+    if stuck:
+        logger.error("EventHub outbox: %d events failing for %d+ attempts, e.g. id=%s: %s",
+                     len(stuck), alert, stuck[0], error)
+    else:
+        logger.warning("EventHub outbox: %d events postponed: %s", len(rows), error)
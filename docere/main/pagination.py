@@ -0,0 +1,141 @@
+import datetime
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+
+from django.core.exceptions import ValidationError
+from django.db.models import F, Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import CursorPagination
+from rest_framework.utils.urls import replace_query_param
+
+
+def _json_default(value):
+    # isoformat без округления: DjangoJSONEncoder обрезает микросекунды,
+    # а курсор по created_at должен быть точным
+    if isinstance(value, (datetime.date, datetime.time)):
+        return value.isoformat()
+    return str(value)
+
+
+class KeysetPagination(CursorPagination):
+    """
+    Keyset-пагинация по составному ключу: курсор хранит значения всех полей
+    сортировки последней (первой) строки страницы, и следующая страница —
+    это `WHERE (ключ) после курсора ORDER BY ... LIMIT n`. Поэтому страница
+    500 стоит столько же, сколько первая, если под сортировку есть индекс.
+
+    В отличие от CursorPagination из DRF (позиция только по первому полю +
+    OFFSET внутри одинаковых значений) годится для неуникальных и
+    NULL-able полей вроде MedicalRecord.visit_date.
+
+    Сортировка берётся из `view.ordering`, к ней дописывается pk как
+    тай-брейкер. NULL считается больше любого значения — как в PostgreSQL
+    по умолчанию, чтобы ORDER BY совпадал с обычным (не NULLS LAST) индексом.
+
+    Формат ответа как у CursorPagination: {next, previous, results}.
+    """
+    ordering = ('-pk',)
+    page_size_query_param = 'page_size'
+    max_page_size = 200
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        self.base_url = request.build_absolute_uri()
+        self.keys = self.get_ordering(request, queryset, view)
+        self.nullable = {
+            name: name != 'pk' and queryset.model._meta.get_field(name).null
+            for name, _ in self.keys
+        }
+
+        self.cursor = self.decode_cursor(request)
+        values, reverse = self.cursor if self.cursor else (None, False)
+
+        keys = [(name, desc != reverse) for name, desc in self.keys]
+        queryset = queryset.order_by(*(
+            F(name).desc(nulls_first=True) if desc else F(name).asc(nulls_last=True)
+            for name, desc in keys
+        ))
+        if values is not None:
+            queryset = queryset.filter(self._after(keys, values))
+
+        try:
+            results = list(queryset[:self.page_size + 1])
+        except ValidationError:
+            # подделанный курсор: значение не приводится к типу поля
+            raise NotFound(self.invalid_cursor_message)
+        has_more = len(results) > self.page_size
+        self.page = results[:self.page_size]
+        if reverse:
+            self.page.reverse()
+
+        # назад пришли с соседней страницы — значит, она есть
+        if reverse:
+            self.has_next, self.has_previous = values is not None, has_more
+        else:
+            self.has_next, self.has_previous = has_more, values is not None
+        return self.page
+
+    def get_ordering(self, request, queryset, view):
+        ordering = getattr(view, 'ordering', None) or self.ordering
+        if isinstance(ordering, str):
+            ordering = (ordering,)
+
+        keys = [(field.lstrip('-'), field.startswith('-')) for field in ordering]
+        keys = [('pk' if name == 'id' else name, desc) for name, desc in keys]
+        if keys[-1][0] != 'pk':
+            keys.append(('pk', keys[-1][1]))
+        return keys
+
+    def _after(self, keys, values):
+        """(k1, k2, ...) строго после values в порядке keys."""
+        condition = Q(pk__in=[])
+        equal = Q()
+        for (name, desc), value in zip(keys, values):
+            if value is None:
+                # NULL — максимум: после него по убыванию идут все значения
+                after = Q(**{f'{name}__isnull': False}) if desc else Q(pk__in=[])
+                same = Q(**{f'{name}__isnull': True})
+            else:
+                after = Q(**{f'{name}__lt' if desc else f'{name}__gt': value})
+                if not desc and self.nullable[name]:
+                    after |= Q(**{f'{name}__isnull': True})
+                same = Q(**{name: value})
+            condition |= equal & after
+            equal &= same
+        return condition
+
+    # ---------- курсор -------------------------------------------------------
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None
+        try:
+            data = json.loads(urlsafe_b64decode(encoded.encode('ascii')))
+            values, reverse = data['v'], bool(data['r'])
+        except (TypeError, ValueError, KeyError):
+            raise NotFound(self.invalid_cursor_message)
+        if (
+            not isinstance(values, list) or len(values) != len(self.keys)
+            or not all(v is None or isinstance(v, (str, int, float)) for v in values)
+        ):
+            raise NotFound(self.invalid_cursor_message)
+        return values, reverse
+
+    def encode_cursor(self, row, reverse):
+        values = [getattr(row, name) for name, _ in self.keys]
+        data = json.dumps({'v': values, 'r': int(reverse)}, default=_json_default)
+        encoded = urlsafe_b64encode(data.encode()).decode('ascii')
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded)
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        return self.encode_cursor(self.page[0], reverse=True)
@@ -0,0 +1,65 @@
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.permissions import BasePermission
+
+from .models import Doctor
+
+
+# ---------- доктор ↔ пациент ------------------------------------------------
+def _membership_key(doctor_id, patient_id) -> str:
+    return f'doctor-patient:{doctor_id}:{patient_id}'
+
+
+def doctor_has_patient(request, doctor_id, patient_id) -> bool:
+    """
+    Ведёт ли доктор пациента (Doctor.patients). Один EXISTS по уникальному
+    индексу m2m-таблицы вместо выгрузки всего списка пациентов; ответ
+    запоминается на время запроса и в Redis (сбрасывается сигналом
+    m2m_changed, см. main.signals).
+    """
+    memo = getattr(request, '_doctor_patient_memo', None)
+    if memo is None:
+        memo = request._doctor_patient_memo = {}
+
+    key = _membership_key(doctor_id, patient_id)
+    if key not in memo:
+        linked = cache.get(key)
+        if linked is None:
+            linked = Doctor.patients.through.objects.filter(
+                doctor_id=doctor_id, patient_id=patient_id
+            ).exists()
+            cache.set(key, linked, settings.PATIENT_ACCESS_CACHE_TTL)
+        memo[key] = linked
+    return memo[key]
+
+
+def forget_doctor_patients(pairs) -> None:
+    """Сбросить закэшированные ответы doctor_has_patient для пар (doctor_id, patient_id)."""
+    cache.delete_many([_membership_key(d, p) for d, p in pairs])
+
+
+def can_view_patient(request, patient) -> bool:
+    """Может ли request.user смотреть карточку пациента."""
+    user = request.user
+
+    # суперюзер/админ может любого
+    if user.is_superuser or getattr(user, 'role', None) == 'admin':
+        return True
+
+    # доктор — только своих
+    if getattr(user, 'role', None) == 'doctor':
+        doc = getattr(user, 'doctor_profile', None)
+        return bool(doc) and doctor_has_patient(request, doc.id, patient.id)
+
+    # пациент — только свою
+    if getattr(user, 'role', None) == 'patient':
+        return patient.user_id == user.id
+
+    return False
+
+
+class CanViewPatient(BasePermission):
+    message = 'You do not have permission to view this patient.'
+
+    def has_object_permission(self, request, view, obj):
+        return can_view_patient(request, obj)
@@ -0,0 +1,221 @@
+import asyncio
+import json
+import logging
+import time
+
+import redis
+import redis.asyncio as aioredis
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core import signing
+from django.core.serializers.json import DjangoJSONEncoder
+
+from .models import ArchiveJob, ArchiveJobEvent
+
+
+logger = logging.getLogger(__name__)
+
+FINAL_STATUSES = ('done', 'failed')
+
+_redis = None
+_aredis = None
+_aredis_loop = None
+
+
+# ---------- публикация в Redis pub/sub ---------------------------------------
+def _channel(job_id) -> str:
+    return f'archive-job:{job_id}'
+
+
+def _client() -> redis.Redis | None:
+    global _redis
+    url = getattr(settings, 'ARCHIVE_EVENTS_REDIS_URL', '')
+    if not url:
+        return None
+    if _redis is None:
+        _redis = redis.Redis.from_url(url)
+    return _redis
+
+
+def _publish(job_id, payload: dict) -> None:
+    """
+    Событие задачи — подписчикам views.task_status_stream. Ошибки Redis
+    обработку архива не ломают: клиент всегда может перечитать статус GET'ом.
+    """
+    client = _client()
+    if client is None:
+        return
+    try:
+        client.publish(_channel(job_id), json.dumps(payload, cls=DjangoJSONEncoder))
+    except redis.RedisError as exc:
+        logger.warning("Archive job event not published job_id=%s: %s", job_id, exc)
+
+
+def status_payload(job: ArchiveJob) -> dict:
+    return {
+        'type':     'status',
+        'status':   job.status,
+        'progress': job.get_progress(),
+    }
+
+
+def publish_status(job: ArchiveJob) -> None:
+    _publish(job.pk, status_payload(job))
+
+
+def log_event(job: ArchiveJob, message: str) -> ArchiveJobEvent:
+    """Строка лога обработки архива (отдельной строкой в ArchiveJobEvent)."""
+    event = ArchiveJobEvent.objects.create(job=job, message=message)
+    _publish(job.pk, {'type': 'log', 'id': event.id, 'message': message})
+    return event
+
+
+class JobProgress:
+    """
+    Прогресс обработки ArchiveJob. Приращения копятся в памяти и пишутся
+    в ArchiveJobEvent не чаще раза в ARCHIVE_PROGRESS_INTERVAL секунд;
+    смена фазы и flush() пишутся сразу.
+
+    В событие progress идут нарастающие итоги из счётчиков в Redis (HINCRBY
+    рядом с каналом задачи), а не агрегат по ArchiveJobEvent: при раздаче
+    по кускам у каждого воркера свой JobProgress, и только общий счётчик
+    даёт итог по задаче. Агрегат по базе — для GET-статуса и снимка в SSE.
+    """
+
+    def __init__(self, job: ArchiveJob):
+        self.job = job
+        self.interval = float(getattr(settings, 'ARCHIVE_PROGRESS_INTERVAL', 1.0))
+        self.phase = ''
+        self._members = 0
+        self._bytes = 0
+        self._written_at = time.monotonic()
+
+    def set_phase(self, phase: str) -> None:
+        self.phase = phase
+        self._write(phase=phase)
+
+    def advance(self, members: int = 1, bytes_done: int = 0) -> None:
+        self._members += members
+        self._bytes += bytes_done
+        if time.monotonic() - self._written_at >= self.interval:
+            self.flush()
+
+    def flush(self) -> None:
+        if self._members or self._bytes:
+            self._write()
+
+    def _write(self, phase: str = '') -> None:
+        ArchiveJobEvent.objects.create(
+            job=self.job,
+            phase=phase,
+            members_done=self._members,
+            bytes_done=self._bytes,
+        )
+        members, bytes_done = self._members, self._bytes
+        self._members = 0
+        self._bytes = 0
+        self._written_at = time.monotonic()
+        self._publish(phase, members, bytes_done)
+
+    def _publish(self, phase: str, members: int, bytes_done: int) -> None:
+        client = _client()
+        if client is None:
+            return
+        key = f'{_channel(self.job.pk)}:progress'
+        try:
+            pipe = client.pipeline()
+            if phase:
+                pipe.hset(key, 'phase', phase)
+            pipe.hincrby(key, 'members_done', members)
+            pipe.hincrby(key, 'bytes_done', bytes_done)
+            pipe.hget(key, 'phase')
+            pipe.expire(key, int(getattr(settings, 'ARCHIVE_PROGRESS_TTL', 86400)))
+            members_done, total_bytes, current_phase, _ = pipe.execute()[-4:]
+        except redis.RedisError as exc:
+            logger.warning("Archive job progress not published job_id=%s: %s", self.job.pk, exc)
+            return
+        _publish(self.job.pk, {'type': 'progress', 'progress': {
+            'phase':         (current_phase or b'').decode() or self.job.status,
+            'members_done':  members_done,
+            'members_total': self.job.members_total,
+            'bytes_done':    total_bytes,
+            'bytes_total':   self.job.bytes_total,
+        }})
+
+
+# ---------- server-sent events -----------------------------------------------
+_TICKET_SALT = 'main.progress.stream-ticket'
+
+
+def issue_stream_ticket(job: ArchiveJob, user) -> str:
+    """
+    Билет на SSE-поток задачи. EventSource не умеет заголовки, а access-токен
+    в URL оседает в логах — в URL идёт только этот подписанный билет:
+    одна задача, один пользователь, живёт ARCHIVE_EVENTS_TICKET_TTL секунд.
+    """
+    return signing.dumps({'job': job.pk, 'user': user.pk}, salt=_TICKET_SALT, compress=True)
+
+
+def check_stream_ticket(ticket: str, job_id: int) -> int | None:
+    """id пользователя из билета или None, если билет чужой, испорчен или истёк."""
+    ttl = float(getattr(settings, 'ARCHIVE_EVENTS_TICKET_TTL', 30))
+    try:
+        payload = signing.loads(ticket, salt=_TICKET_SALT, max_age=ttl)
+    except signing.BadSignature:
+        return None
+    return payload['user'] if payload.get('job') == job_id else None
+
+
+def _async_redis() -> aioredis.Redis:
+    """
+    Общий на процесс async-клиент Redis: пул соединений один, каждый поток
+    берёт из него соединение под подписку и возвращает при закрытии.
+    Соединения redis.asyncio привязаны к event loop — под uvicorn он один
+    на процесс, а под async_to_sync (тесты, команды) клиент пересоздаётся.
+    """
+    global _aredis, _aredis_loop
+    loop = asyncio.get_running_loop()
+    if _aredis is None or _aredis_loop is not loop:
+        _aredis = aioredis.from_url(settings.ARCHIVE_EVENTS_REDIS_URL)
+        _aredis_loop = loop
+    return _aredis
+
+
+def _sse(event: str, payload: dict) -> str:
+    return f'event: {event}\ndata: {json.dumps(payload, cls=DjangoJSONEncoder)}\n\n'
+
+
+async def stream_job_events(job: ArchiveJob):
+    """
+    Поток server-sent events по задаче: сразу текущий статус, затем всё,
+    что публикует Celery-задача. Заканчивается на done/failed или по
+    ARCHIVE_EVENTS_STREAM_TIMEOUT (EventSource сам переподключится).
+
+    Django 4.2 под ASGI не замечает, что клиент ушёл: генератор доживает до
+    своего конца, держа подписку. Поэтому поток короткий (по умолчанию
+    минута) — брошенная вкладка занимает соединение Redis не дольше.
+    """
+    heartbeat = float(getattr(settings, 'ARCHIVE_EVENTS_HEARTBEAT', 15.0))
+    deadline = time.monotonic() + float(getattr(settings, 'ARCHIVE_EVENTS_STREAM_TIMEOUT', 60))
+
+    pubsub = _async_redis().pubsub()
+    try:
+        # сначала подписка, потом снимок — иначе событие между ними потеряется
+        await pubsub.subscribe(_channel(job.pk))
+        await sync_to_async(job.refresh_from_db)(fields=['status', 'members_total', 'bytes_total'])
+        snapshot = await sync_to_async(status_payload)(job)
+        yield _sse('status', snapshot)
+        if snapshot['status'] in FINAL_STATUSES:
+            return
+
+        while time.monotonic() < deadline:
+            message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=heartbeat)
+            if message is None:
+                yield ': keepalive\n\n'
+                continue
+            payload = json.loads(message['data'])
+            yield _sse(payload['type'], payload)
+            if payload['type'] == 'status' and payload['status'] in FINAL_STATUSES:
+                return
+    finally:
+        await pubsub.aclose()
@@ -1,6 +1,8 @@
 import os
 
-from django.db.models import Q
+from django.core.exceptions import FieldDoesNotExist
+from django.db import transaction
+from django.db.models import Max, Prefetch, Q
 from django.shortcuts import get_object_or_404
 
 from rest_framework import serializers
@@ -8,6 +10,79 @@ from rest_framework import serializers
 from main.models import Patient, User, Doctor, LabFile, MedicalRecord, ArchiveJob, ShareRequest, RecordShare
 
 
+# ---------- план выборки ----------------------------------------------------
+def _relation_path(model, path):
+    """Самый длинный префикс path из FK/O2O-связей — то, что можно select_related."""
+    relations = []
+    for attr in path:
+        try:
+            field = model._meta.get_field(attr)
+        except FieldDoesNotExist:
+            break
+        if not (field.is_relation and (field.many_to_one or field.one_to_one)):
+            break
+        relations.append(attr)
+        model = field.related_model
+    return '__'.join(relations)
+
+
+def _prefixed(prefix, lookup):
+    if isinstance(lookup, Prefetch):
+        return Prefetch(f'{prefix}__{lookup.prefetch_through}', queryset=lookup.queryset, to_attr=lookup.to_attr)
+    return f'{prefix}__{lookup}'
+
+
+class EagerLoadingMixin:
+    """
+    Сериализатор сам знает, какие связи он читает, и отдаёт план выборки:
+      • source='user.photo'               → select_related('user')
+      • вложенный сериализатор (FK/O2O)   → select_related + его собственный план под префиксом
+      • вложенный сериализатор many=True  → Prefetch со своим планом
+      • Meta.select_related / Meta.prefetch_related — то, что из полей не видно.
+    Вьюхи применяют план через views.EagerLoadingViewMixin.
+    """
+
+    @classmethod
+    def fetch_plan(cls):
+        meta = cls.Meta
+        select = list(getattr(meta, 'select_related', ()))
+        prefetch = list(getattr(meta, 'prefetch_related', ()))
+
+        for name, field in cls._declared_fields.items():
+            source = field.source or name
+            if field.write_only or source == '*' or isinstance(field, serializers.RelatedField):
+                continue
+            path = source.split('.')
+
+            if isinstance(field, serializers.ListSerializer):
+                child = field.child
+                queryset = child.Meta.model._default_manager.all()
+                if isinstance(child, EagerLoadingMixin):
+                    queryset = child.setup_eager_loading(queryset)
+                prefetch.append(Prefetch('__'.join(path), queryset=queryset))
+                continue
+
+            lookup = _relation_path(meta.model, path)
+            if not lookup:
+                continue
+            select.append(lookup)
+            if isinstance(field, EagerLoadingMixin) and lookup == '__'.join(path):
+                child_select, child_prefetch = field.fetch_plan()
+                select += [_prefixed(lookup, s) for s in child_select]
+                prefetch += [_prefixed(lookup, p) for p in child_prefetch]
+
+        return list(dict.fromkeys(select)), prefetch
+
+    @classmethod
+    def setup_eager_loading(cls, queryset):
+        select, prefetch = cls.fetch_plan()
+        if select:
+            queryset = queryset.select_related(*select)
+        if prefetch:
+            queryset = queryset.prefetch_related(*prefetch)
+        return queryset
+
+
 class UserRegisterSerializer(serializers.ModelSerializer):
     password = serializers.CharField(write_only=True, min_length=6)
 
@@ -79,12 +154,18 @@ class PatientSerializer(serializers.ModelSerializer):
             'record_count',
         ]
 
+    # списки и карточка отдают Patient.objects.with_record_stats() —
+    # значения уже посчитаны в запросе; запрос на пациента остаётся
+    # только для свежесозданного объекта (ответ на POST)
     def get_record_count(self, obj):
+        if hasattr(obj, 'record_count'):
+            return obj.record_count
         return obj.medical_records.count()
 
     def get_last_visit(self, obj):
-        last = obj.medical_records.order_by('-visit_date').first()
-        return last.visit_date if last and last.visit_date else None
+        if hasattr(obj, 'last_visit'):
+            return obj.last_visit
+        return obj.medical_records.aggregate(last=Max('visit_date'))['last']
 
     def validate_birthday(self, value):
         """Позволяем прислать пустую строку → None."""
@@ -106,14 +187,14 @@ class PatientSerializer(serializers.ModelSerializer):
         return instance
 
 
-class DoctorSerializer(serializers.ModelSerializer):
+class DoctorSerializer(EagerLoadingMixin, serializers.ModelSerializer):
     user = UserMeSerializer(read_only=True)
 
     class Meta:
         model = Doctor
         fields = ['id', 'user']
 
-class DoctorInfoSerializer(serializers.ModelSerializer):
+class DoctorInfoSerializer(EagerLoadingMixin, serializers.ModelSerializer):
     full_name = serializers.SerializerMethodField()
     photo     = serializers.ImageField(source='user.photo', read_only=True)
 
@@ -131,7 +212,7 @@ class LabFileSerializer(serializers.ModelSerializer):
         fields = ['id', 'file_type', 'file']
 
 
-class MedicalRecordSerializer(serializers.ModelSerializer):
+class MedicalRecordSerializer(EagerLoadingMixin, serializers.ModelSerializer):
     doctor    = DoctorInfoSerializer(read_only=True)
     lab_files = LabFileSerializer(source='files', many=True, read_only=True)
 
@@ -154,16 +235,26 @@ class ZipUploadSerializer(serializers.ModelSerializer):
 
 
 class ArchiveJobSerializer(serializers.ModelSerializer):
+    """
+    Статус задачи разбора архива. Лог отдаётся страницей: строки после
+    context['log_after'] (не больше context['log_limit']), а log_cursor —
+    что передать в log_after в следующий раз.
+    """
     file_name  = serializers.SerializerMethodField()
     record_id  = serializers.IntegerField(source='record.id',          read_only=True)
     patient_id = serializers.IntegerField(source='record.patient.id',  read_only=True)
+    progress   = serializers.SerializerMethodField()
+    log        = serializers.SerializerMethodField()
+    log_cursor = serializers.SerializerMethodField()
 
     class Meta:
         model  = ArchiveJob
         fields = [
             'id',
             'status',
+            'progress',
             'log',
+            'log_cursor',
             'raw_extracted',
             'uploaded_at',
             'completed_at',
@@ -175,8 +266,32 @@ class ArchiveJobSerializer(serializers.ModelSerializer):
     def get_file_name(self, obj):
         return os.path.basename(obj.archive_file.name or '')
 
+    def get_progress(self, obj):
+        return obj.get_progress()
 
-class RecentUploadSerializer(serializers.ModelSerializer):
+    def _log_page(self, obj):
+        if getattr(self, '_log_page_for', None) != obj.pk:
+            after = self.context.get('log_after', 0)
+            limit = self.context.get('log_limit', 200)
+            self._log_page_rows = list(
+                obj.events.filter(id__gt=after).exclude(message='')
+                .values_list('id', 'message')[:limit]
+            )
+            self._log_page_for = obj.pk
+        return self._log_page_rows
+
+    def get_log(self, obj):
+        rows = self._log_page(obj)
+        if not rows and not self.context.get('log_after') and obj.log:
+            return obj.log          # задачи, обработанные до журнала событий
+        return ''.join(f'{message}\n' for _, message in rows)
+
+    def get_log_cursor(self, obj):
+        rows = self._log_page(obj)
+        return rows[-1][0] if rows else self.context.get('log_after', 0)
+
+
+class RecentUploadSerializer(EagerLoadingMixin, serializers.ModelSerializer):
     patient_name = serializers.SerializerMethodField()
     record_id    = serializers.IntegerField(source='record.id', read_only=True)
     patient_id = serializers.SerializerMethodField()
@@ -184,6 +299,8 @@ class RecentUploadSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = ArchiveJob
+        # get_patient_name / get_patient_id ходят в record.patient
+        select_related = ('record__patient',)
         fields = [
             'id',
             'patient_name',
@@ -209,7 +326,7 @@ class RecentUploadSerializer(serializers.ModelSerializer):
         return os.path.basename(obj.archive_file.name or '')
 
 
-class RecordShareSerializer(serializers.ModelSerializer):
+class RecordShareSerializer(EagerLoadingMixin, serializers.ModelSerializer):
     record_id = serializers.IntegerField(source='record.id', read_only=True)
     to_user   = serializers.PrimaryKeyRelatedField(read_only=True)
 
@@ -238,17 +355,18 @@ class ShareRequestCreateSerializer(serializers.ModelSerializer):
         attrs['patient'] = patient
 
         # проверяем, что эти записи принадлежат этому пациенту
-        ids = attrs['record_ids']
-        allowed = MedicalRecord.objects.filter(
-            patient=patient
+        ids = set(attrs['record_ids'])
+        allowed = set(MedicalRecord.objects.filter(
+            patient=patient, id__in=ids
         ).filter(
             Q(owner_primary=user) | Q(owner_second=user)
-        ).values_list('id', flat=True)
-        bad = set(ids) - set(allowed)
+        ).values_list('id', flat=True))
+        bad = ids - allowed
         if bad:
             raise serializers.ValidationError(
-                f"Нельзя расшарить записи с id={list(bad)}"
+                f"Нельзя расшарить записи с id={sorted(bad)}"
             )
+        attrs['record_ids'] = sorted(allowed)
 
         return attrs
 
@@ -257,41 +375,42 @@ class ShareRequestCreateSerializer(serializers.ModelSerializer):
         patient = validated_data['patient']
         to_email = validated_data.pop('to_email')
         record_ids = validated_data.pop('record_ids')
-
-        # получаем (или создаём, если нет) ShareRequest
-        share_request, created = ShareRequest.objects.get_or_create(
-            to_email=to_email,
-            patient=patient,
-            defaults={
-                'from_user': request_user,
-                'to_user': User.objects.filter(email__iexact=to_email).first()
-            }
-        )
-        # если уже существовал, обновим поля from_user/to_user на всякий случай
-        if not created:
-            share_request.from_user = request_user
-            share_request.to_user = User.objects.filter(email__iexact=to_email).first()
-            share_request.save(update_fields=['from_user', 'to_user'])
-
-        # создаём RecordShare для каждой записи
-        for rid in record_ids:
-            rec = MedicalRecord.objects.get(pk=rid)
-            # получатель может и не быть доктором — тогда пропускаем
-            to_user = share_request.to_user
-            if not to_user:
-                continue
-            # get_or_create, чтобы не упасть на unique_together
-            rs, _ = RecordShare.objects.get_or_create(
-                record=rec,
-                to_user=to_user,
-                defaults={'status': 'pending'}
+        to_user = User.objects.filter(email__iexact=to_email).first()
+
+        with transaction.atomic():
+            # получаем (или создаём, если нет) ShareRequest
+            share_request, created = ShareRequest.objects.get_or_create(
+                to_email=to_email,
+                patient=patient,
+                defaults={'from_user': request_user, 'to_user': to_user}
+            )
+            # если уже существовал, обновим поля from_user/to_user на всякий случай
+            if not created:
+                share_request.from_user = request_user
+                share_request.to_user = to_user
+                share_request.save(update_fields=['from_user', 'to_user'])
+
+            # получатель может и не быть зарегистрирован — тогда только конверт
+            if not to_user or not record_ids:
+                return share_request
+
+            # RecordShare пачкой; уже существующие (unique_together) пропускаются.
+            # post_save тут не нужен: новые шаринги в статусе pending
+            # и RecordAccess не меняют.
+            RecordShare.objects.bulk_create(
+                [RecordShare(record_id=rid, to_user=to_user, status='pending') for rid in record_ids],
+                ignore_conflicts=True,
             )
-            share_request.record_shares.add(rs)
+            # ignore_conflicts не возвращает pk — дочитываем одним запросом
+            share_ids = RecordShare.objects.filter(
+                record_id__in=record_ids, to_user=to_user
+            ).values_list('id', flat=True)
+            share_request.record_shares.add(*share_ids)
 
         return share_request
 
 
-class ShareRequestSerializer(serializers.ModelSerializer):
+class ShareRequestSerializer(EagerLoadingMixin, serializers.ModelSerializer):
     # для списка входящих мы скрываем to_email, но нам нужны shares
     from_user_fullname = serializers.CharField(source='from_user.get_full_name', read_only=True)
     patient_name       = serializers.CharField(source='patient.get_full_name',    read_only=True)
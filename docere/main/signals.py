@@ -1,12 +1,15 @@
 import logging
 
-from django.db.models.signals import post_save
+from django.db.models.signals import m2m_changed, post_delete, post_save
 from django.db import transaction
 from django.dispatch import receiver
 from django.utils import timezone
 
-from .models import User
-from integrations.eventhub.client import EventDTO, publish_event_safe
+from .models import User, Doctor, MedicalRecord, LabFile, RecordShare, RecordAccess
+from .caching import invalidate_group
+from .permissions import forget_doctor_patients
+from .outbox import enqueue as enqueue_event
+from integrations.eventhub.client import EventDTO
 
 logger = logging.getLogger(__name__)
 
@@ -16,8 +19,8 @@ def user_registered(sender, instance: User, created: bool, raw: bool = False, **
     """
     Публикуем событие в EventHub при регистрации пользователя (created=True).
     - raw=True (например, loaddata) игнорируем
-    - публикуем ПОСЛЕ коммита, чтобы не ловить гонки/откаты
-    - ошибки публикации не пробрасываем
+    - пишем в EventOutbox в транзакции создания; отправка — после коммита
+      из Celery (откат транзакции откатывает и событие)
     """
     print("signal fired")
     if raw or not created:
@@ -55,14 +58,87 @@ def user_registered(sender, instance: User, created: bool, raw: bool = False, **
         },
     )
 
-    # Публикуем только после успешного коммита транзакции создания пользователя
-    def _publish():
-        ok = publish_event_safe(event)
-        if not ok:
-            logger.warning("User registration event not published (EventHub down?) user_id=%s", instance.id)
+    # В outbox — в той же транзакции, что и создание пользователя: событие не
+    # потеряется при недоступном EventHub, а запрос не ждёт RPC (отправляет
+    # Celery-задача relay_event_outbox после коммита)
+    enqueue_event(event)
 
-    try:
-        transaction.on_commit(_publish)
-    except Exception as exc:
-        # не ломаем основной флоу
-        logger.warning("user_registered handler failed: %s", exc)
+
+# ---------- RecordAccess ----------------------------------------------------
+# поля, от которых зависит, кто видит запись; bulk_create()/update() сюда
+# не приходят — их пересчитывает MedicalRecordQuerySet
+_RECORD_ACCESS_FIELDS = {'owner_primary', 'owner_second', 'patient'}
+
+
+@receiver(post_save, sender=MedicalRecord)
+def record_saved(sender, instance: MedicalRecord, created: bool, raw: bool = False, update_fields=None, **kwargs):
+    """Создание записи или смена владельцев/пациента → пересчитать RecordAccess."""
+    if raw:
+        return
+    if created or update_fields is None or _RECORD_ACCESS_FIELDS & set(update_fields):
+        RecordAccess.objects.sync([instance.pk])
+
+
+@receiver(post_save, sender=RecordShare)
+def record_share_saved(sender, instance: RecordShare, raw: bool = False, update_fields=None, **kwargs):
+    """accept()/decline() и прочие смены статуса шаринга."""
+    if raw:
+        return
+    if update_fields is None or 'status' in update_fields:
+        RecordAccess.objects.sync([instance.record_id])
+
+
+@receiver(post_delete, sender=RecordShare)
+def record_share_deleted(sender, instance: RecordShare, **kwargs):
+    RecordAccess.objects.sync([instance.record_id])
+
+
+# ---------- Doctor.patients ---------------------------------------------------
+@receiver(m2m_changed, sender=Doctor.patients.through)
+def doctor_patients_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    """
+    Сбрасываем кэш doctor_has_patient для затронутых пар. doctor.patients.add(...)
+    и patient.doctors.add(...) приходят сюда же (reverse=True — instance пациент).
+    Для clear() состав ещё известен только в pre_clear.
+    """
+    if action == 'pre_clear':
+        related = instance.doctors if reverse else instance.patients
+        pk_set = set(related.values_list('pk', flat=True))
+    elif action not in ('post_add', 'post_remove'):
+        return
+
+    pairs = [(pk, instance.pk) if reverse else (instance.pk, pk) for pk in pk_set or ()]
+    if pairs:
+        # после коммита: иначе параллельный запрос успеет закэшировать старый ответ
+        transaction.on_commit(lambda: forget_doctor_patients(pairs))
+
+
+# ---------- кэш справочника докторов (DoctorListAPIView) ----------------------
+@receiver(post_save, sender=Doctor)
+@receiver(post_delete, sender=Doctor)
+def doctor_changed(sender, instance: Doctor, raw: bool = False, **kwargs):
+    if not raw:
+        invalidate_group('doctors')
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def doctor_user_changed(sender, instance: User, raw: bool = False, update_fields=None, **kwargs):
+    """
+    В списке докторов есть поля User — сбрасываем, если это доктор. Решаем
+    по роли, без запроса к Doctor: сигнал приходит на каждое сохранение User.
+    Смена роли с доктора на другую сама сбрасывает кэш (role в update_fields).
+    """
+    if raw or (update_fields and set(update_fields) <= {'last_login', 'password'}):
+        return
+    if instance.role == 'doctor' or (update_fields and 'role' in update_fields):
+        invalidate_group('doctors')
+
+
+# ---------- MedicalRecord.updated_at ------------------------------------------
+@receiver(post_save, sender=LabFile)
+@receiver(post_delete, sender=LabFile)
+def lab_file_changed(sender, instance: LabFile, raw: bool = False, **kwargs):
+    """Файлы — часть ответа по записи: сдвигаем её updated_at (и ETag)."""
+    if not raw:
+        MedicalRecord.objects.filter(pk=instance.record_id).update(updated_at=timezone.now())
@@ -1,158 +1,437 @@
+import heapq
+import math
 import os
 import zipfile
-import tempfile
 from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from itertools import chain
 
-from celery import shared_task
-from django.db import transaction
+from celery import shared_task, chord
+from celery.utils import uuid
+from django.conf import settings
+from django.db import DatabaseError, transaction
 from django.utils import timezone
 from django.core.files import File as DjangoFile
 
 from .models import ArchiveJob, Patient, MedicalRecord, LabFile
-from .utils import decode_filename, extract_fio, extract_dob, extract_phone, extract_email
+from .outbox import relay_batch
+from .progress import JobProgress, log_event, publish_status
+from .utils import decode_filename, detect_encoding, extract_entities
+
+
+ENTITY_KEYS = ('fios', 'dobs', 'phones', 'emails')
+
+# бит 11 general purpose flag: имя файла в архиве записано в UTF-8
+_ZIP_UTF8_FLAG = 0x800
+
+
+def _archive_members(zf: zipfile.ZipFile) -> list[tuple[zipfile.ZipInfo, str]]:
+    """
+    Файлы архива (каталоги пропускаем) вместе с декодированным именем файла.
+    Всё берётся из central directory — содержимое архива здесь не читается.
+    """
+    infos = [info for info in zf.infolist() if not info.is_dir()]
+    # имена без UTF-8 флага zipfile читает как cp437 — настоящую кодировку
+    # определяем один раз на весь архив
+    encoding = detect_encoding(
+        info.filename for info in infos if not info.flag_bits & _ZIP_UTF8_FLAG
+    )
+
+    members = []
+    for info in infos:
+        # нужен только сам файл: путь из архива наружу не попадает (zip-slip),
+        # а общие префиксы каталогов не приходится декодировать
+        fname = os.path.basename(info.filename.replace('\\', '/'))
+        if fname and not info.flag_bits & _ZIP_UTF8_FLAG:
+            fname = decode_filename(fname, encoding)
+        if fname:
+            members.append((info, fname))
+    return members
+
+
+def _file_type(fname: str) -> str:
+    return 'photo' if fname.lower().endswith(('.png', '.jpg', '.jpeg')) else 'ct_scan'
+
+
+def _member_file(zf: zipfile.ZipFile, info: zipfile.ZipInfo, fname: str) -> DjangoFile:
+    """
+    Файл архива как поток для storage: распаковка идёт по ходу записи.
+    Размер известен из central directory — иначе File.size начнёт
+    перематывать ZipExtFile, т.е. распаковывать файл лишний раз.
+    """
+    df = DjangoFile(zf.open(info), name=fname)
+    df.size = info.file_size
+    return df
+
+
+def _extract_entities(fname: str) -> dict[str, list[str]]:
+    name_only, _ = os.path.splitext(fname)
+    return extract_entities(name_only)
+
+
+def _merge_entities(found_list) -> dict[str, list[str]]:
+    merged = {key: [] for key in ENTITY_KEYS}
+    for found in found_list:
+        for key in ENTITY_KEYS:
+            merged[key].extend(found[key])
+    return merged
+
+
+def _store_member(zf: zipfile.ZipFile, info: zipfile.ZipInfo, fname: str, saved: list) -> str:
+    """
+    Пишет файл архива в storage поля LabFile.file и возвращает имя в storage.
+    Имя сразу добавляется в saved (список вызывающего) — чтобы при ошибке
+    на любом файле удалить всё, что уже записано. БД не трогает, поэтому
+    безопасно вызывается из потоков пула (list.append атомарен).
+    """
+    field = LabFile._meta.get_field('file')
+    name = field.generate_filename(None, fname)
+    with _member_file(zf, info, fname) as df:
+        name = field.storage.save(name, df, max_length=field.max_length)
+    saved.append(name)
+    return name
+
+
+def _delete_stored(names) -> None:
+    storage = LabFile._meta.get_field('file').storage
+    for name in names:
+        try:
+            storage.delete(name)
+        except Exception:
+            pass
+
+
+def _map_members(fn, items: list, on_done=None) -> list:
+    """
+    map() по файлам архива. При ARCHIVE_WORKERS > 1 — в ограниченном пуле
+    потоков: распаковка (zlib) и запись в storage отпускают GIL.
+    Порядок результатов всегда совпадает с порядком items.
+    on_done(item) вызывается по готовности каждого элемента в вызывающем
+    потоке (туда, например, пишется прогресс — БД из потоков пула не трогаем).
+    """
+    workers = int(getattr(settings, 'ARCHIVE_WORKERS', 1))
+    if workers <= 1 or len(items) < 2:
+        results = map(fn, items)
+        pool = None
+    else:
+        pool = ThreadPoolExecutor(max_workers=min(workers, len(items)))
+        results = pool.map(fn, items)
+
+    try:
+        out = []
+        for item, result in zip(items, results):
+            out.append(result)
+            if on_done:
+                on_done(item)
+        return out
+    finally:
+        if pool:
+            # после ошибки ещё не начатые элементы не запускаем; уже
+            # начатые дорабатывают — их результат виден вызывающему
+            pool.shutdown(cancel_futures=True)
+
+
+def _split_chunks(sizes: list[int], chunk_bytes: int) -> list[list[int]]:
+    """
+    Делит файлы архива на куски примерно равного объёма: жадно кладём
+    самый большой из оставшихся файлов в самый лёгкий кусок.
+    Возвращает индексы файлов каждого куска.
+    """
+    total = sum(sizes)
+    count = max(1, min(len(sizes), math.ceil(total / max(chunk_bytes, 1))))
+    loads = [(0, n) for n in range(count)]
+    chunks = [[] for _ in range(count)]
+    for idx in sorted(range(len(sizes)), key=lambda i: sizes[i], reverse=True):
+        load, n = heapq.heappop(loads)
+        chunks[n].append(idx)
+        heapq.heappush(loads, (load + sizes[idx], n))
+    return [sorted(chunk) for chunk in chunks if chunk]
+
+
+# ---------- шаги обработки ArchiveJob ----------------------------------------
+def _log(job: ArchiveJob, line: str, *fields: str) -> None:
+    """Строка лога — отдельным INSERT; fields — изменённые поля job, если есть."""
+    if fields:
+        job.save(update_fields=list(fields))
+    log_event(job, line)
+    if 'status' in fields:
+        publish_status(job)
+
+
+def _store_members(zf: zipfile.ZipFile, members: list, progress: JobProgress, saved: list) -> list[str]:
+    """
+    Имена в storage в порядке members. saved — список вызывающего, в него
+    попадает каждый записанный файл, даже если дальше случилась ошибка.
+    """
+    stored = _map_members(
+        lambda member: _store_member(zf, *member, saved),
+        members,
+        on_done=lambda member: progress.advance(1, member[0].file_size),
+    )
+    progress.flush()
+    return stored
+
+
+def _finish(job: ArchiveJob, status: str, line: str) -> None:
+    job.status = status
+    job.completed_at = timezone.now()
+    _log(job, line, 'status', 'completed_at')
+
+
+def _save_extracted(job: ArchiveJob, extracted: dict[str, list[str]]) -> None:
+    job.raw_extracted = extracted
+    _log(
+        job,
+        f'Extracted {len(extracted["fios"])} fio(s), '
+        f'{len(extracted["dobs"])} date(s), '
+        f'{len(extracted["phones"])} phone(s), '
+        f'{len(extracted["emails"])} email(s)',
+        'raw_extracted',
+    )
+
+
+def _choose_patient(job: ArchiveJob, fios: list[str]) -> Patient:
+    """Самое частое ФИО → Patient (находим или создаём) и привязка к доктору."""
+    fio = Counter(fios).most_common(1)[0][0]
+    parts = fio.split()
+    patient = Patient.objects.filter(
+        last_name__iexact=parts[0] if parts else '',
+        first_name__iexact=parts[1] if len(parts) > 1 else ''
+    ).first()
+    if not patient:
+        patient = Patient.objects.create(
+            last_name=parts[0] if parts else '',
+            first_name=parts[1] if len(parts) > 1 else '',
+            middle_name=parts[2] if len(parts) > 2 else None,
+        )
+    _log(job, f'Patient chosen: {fio}')
+
+    # Привязываем пациента к доктору (uploaded_by → doctor_profile)
+    doctor = getattr(job.uploaded_by, 'doctor_profile', None)
+    if doctor:
+        patient.doctors.add(doctor)
+        _log(job, f'Patient linked to Doctor #{doctor.id}')
+    return patient
+
+
+def _create_record(job: ArchiveJob, patient: Patient, files: list[tuple[str, str]]) -> MedicalRecord:
+    """
+    MedicalRecord + LabFile для уже записанных в storage файлов.
+    files — пары (имя в storage, исходное имя файла).
+    Файлового I/O внутри транзакции нет: только INSERT записи и bulk_create
+    строк LabFile пачками по ARCHIVE_BULK_BATCH_SIZE.
+    """
+    batch_size = int(getattr(settings, 'ARCHIVE_BULK_BATCH_SIZE', 500))
+    with transaction.atomic():
+        record = MedicalRecord.objects.create(
+            patient=patient,
+            doctor=getattr(job.uploaded_by, 'doctor_profile', None),
+            owner_primary=job.uploaded_by,
+            appointment_location='',
+            notes='',
+            visit_date=None,
+        )
+        LabFile.objects.bulk_create(
+            (
+                LabFile(
+                    record=record,
+                    file=name,
+                    file_type=_file_type(fname),
+                    uploaded_by=job.uploaded_by,
+                )
+                for name, fname in files
+            ),
+            batch_size=batch_size,
+        )
+
+        job.record = record
+        _log(job, f'Created record #{record.id} with {len(files)} files', 'record')
+    return record
+
+
+def _fan_out(job: ArchiveJob, members: list[tuple[zipfile.ZipInfo, str]]) -> bool:
+    """
+    Большой архив раздаём воркерам Celery: group из process_zip_chunk
+    по кускам примерно равного объёма + chord-колбэк finalize_zip_task.
+    Возвращает True, если задача ушла в раздачу.
+    """
+    min_bytes = int(getattr(settings, 'ARCHIVE_FANOUT_MIN_BYTES', 0))
+    sizes = [info.file_size for info, _ in members]
+    total = sum(sizes)
+    if not min_bytes or total < min_bytes:
+        return False
+
+    chunks = _split_chunks(sizes, int(getattr(settings, 'ARCHIVE_CHUNK_BYTES', min_bytes)))
+    if len(chunks) < 2:
+        return False
+
+    _log(job, f'Archive of {total} bytes split into {len(chunks)} chunk(s)')
+    JobProgress(job).set_phase('storing')
+    # id кусков задаём заранее: упадёт любой кусок — finalize не запустится,
+    # и файлы уже отработавших кусков по этим id удаляет cleanup_zip_chunks
+    chunk_ids = [uuid() for _ in chunks]
+    chord(
+        process_zip_chunk.s(job.id, indices).set(task_id=chunk_id)
+        for indices, chunk_id in zip(chunks, chunk_ids)
+    )(
+        finalize_zip_task.s(job.id).on_error(cleanup_zip_chunks.s(job.id, chunk_ids))
+    )
+    return True
 
 
 @shared_task(bind=True)
 def process_zip_task(self, job_id):
     print("Begining of celery working!!")
     job = ArchiveJob.objects.get(pk=job_id)
+    progress = JobProgress(job)
     # 1) Помечаем начало обработки
     job.status = 'processing'
-    job.log = (job.log or '') + 'Start processing\n'
-    job.save(update_fields=['status', 'log'])
+    _log(job, 'Start processing', 'status')
+    progress.set_phase('indexing')
 
-    tmpdir = tempfile.mkdtemp()
+    saved = []  # всё, что уже записано в storage, — удалить при ошибке
     try:
-        # 2) Распаковка архива с декодом имён и безопасным извлечением
+        # 2) Архив не распаковываем во временный каталог: имена берём
+        #    из central directory, а содержимое каждого файла один раз
+        #    стримим прямо в storage (шаг 6)
         with zipfile.ZipFile(job.archive_file.path, 'r') as zf:
-            for info in zf.infolist():
-                try:
-                    decoded = decode_filename(info.filename)
-                except Exception:
-                    decoded = info.filename
-
-                dest_path = os.path.abspath(os.path.join(tmpdir, decoded))
-                if not dest_path.startswith(os.path.abspath(tmpdir)):
-                    continue
-
-                os.makedirs(os.path.dirname(dest_path), exist_ok=True)
-                zf.extract(info, tmpdir)
-
-                # переименовываем, если zf.extract сохранил старое имя
-                orig = os.path.join(tmpdir, info.filename)
-                if os.path.exists(orig) and orig != dest_path:
-                    os.replace(orig, dest_path)
-
-        # 3) Сбор «сырых» данных из имён файлов
-        all_fios, all_dobs, all_phones, all_emails = [], [], [], []
-        file_count = 0
-        for root, _, files in os.walk(tmpdir):
-            for fname in files:
-                file_count += 1
-                name_only, _ = os.path.splitext(fname)
-                all_fios.extend(extract_fio(name_only))
-                all_dobs.extend(extract_dob(name_only))
-                all_phones.extend(extract_phone(name_only))
-                all_emails.extend(extract_email(name_only))
-
-        # 4) Сохраняем raw_extracted и логируем
-        job.raw_extracted = {
-            'fios':   all_fios,
-            'dobs':   all_dobs,
-            'phones': all_phones,
-            'emails': all_emails,
-        }
-        job.log += (
-            f'Extracted {len(all_fios)} fio(s), '
-            f'{len(all_dobs)} date(s), '
-            f'{len(all_phones)} phone(s), '
-            f'{len(all_emails)} email(s)\n'
-        )
-        job.save(update_fields=['raw_extracted', 'log'])
-
-        # Если ФИО нет — сразу завершаем задачку с ошибкой,
-        # MedicalRecord не создаём
-        if not all_fios:
-            job.status = 'failed'
-            job.completed_at = timezone.now()
-            job.log += 'No FIO found; aborting processing\n'
-            job.save(update_fields=['status', 'completed_at', 'log'])
-            return
+            members = _archive_members(zf)
+            job.members_total = len(members)
+            job.bytes_total = sum(info.file_size for info, _ in members)
+            job.save(update_fields=['members_total', 'bytes_total'])
 
-        # 5) Выбор самого частого ФИО → Patient и привязка к доктору
-        main = Counter(all_fios).most_common(1)
-        patient = None
-        if main:
-            fio = main[0][0]
-            parts = fio.split()
-            patient = Patient.objects.filter(
-                last_name__iexact=parts[0] if parts else '',
-                first_name__iexact=parts[1] if len(parts) > 1 else ''
-            ).first()
-            if not patient:
-                patient = Patient.objects.create(
-                    last_name=parts[0] if parts else '',
-                    first_name=parts[1] if len(parts) > 1 else '',
-                    middle_name=parts[2] if len(parts) > 2 else None,
-                )
-            job.log += f'Patient chosen: {fio}\n'
-            job.save(update_fields=['log'])
-
-            # Привязываем пациента к доктору (uploaded_by → doctor_profile)
-            doctor = getattr(job.uploaded_by, 'doctor_profile', None)
-            if doctor:
-                patient.doctors.add(doctor)
-                job.log += f'Patient linked to Doctor #{doctor.id}\n'
-                job.save(update_fields=['log'])
-        else:
-            job.log += 'No FIO found; patient not set\n'
-            job.save(update_fields=['log'])
-
-        # 6) Создание MedicalRecord + LabFile
-        with transaction.atomic():
-            record = MedicalRecord.objects.create(
-                patient=patient,
-                doctor=getattr(job.uploaded_by, 'doctor_profile', None),
-                created_by=job.uploaded_by,
-                appointment_location='',
-                notes='',
-                visit_date=None,
+            # большой архив — по кускам на разные воркеры
+            if _fan_out(job, members):
+                return
+
+            # 3) Сбор «сырых» данных из имён файлов
+            progress.set_phase('extracting')
+            extracted = _merge_entities(
+                _map_members(_extract_entities, [fname for _, fname in members])
             )
-            created_files = 0
-            for root, _, files in os.walk(tmpdir):
-                for fname in files:
-                    path = os.path.join(root, fname)
-                    ftype = 'photo' if fname.lower().endswith(('.png', '.jpg', '.jpeg')) else 'ct_scan'
-                    with open(path, 'rb') as f:
-                        df = DjangoFile(f)
-                        lab = LabFile.objects.create(
-                            record=record,
-                            file_type=ftype,
-                            uploaded_by=job.uploaded_by,
-                        )
-                        lab.file.save(fname, df, save=True)
-                        created_files += 1
-
-            job.record = record
-            job.log += f'Created record #{record.id} with {created_files} files\n'
-            job.save(update_fields=['record', 'log'])
+
+            # 4) Сохраняем raw_extracted и логируем
+            _save_extracted(job, extracted)
+
+            # Если ФИО нет — сразу завершаем задачку с ошибкой,
+            # MedicalRecord не создаём
+            if not extracted['fios']:
+                _finish(job, 'failed', 'No FIO found; aborting processing')
+                return
+
+            # 5) Выбор самого частого ФИО → Patient и привязка к доктору
+            patient = _choose_patient(job, extracted['fios'])
+
+            # 6) Файлы: каждый читается из архива ровно один раз и сразу
+            #    пишется в storage
+            progress.set_phase('storing')
+            stored = _store_members(zf, members, progress, saved)
+
+        # MedicalRecord + LabFile
+        progress.set_phase('saving')
+        _create_record(job, patient, list(zip(stored, (fname for _, fname in members))))
 
         # 7) Завершение задачи успешно
-        job.status = 'done'
-        job.completed_at = timezone.now()
-        job.log += 'Processing finished successfully\n'
-        job.save(update_fields=['status', 'completed_at', 'log'])
+        _finish(job, 'done', 'Processing finished successfully')
 
     except Exception as e:
-        job.status = 'failed'
-        job.completed_at = timezone.now()
-        job.log += f'Error: {str(e)}\n'
-        job.save(update_fields=['status', 'completed_at', 'log'])
+        _delete_stored(saved)
+        _finish(job, 'failed', f'Error: {str(e)}')
         raise
 
-    finally:
-        try:
-            import shutil
-            shutil.rmtree(tmpdir)
-        except Exception:
-            pass
+
+@shared_task(bind=True)
+def process_zip_chunk(self, job_id, indices):
+    """
+    Кусок большого архива: разбор имён и запись файлов в storage.
+    Возвращает по файлу: индекс в архиве, имя, имя в storage, найденные данные.
+    """
+    job = ArchiveJob.objects.get(pk=job_id)
+    saved = []
+    try:
+        with zipfile.ZipFile(job.archive_file.path, 'r') as zf:
+            members = _archive_members(zf)
+            chunk = [members[i] for i in indices]
+            found = _map_members(_extract_entities, [fname for _, fname in chunk])
+            stored = _store_members(zf, chunk, JobProgress(job), saved)
+    except Exception as e:
+        _delete_stored(saved)
+        _finish(job, 'failed', f'Error: {str(e)}')
+        raise
+
+    # соседний кусок уже упал: finalize не будет, а cleanup_zip_chunks
+    # мог отработать раньше, чем появился наш результат
+    if ArchiveJob.objects.filter(pk=job_id, status='failed').exists():
+        _delete_stored(saved)
+        return []
+
+    return [
+        {'index': i, 'name': fname, 'stored': name, 'found': f}
+        for i, (_, fname), name, f in zip(indices, chunk, stored, found)
+    ]
+
+
+@shared_task(bind=True)
+def finalize_zip_task(self, chunk_results, job_id):
+    """
+    chord-колбэк раздачи: собирает результаты кусков в порядке файлов
+    архива, выбирает пациента и создаёт MedicalRecord.
+    """
+    job = ArchiveJob.objects.get(pk=job_id)
+    results = sorted(chain.from_iterable(chunk_results), key=lambda r: r['index'])
+    stored = [r['stored'] for r in results]
+    try:
+        extracted = _merge_entities(r['found'] for r in results)
+        _save_extracted(job, extracted)
+
+        if not extracted['fios']:
+            _delete_stored(stored)
+            _finish(job, 'failed', 'No FIO found; aborting processing')
+            return
+
+        patient = _choose_patient(job, extracted['fios'])
+        JobProgress(job).set_phase('saving')
+        _create_record(job, patient, [(r['stored'], r['name']) for r in results])
+        _finish(job, 'done', 'Processing finished successfully')
+
+    except Exception as e:
+        _delete_stored(stored)
+        _finish(job, 'failed', f'Error: {str(e)}')
+        raise
+
+
+@shared_task
+def cleanup_zip_chunks(request, exc, traceback, job_id, chunk_ids):
+    """
+    errback chord'а раздачи: кусок упал, finalize_zip_task не запустится —
+    удаляем файлы, которые успели записать успешные куски. Упавший кусок
+    свои файлы удалил сам.
+    """
+    for chunk_id in chunk_ids:
+        result = process_zip_chunk.AsyncResult(chunk_id)
+        if result.successful():
+            _delete_stored(r['stored'] for r in result.result)
+
+    job = ArchiveJob.objects.get(pk=job_id)
+    if job.status != 'failed':
+        _finish(job, 'failed', f'Error: {exc}')
+
+
+@shared_task(ignore_result=True, autoretry_for=(DatabaseError,), retry_backoff=True, max_retries=5)
+def relay_event_outbox():
+    """
+    Досылает EventOutbox в EventHub пачками. Запускается после коммита
+    каждой записи в outbox и периодически (CELERY_BEAT_SCHEDULE) — для
+    строк, отложенных с задержкой после ошибки.
+    """
+    if not getattr(settings, 'EVENTHUB_ENABLED', True):
+        return
+
+    batch_size = int(getattr(settings, 'EVENTHUB_OUTBOX_BATCH_SIZE', 200))
+    for _ in range(int(getattr(settings, 'EVENTHUB_OUTBOX_MAX_BATCHES', 50))):
+        sent, postponed = relay_batch(batch_size)
+        if sent + postponed < batch_size or not sent:
+            # очередь пуста или EventHub не принимает — ждём следующего запуска
+            return
+    # за один запуск не разобрали — продолжаем отдельной задачей
+    relay_event_outbox.delay()
@@ -1,3 +1,1200 @@
-from django.test import TestCase
+import asyncio
+import io
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import zipfile
+from concurrent import futures
+from datetime import date, datetime
+from itertools import chain
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings as django_settings
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+from django.db import connection
+from django.db.models import F
+from django.utils import timezone
+from django.utils.safestring import mark_safe
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework import generics
+from rest_framework.test import APITestCase
+from rest_framework_simplejwt.tokens import AccessToken
+
+import grpc
+from asgiref.sync import async_to_sync
+from eventhub.v1 import events_pb2, events_pb2_grpc
+from integrations.eventhub import aio as eventhub_aio, channel
+from integrations.eventhub.client import (
+    EventDTO, _to_pb_event, publish_event, publish_events,
+)
+
+from .caching import ConditionalRetrieveMixin
+from .management.commands.bench_eventhub_encode import _legacy_to_pb_event, synthetic_events
+from .management.commands.import_profile import TARGETS as IMPORT_TARGETS, profile_imports
+from .models import (
+    ArchiveJob, User, Patient, Doctor, MedicalRecord, LabFile, RecordShare, RecordAccess, ShareRequest, EventOutbox,
+)
+from .tasks import (
+    _archive_members, _split_chunks, cleanup_zip_chunks, finalize_zip_task, process_zip_chunk, process_zip_task,
+)
+from .utils import (
+    _parse_date, decode_filename, detect_encoding, extract_dob, extract_email, extract_entities, extract_fio,
+    extract_phone, match_entities,
+)
+from .outbox import _claim, _wake_relay, enqueue, relay_batch
+from .progress import FINAL_STATUSES, JobProgress, stream_job_events
+
+
+class PatientListQueryCountTests(APITestCase):
+    """record_count / last_visit не должны давать запросов на каждого пациента."""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='doc', password='x', role='doctor')
+        self.doctor = Doctor.objects.create(user=self.user, first_name='Иван', last_name='Петров')
+        self.client.force_authenticate(self.user)
+
+    def add_patients(self, count):
+        for i in range(count):
+            patient = Patient.objects.create(first_name=f'Пациент{i}', last_name='Тестов')
+            self.doctor.patients.add(patient)
+            for day in (1, 2):
+                MedicalRecord.objects.create(
+                    patient=patient, doctor=self.doctor, owner_primary=self.user,
+                    visit_date=date(2024, 1, day),
+                )
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(ctx), response.data
+
+    def test_constant_queries(self):
+        for url in ('/api/patients/', f'/api/doctors/{self.doctor.id}/patients/'):
+            with self.subTest(url=url):
+                self.add_patients(2)
+                small, _ = self.count_queries(url)
+                self.add_patients(20)
+                large, data = self.count_queries(url)
+                self.assertEqual(small, large)
+                self.assertEqual(data['results'][0]['record_count'], 2)
+                self.assertEqual(data['results'][0]['last_visit'], date(2024, 1, 2))
+
+    def test_detail(self):
+        self.add_patients(1)
+        patient = self.doctor.patients.get()
+        response = self.client.get(f'/api/patients/{patient.id}/')
+        self.assertEqual(response.data['record_count'], 2)
+        self.assertEqual(response.data['last_visit'], date(2024, 1, 2))
+
+
+class RecordListQueryCountTests(APITestCase):
+    """doctor.user и files записей грузятся пачкой (EagerLoadingMixin), а не на каждую запись."""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='admin', password='x', role='admin')
+        self.client.force_authenticate(self.user)
+        self.patient = Patient.objects.create(first_name='Анна', last_name='Иванова')
+
+    def add_records(self, count):
+        for i in range(count):
+            username = f'doc{MedicalRecord.objects.count()}'
+            user = User.objects.create_user(username=username, email=f'{username}@example.com', role='doctor')
+            doctor = Doctor.objects.create(user=user, first_name='Иван', last_name='Петров')
+            record = MedicalRecord.objects.create(patient=self.patient, doctor=doctor, owner_primary=self.user)
+            LabFile.objects.create(record=record, file_type='photo', file='records/a.jpg')
+            LabFile.objects.create(record=record, file_type='photo', file='records/b.jpg')
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(ctx), response.data
+
+    def test_constant_queries(self):
+        url = f'/api/patients/{self.patient.id}/records/'
+        self.add_records(2)
+        small, _ = self.count_queries(url)
+        self.add_records(20)
+        large, data = self.count_queries(url)
+        self.assertEqual(small, large)
+        self.assertEqual(len(data['results'][0]['lab_files']), 2)
+        self.assertEqual(data['results'][0]['doctor']['full_name'], 'Петров Иван')
+
+    def test_detail(self):
+        self.add_records(1)
+        record = MedicalRecord.objects.get()
+        queries, data = self.count_queries(f'/api/patients/{self.patient.id}/records/{record.id}/')
+        self.assertEqual(len(data['lab_files']), 2)
+        # patient, запись с doctor и user одним JOIN'ом, файлы
+        self.assertEqual(queries, 3)
+
+
+class KeysetPaginationTests(APITestCase):
+    """Проход по страницам вперёд и назад даёт ровно весь список, без дублей."""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='doc', password='x', role='doctor')
+        self.client.force_authenticate(self.user)
+        self.patient = Patient.objects.create(first_name='Анна', last_name='Иванова')
+        # одинаковые даты и NULL в visit_date — самый неудобный случай для курсора
+        for i in range(23):
+            MedicalRecord.objects.create(
+                patient=self.patient, owner_primary=self.user,
+                visit_date=None if i % 5 == 0 else date(2024, 1, 1 + i % 3),
+            )
+        self.url = f'/api/patients/{self.patient.id}/records/?page_size=4'
+
+    def walk(self, url, link):
+        ids = []
+        while url:
+            data = self.client.get(url).data
+            ids.append([r['id'] for r in data['results']])
+            url = data[link]
+        return ids
+
+    def test_forward_and_back(self):
+        expected = list(
+            MedicalRecord.objects.filter(patient=self.patient)
+            .order_by(F('visit_date').desc(nulls_first=True), '-created_at', '-id')
+            .values_list('id', flat=True)
+        )
+        pages = self.walk(self.url, 'next')
+        self.assertEqual([i for page in pages for i in page], expected)
+        self.assertEqual(len(pages), 6)
+
+        last_page_url = self.client.get(self.url).data['next']
+        while True:
+            data = self.client.get(last_page_url).data
+            if not data['next']:
+                break
+            last_page_url = data['next']
+        back = self.walk(last_page_url, 'previous')
+        self.assertEqual(back[::-1], pages)
+
+    def test_invalid_cursor(self):
+        self.assertEqual(self.client.get(self.url + '&cursor=bad').status_code, 404)
+
+
+class RecordAccessTests(APITestCase):
+    """RecordAccess следует за созданием записи и ответами на шаринг."""
+
+    def setUp(self):
+        self.owner = User.objects.create_user(username='doc', email='doc@example.com', role='doctor')
+        self.colleague = User.objects.create_user(username='doc2', email='doc2@example.com', role='doctor')
+        self.patient = Patient.objects.create(first_name='Анна', last_name='Иванова')
+        self.record = MedicalRecord.objects.create(patient=self.patient, owner_primary=self.owner)
+        self.url = f'/api/patients/{self.patient.id}/records/'
+
+    def visible_to(self, user):
+        self.client.force_authenticate(user)
+        return [r['id'] for r in self.client.get(self.url).data['results']]
+
+    def test_share_lifecycle(self):
+        self.assertEqual(self.visible_to(self.owner), [self.record.id])
+        self.assertEqual(self.visible_to(self.colleague), [])
+
+        share = RecordShare.objects.create(record=self.record, to_user=self.colleague)
+        self.assertEqual(self.visible_to(self.colleague), [])
+        share.accept()
+        self.assertEqual(self.visible_to(self.colleague), [self.record.id])
+        share.decline()
+        self.assertEqual(self.visible_to(self.colleague), [])
+        self.assertEqual(RecordAccess.objects.diff([self.record.id]), (set(), []))
+
+    def test_bulk_create_and_update(self):
+        records = MedicalRecord.objects.bulk_create(
+            MedicalRecord(patient=self.patient, owner_primary=self.owner) for _ in range(3)
+        )
+        ids = [r.id for r in records]
+        self.assertEqual(RecordAccess.objects.diff(ids), (set(), []))
+        self.assertCountEqual(self.visible_to(self.owner), ids + [self.record.id])
+
+        MedicalRecord.objects.filter(pk__in=ids[:2]).update(owner_second=self.colleague)
+        self.assertCountEqual(self.visible_to(self.colleague), ids[:2])
+        MedicalRecord.objects.filter(pk__in=ids).update(owner_primary=self.colleague, owner_second=None)
+        self.assertEqual(self.visible_to(self.owner), [self.record.id])
+        self.assertEqual(RecordAccess.objects.diff(ids), (set(), []))
+
+    def test_pending_share_detail(self):
+        """Ещё не принятый шаринг доктор видит сразу; пациенту чужая запись не видна и после принятия."""
+        url = f'/api/patients/{self.patient.id}/records/{self.record.id}/'
+        share = RecordShare.objects.create(record=self.record, to_user=self.colleague)
+        self.client.force_authenticate(self.colleague)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.client.get(url).status_code, 200)
+        self.assertFalse([q['sql'] for q in queries if 'DISTINCT' in q['sql']])
+        share.accept()
+        self.assertEqual(self.client.get(url).status_code, 200)
+        share.decline()
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+        patient_user = User.objects.create_user(username='pat', email='pat@example.com', role='patient')
+        share = RecordShare.objects.create(record=self.record, to_user=patient_user)
+        self.client.force_authenticate(patient_user)
+        self.assertEqual(self.client.get(url).status_code, 404)
+        share.accept()
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+        self.patient.user = patient_user
+        self.patient.save(update_fields=['user'])
+        self.assertEqual(self.client.get(url).status_code, 200)
+
+
+class PatientAccessCacheTests(APITestCase):
+    """Карточка пациента для доктора: EXISTS + кэш, сброс при изменении Doctor.patients."""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='doc', email='doc@example.com', role='doctor')
+        self.doctor = Doctor.objects.create(user=self.user, first_name='Иван', last_name='Петров')
+        self.patient = Patient.objects.create(first_name='Анна', last_name='Иванова')
+        self.client.force_authenticate(self.user)
+        self.url = f'/api/patients/{self.patient.id}/'
+
+    def test_membership_changes(self):
+        self.assertEqual(self.client.get(self.url).status_code, 403)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.patient.doctors.add(self.doctor)
+        self.assertEqual(self.client.get(self.url).status_code, 200)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.doctor.patients.clear()
+        self.assertEqual(self.client.get(self.url).status_code, 403)
+
+    def test_cached(self):
+        self.doctor.patients.add(self.patient)
+        self.client.get(self.url)
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertEqual(self.client.get(self.url).status_code, 200)
+        self.assertFalse(any('main_doctor_patients' in q['sql'] for q in ctx.captured_queries))
+
+
+class DoctorListCacheTests(APITestCase):
+    """Список докторов из кэша, ETag/304, сброс при изменении Doctor/User."""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='doc', email='doc@example.com', role='doctor')
+        self.doctor = Doctor.objects.create(user=self.user, first_name='Иван', last_name='Петров')
+        self.client.force_authenticate(self.user)
+
+    def test_cache_and_etag(self):
+        first = self.client.get('/api/doctors/')
+        etag = first['ETag']
+
+        with CaptureQueriesContext(connection) as ctx:
+            second = self.client.get('/api/doctors/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(second.status_code, 304)
+        self.assertFalse(any('main_doctor' in q['sql'] for q in ctx.captured_queries))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.first_name = 'Пётр'
+            self.user.save()
+        third = self.client.get('/api/doctors/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(third.status_code, 200)
+        self.assertNotEqual(third['ETag'], etag)
+        self.assertEqual(third.data['results'][0]['user']['first_name'], 'Пётр')
+
+    def test_non_doctor_save_does_not_query(self):
+        patient = User.objects.create_user(username='pat', email='pat@example.com', role='patient')
+        with self.captureOnCommitCallbacks() as callbacks, self.assertNumQueries(1):
+            patient.first_name = 'Анна'
+            patient.save(update_fields=['first_name'])
+        self.assertEqual(callbacks, [])
+        with self.captureOnCommitCallbacks() as callbacks, self.assertNumQueries(1):
+            self.user.save(update_fields=['last_login'])
+        self.assertEqual(callbacks, [])
+
+
+class ConditionalGetTests(APITestCase):
+    """ETag карточек пациента и записи: 304 без изменений, новый ETag после них."""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='admin', email='admin@example.com', role='admin')
+        self.client.force_authenticate(self.user)
+        self.patient = Patient.objects.create(first_name='Анна', last_name='Иванова')
+        self.record = MedicalRecord.objects.create(patient=self.patient, owner_primary=self.user)
+
+    def assert_revalidates(self, url, change):
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        change()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_patient(self):
+        self.assert_revalidates(
+            f'/api/patients/{self.patient.id}/',
+            lambda: MedicalRecord.objects.create(patient=self.patient, owner_primary=self.user),
+        )
+
+    def test_record(self):
+        self.assert_revalidates(
+            f'/api/patients/{self.patient.id}/records/{self.record.id}/',
+            lambda: LabFile.objects.create(record=self.record, file_type='photo', file='records/a.jpg'),
+        )
+
+    def test_record_doctor(self):
+        doctor_user = User.objects.create_user(username='doc', email='doc@example.com', role='doctor')
+        doctor = Doctor.objects.create(user=doctor_user, first_name='Иван', last_name='Петров')
+        MedicalRecord.objects.filter(pk=self.record.pk).update(doctor=doctor)
+
+        def change():
+            doctor.specialization = 'Кардиолог'
+            doctor.save()
+
+        self.assert_revalidates(f'/api/patients/{self.patient.id}/records/{self.record.id}/', change)
+
+    def test_etag_parts_required(self):
+        class NoEtagView(ConditionalRetrieveMixin, generics.RetrieveAPIView):
+            queryset = Patient.objects.all()
+
+        with self.assertRaises(ImproperlyConfigured):
+            NoEtagView.as_view()
+
+
+class ShareRequestCreateTests(APITestCase):
+    """POST /share-requests/: число запросов не зависит от количества записей."""
+
+    def setUp(self):
+        self.owner = User.objects.create_user(username='doc', email='doc@example.com', role='doctor')
+        self.colleague = User.objects.create_user(username='doc2', email='doc2@example.com', role='doctor')
+        self.patient = Patient.objects.create(first_name='Анна', last_name='Иванова')
+        self.client.force_authenticate(self.owner)
+
+    def share(self, count):
+        # у каждого вызова свой пациент — каждый раз создаётся новый ShareRequest
+        patient = Patient.objects.create(first_name='Пётр', last_name='Петров')
+        records = MedicalRecord.objects.bulk_create(
+            MedicalRecord(patient=patient, owner_primary=self.owner) for _ in range(count)
+        )
+        payload = {
+            'patient_id': patient.id,
+            'to_email': 'DOC2@example.com',
+            'record_ids': [r.id for r in records],
+        }
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.post('/api/share-requests/', payload, format='json')
+        self.assertEqual(response.status_code, 201)
+        return len(ctx)
+
+    def test_query_count_is_constant(self):
+        self.assertEqual(self.share(2), self.share(40))
+        shares = RecordShare.objects.filter(to_user=self.colleague)
+        self.assertEqual(shares.count(), 42)
+        self.assertEqual(ShareRequest.objects.filter(to_user=self.colleague).count(), 2)
+        self.assertEqual(ShareRequest.record_shares.through.objects.count(), 42)
+
+    def test_foreign_records_rejected(self):
+        other = MedicalRecord.objects.create(patient=self.patient, owner_primary=self.colleague)
+        payload = {'patient_id': self.patient.id, 'to_email': 'x@example.com', 'record_ids': [other.id]}
+        self.assertEqual(self.client.post('/api/share-requests/', payload, format='json').status_code, 400)
+        self.assertFalse(RecordShare.objects.exists())
+
+
+class ShareRequestRespondTests(APITestCase):
+    """Ответ на ShareRequest: пачкой, число запросов не зависит от числа записей."""
+
+    def setUp(self):
+        cache.clear()
+        self.doctor = User.objects.create_user(username='doc', email='doc@example.com', role='doctor')
+        self.colleague = User.objects.create_user(username='doc2', email='doc2@example.com', role='doctor')
+        Doctor.objects.create(user=self.doctor, first_name='Иван', last_name='Петров')
+        self.patient_user = User.objects.create_user(username='pat', email='pat@example.com', role='patient')
+
+    def share_request(self, to_user, count):
+        patient = Patient.objects.create(
+            first_name='Анна', last_name='Иванова',
+            user=to_user if to_user.role == 'patient' else None,
+        )
+        records = MedicalRecord.objects.bulk_create(
+            MedicalRecord(patient=patient, owner_primary=self.doctor) for _ in range(count)
+        )
+        shares = RecordShare.objects.bulk_create(RecordShare(record=r, to_user=to_user) for r in records)
+        request = ShareRequest.objects.create(
+            from_user=self.doctor, to_user=to_user, to_email=to_user.email, patient=patient,
+        )
+        request.record_shares.add(*shares)
+        return request
+
+    def respond(self, request, accepted=True):
+        self.client.force_authenticate(request.to_user)
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.post(
+                f'/api/share-requests/{request.id}/respond/', {'accepted': accepted}, format='json'
+            )
+        self.assertEqual(response.status_code, 200)
+        return len(ctx)
+
+    def test_accept_query_count_is_constant(self):
+        self.assertEqual(
+            self.respond(self.share_request(self.colleague, 2)),
+            self.respond(self.share_request(self.colleague, 30)),
+        )
+
+    def test_accept_doctor_to_patient(self):
+        request = self.share_request(self.patient_user, 3)
+        self.respond(request)
+
+        records = MedicalRecord.objects.filter(patient=request.patient)
+        self.assertEqual(set(records.values_list('owner_second', 'visibility')),
+                         {(self.patient_user.id, 'confirmed')})
+        self.assertTrue(self.doctor.doctor_profile.patients.filter(pk=request.patient.pk).exists())
+        self.assertFalse(request.record_shares.exclude(status='accepted').exists())
+        self.assertEqual(RecordAccess.objects.diff(list(records.values_list('id', flat=True))), (set(), []))
+
+    def test_accept_doctor_to_doctor_then_decline(self):
+        request = self.share_request(self.colleague, 3)
+        record_ids = list(request.record_shares.values_list('record_id', flat=True))
+        self.respond(request)
+        self.assertEqual(RecordAccess.objects.filter(user=self.colleague).count(), 3)
+        self.assertEqual(set(MedicalRecord.objects.filter(pk__in=record_ids)
+                             .values_list('owner_second', 'visibility')), {(None, 'shared')})
+
+        # отклонение конверта уже принятые шаринги не отзывает
+        self.respond(request, accepted=False)
+        self.assertEqual(RecordAccess.objects.filter(user=self.colleague).count(), 3)
+
+
+class _EventIngest(events_pb2_grpc.EventIngestServicer):
+    """EventHub в процессе теста: запоминает принятые события и peer'ов."""
+
+    def __init__(self):
+        self.events = []
+        self.peers = set()
+        self.unary_calls = 0
+        self.streams = []
+        self.delay = 0
+        self.in_flight = self.max_in_flight = 0
+        self.lock = threading.Lock()
+
+    def PublishEvent(self, request, context):
+        with self.lock:
+            self.unary_calls += 1
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        time.sleep(self.delay)
+        with self.lock:
+            self.in_flight -= 1
+        self.events.append(request.event)
+        self.peers.add(context.peer())
+        return events_pb2.PublishEventResponse(ok=bool(request.event.tenant_id))
+
+    def PublishEvents(self, request_iterator, context):
+        batch = list(request_iterator)
+        self.streams.append(len(batch))
+        self.events.extend(batch)
+        self.peers.add(context.peer())
+        # события без tenant_id не принимаются
+        failed = [e.id for e in batch if not e.tenant_id]
+        return events_pb2.PublishEventsResponse(accepted=len(batch) - len(failed), failed=len(failed))
+
+
+class EventHubTestCase(SimpleTestCase):
+    def setUp(self):
+        self.servicer = _EventIngest()
+        self.server = grpc.server(futures.ThreadPoolExecutor(max_workers=16))
+        events_pb2_grpc.add_EventIngestServicer_to_server(self.servicer, self.server)
+        port = self.server.add_insecure_port('127.0.0.1:0')
+        self.server.start()
+        self.addCleanup(self.server.stop, None)
+
+        channel.pool.close()
+        self.addCleanup(channel.pool.close)
+        override = override_settings(EVENTHUB_ENABLED=True, EVENTHUB_GRPC_ADDR=f'127.0.0.1:{port}')
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def event(self, n=0):
+        return EventDTO(id=str(n), tenant_id='t', type='test', actor_id=None,
+                        patient_id=None, ts=timezone.make_aware(datetime(2024, 1, 1)), props={'n': n})
+
+
+class EventHubChannelPoolTests(EventHubTestCase):
+    """Один канал на процесс вместо нового соединения на каждое событие."""
+
+    def test_channel_reused(self):
+        for n in range(5):
+            self.assertTrue(publish_event(self.event(n)))
+
+        self.assertEqual([e.id for e in self.servicer.events], ['0', '1', '2', '3', '4'])
+        self.assertEqual(len(self.servicer.peers), 1)  # одно TCP-соединение
+        stats = channel.channel_stats()
+        self.assertEqual((stats['channels'], stats['created'], stats['reused']), (1, 1, 4))
+
+    def test_recreated_after_fork(self):
+        publish_event(self.event())
+        parent_stub = channel.get_stub(django_settings.EVENTHUB_GRPC_ADDR)
+
+        channel.pool._pid = -1  # как будто мы уже в дочернем процессе
+        self.assertTrue(publish_event(self.event(1)))
+        self.assertIsNot(channel.get_stub(django_settings.EVENTHUB_GRPC_ADDR), parent_stub)
+        self.assertEqual(channel.channel_stats()['created'], 1)
+
+    def test_reused_counted_across_threads(self):
+        addr = django_settings.EVENTHUB_GRPC_ADDR
+        threads = [
+            threading.Thread(target=lambda: [channel.get_stub(addr) for _ in range(200)])
+            for _ in range(8)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        stats = channel.channel_stats()
+        self.assertEqual((stats['created'], stats['reused']), (1, 8 * 200 - 1))
+
+    def test_keepalive_options(self):
+        options = dict(channel._channel_options())
+        # не чаще, чем по умолчанию разрешает gRPC-сервер, и без пингов на простое
+        self.assertGreaterEqual(options['grpc.keepalive_time_ms'], 300_000)
+        self.assertEqual(options['grpc.keepalive_permit_without_calls'], 0)
+
+
+class EventHubBatchTests(EventHubTestCase):
+    """publish_events: пачка одним вызовом PublishEvents вместо RPC на событие."""
+
+    def test_one_stream_per_batch(self):
+        bad = self.event(1)
+        bad.tenant_id = ''
+        result = publish_events([self.event(0), bad, self.event(2)])
+        self.assertEqual(self.servicer.streams, [3])
+        self.assertEqual(self.servicer.unary_calls, 0)
+        self.assertEqual((result.sent, result.accepted, result.failed), (3, 2, 1))
+        self.assertEqual(publish_events([]).sent, 0)
+
+
+class EventOutboxTests(EventHubTestCase, TestCase):
+    """Регистрация пишет событие в outbox; релей досылает его, в том числе после сбоя EventHub."""
+
+    def test_registration_goes_through_outbox(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            response = self.client.post('/api/user/register/', {
+                'email': 'new@example.com', 'password': 'Secret-pass-123',
+                'first_name': 'Анна', 'last_name': 'Иванова',
+            })
+        self.assertEqual(response.status_code, 201, response.data)
+        # во время запроса — ни одного RPC, событие лежит в outbox
+        self.assertEqual(self.servicer.events, [])
+        self.assertEqual(EventOutbox.objects.get().type, 'user.registered')
+
+        # после коммита будится релей; сам релей гоняем здесь же, без брокера
+        self.assertIn(_wake_relay, callbacks)
+        self.assertEqual(relay_batch(10), (1, 0))
+        self.assertEqual([e.type for e in self.servicer.events], ['user.registered'])
+        self.assertFalse(EventOutbox.objects.exists())
+
+    def test_retry_after_outage(self):
+        enqueue(self.event(1))
+        with override_settings(EVENTHUB_GRPC_ADDR='127.0.0.1:1', EVENTHUB_TIMEOUT_SEC=0.2):
+            self.assertEqual(relay_batch(10), (0, 1))
+
+        row = EventOutbox.objects.get()
+        self.assertEqual(row.attempts, 1)
+        self.assertGreater(row.next_attempt_at, timezone.now())
+        self.assertEqual(relay_batch(10), (0, 0))  # ещё рано
+
+        EventOutbox.objects.update(next_attempt_at=timezone.now())
+        self.assertEqual(relay_batch(10), (1, 0))
+        self.assertEqual([e.id for e in self.servicer.events], ['1'])
+
+    def test_rejected_event_does_not_block_batch(self):
+        bad = self.event(2)
+        bad.tenant_id = ''
+        for event in (self.event(1), bad, self.event(3)):
+            enqueue(event)
+
+        self.assertEqual(relay_batch(10), (2, 1))
+        self.assertEqual(EventOutbox.objects.get().event_id, '2')
+        # пачка, затем по одному; в следующий раз — только непринятое
+        self.assertEqual(self.servicer.unary_calls, 3)
+        EventOutbox.objects.update(next_attempt_at=timezone.now())
+        self.assertEqual(relay_batch(10), (0, 1))
+        self.assertEqual(self.servicer.streams, [3, 1])
+
+    @override_settings(EVENTHUB_ENABLED=False)
+    def test_disabled_eventhub_writes_nothing(self):
+        self.assertIsNone(enqueue(self.event(1)))
+        self.assertFalse(EventOutbox.objects.exists())
+
+    def test_claimed_rows_are_leased(self):
+        enqueue(self.event(1))
+        claimed = _claim(10)
+        self.assertEqual(len(claimed), 1)
+        # пока аренда не истекла, другой релей пачку не берёт
+        self.assertEqual(relay_batch(10), (0, 0))
+        self.assertEqual(self.servicer.events, [])
+
+
+class EventHubAsyncTests(EventHubTestCase):
+    """grpc.aio-клиент: те же события, без потока на каждый вызов."""
+
+    def run_async(self, coro_fn):
+        async def main():
+            try:
+                return await coro_fn()
+            finally:
+                await eventhub_aio.close_channels()
+        return asyncio.run(main())
+
+    def test_publish(self):
+        ok = self.run_async(lambda: eventhub_aio.publish_event(self.event(7)))
+        self.assertTrue(ok)
+        self.assertEqual([e.id for e in self.servicer.events], ['7'])
+
+    def test_fan_out_is_limited(self):
+        self.servicer.delay = 0.05
+        bad = self.event(0)
+        bad.tenant_id = ''
+        events = [bad] + [self.event(n) for n in range(1, 12)]
+
+        result = self.run_async(lambda: eventhub_aio.publish_events(events, concurrency=3))
+        self.assertEqual((result.sent, result.accepted, result.failed), (12, 11, 1))
+        self.assertEqual(self.servicer.max_in_flight, 3)
+
+    def test_safe_swallows_errors(self):
+        with override_settings(EVENTHUB_GRPC_ADDR='127.0.0.1:1', EVENTHUB_TIMEOUT_SEC=0.2):
+            self.assertFalse(self.run_async(lambda: eventhub_aio.publish_event_safe(self.event())))
+
+
+class EventEncodeTests(SimpleTestCase):
+    """Быстрый _to_pb_event даёт те же байты, что Struct.update/FromDatetime."""
+
+    def assertSameEncoding(self, event):
+        self.assertEqual(
+            _to_pb_event(event).SerializeToString(deterministic=True),
+            _legacy_to_pb_event(event).SerializeToString(deterministic=True),
+        )
+
+    def test_synthetic_events(self):
+        for event in synthetic_events(500):
+            self.assertSameEncoding(event)
+
+    def test_edge_cases(self):
+        for ts in (datetime(1969, 12, 31, 23, 59, 59, 500), datetime(2024, 1, 1)):
+            for props in (None, {}, {'safe': mark_safe('<b>'), 'flag': False, 'big': 2 ** 40,
+                                     'nested': {'a': [1, 'b', None]}}):
+                self.assertSameEncoding(EventDTO(
+                    id='1', tenant_id='t', type='x', actor_id=None, patient_id=None, ts=ts, props=props,
+                ))
+
+
+class _LegacyZipInfo(zipfile.ZipInfo):
+    # zipfile пишет не-ASCII имена только в UTF-8 — а нам нужно как у старых архиваторов
+    def _encodeFilenameFlags(self):
+        return self.filename.encode('cp437'), self.flag_bits
+
+
+class ArchiveTestCase(APITestCase):
+    """Архив в памяти → ArchiveJob с файлом во временном MEDIA_ROOT."""
+
+    def setUp(self):
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media, ignore_errors=True)
+        override = override_settings(MEDIA_ROOT=media, ARCHIVE_EVENTS_REDIS_URL='')
+        override.enable()
+        self.addCleanup(override.disable)
+        self.media = media
+        self.user = User.objects.create_user(username='doc', email='doc@example.com', role='doctor')
+        Doctor.objects.create(user=self.user, first_name='Иван', last_name='Петров')
+
+    def make_job(self, files: dict[str, bytes], legacy_encoding: str | None = None) -> ArchiveJob:
+        """legacy_encoding — имена без UTF-8 флага в этой кодировке (архиваторы Windows)."""
+        buf = io.BytesIO()
+        with zipfile.ZipFile(buf, 'w') as zf:
+            for name, data in files.items():
+                if legacy_encoding:
+                    name = _LegacyZipInfo(name.encode(legacy_encoding).decode('cp437'))
+                zf.writestr(name, data)
+        return ArchiveJob.objects.create(
+            uploaded_by=self.user, archive_file=ContentFile(buf.getvalue(), name='upload.zip'),
+        )
+
+    def stored_files(self) -> list[str]:
+        root = os.path.join(self.media, 'records')
+        return [name for _, _, names in os.walk(root) for name in names]
+
+
+class ArchiveCleanupTests(ArchiveTestCase):
+    """Ошибка посреди записи файлов: всё уже записанное удаляется."""
+
+    files = {f'Иванов Иван Иванович {n:02d}.01.2020.jpg': b'x' * 1000 for n in range(1, 9)}
+
+    def failing_save(self, on_call: int):
+        """FileSystemStorage.save, который падает на on_call-м файле."""
+        original = FileSystemStorage.save
+        calls = []
+
+        def flaky_save(storage, name, content, max_length=None):
+            calls.append(name)
+            if len(calls) == on_call:
+                raise OSError('disk full')
+            return original(storage, name, content, max_length=max_length)
+
+        return mock.patch.object(FileSystemStorage, 'save', flaky_save)
+
+    def run_failing(self):
+        job = self.make_job(self.files)
+        with self.failing_save(4):
+            with self.assertRaises(OSError):
+                process_zip_task(job.id)
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'failed')
+        self.assertEqual(self.stored_files(), [])
+        self.assertFalse(LabFile.objects.exists())
+
+    def test_serial(self):
+        self.run_failing()
+
+    @override_settings(ARCHIVE_WORKERS=4)
+    def test_threaded(self):
+        self.run_failing()
+
+    def test_failed_chunk_and_chord_errback(self):
+        job = self.make_job(self.files)
+        ok = process_zip_chunk.apply(args=(job.id, [0, 1, 2, 3]))
+        self.assertEqual(len(self.stored_files()), 4)
+        with self.failing_save(2):
+            bad = process_zip_chunk.apply(args=(job.id, [4, 5, 6, 7]))
+        self.assertTrue(bad.failed())
+        # упавший кусок убрал только своё
+        self.assertEqual(len(self.stored_files()), 4)
+
+        results = {ok.id: ok, bad.id: bad}
+        with mock.patch.object(process_zip_chunk, 'AsyncResult', results.get):
+            cleanup_zip_chunks(None, bad.result, None, job.id, [ok.id, bad.id])
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'failed')
+        self.assertEqual(self.stored_files(), [])
+
+    def test_chunk_after_failure_removes_its_files(self):
+        job = self.make_job(self.files)
+        ArchiveJob.objects.filter(pk=job.pk).update(status='failed')
+        self.assertEqual(process_zip_chunk(job.id, [0, 1]), [])
+        self.assertEqual(self.stored_files(), [])
+
+
+class ArchiveImportTests(ArchiveTestCase):
+    """process_zip_task от архива до MedicalRecord: последовательно, в пуле потоков, кусками."""
+
+    files = {
+        'Иванов Иван Иванович 5 марта 2001.jpg': b'a' * 300,
+        'снимки/Иванов Иван Иванович КТ.dcm': b'b' * 5000,
+        'снимки/': b'',
+        'Иванов Иван Иванович ivanov@example.com.png': b'c' * 700,
+        'Петров Пётр Петрович.pdf': b'd' * 1200,
+        'анализ 05.03.2001.jpeg': b'e' * 100,
+    }
+    names = [
+        'Иванов Иван Иванович 5 марта 2001.jpg',
+        'Иванов Иван Иванович КТ.dcm',
+        'Иванов Иван Иванович ivanov@example.com.png',
+        'Петров Пётр Петрович.pdf',
+        'анализ 05.03.2001.jpeg',
+    ]
+
+    def assert_imported(self, job):
+        names = self.names
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'done')
+        record = job.record
+        self.assertEqual(record.patient.last_name, 'Иванов')
+        self.assertIn(record.patient, self.user.doctor_profile.patients.all())
+        self.assertEqual(record.doctor, self.user.doctor_profile)
+
+        files = list(record.files.order_by('id'))
+        # файлы в storage — в порядке архива, с содержимым из архива, каталогов нет
+        self.assertEqual(len(files), len(names))
+        for lab_file, name in zip(files, names):
+            ext = os.path.splitext(name)[1]
+            self.assertEqual(lab_file.file_type, 'photo' if ext in ('.jpg', '.jpeg', '.png') else 'ct_scan')
+            with lab_file.file.open('rb') as f:
+                self.assertEqual(f.read(), self.files.get(name) or self.files[f'снимки/{name}'])
+
+        extracted = job.raw_extracted
+        self.assertEqual(extracted['fios'].count('Иванов Иван Иванович'), 3)
+        self.assertEqual(sorted(extracted['dobs']), ['05.03.2001', '05.03.2001'])
+        self.assertEqual(extracted['emails'], ['ivanov@example.com'])
+        return job
+
+    def test_serial(self):
+        job = self.make_job(self.files)
+        process_zip_task(job.id)
+        self.assert_imported(job)
+        self.assertEqual(job.get_progress(), {
+            'phase': 'done', 'members_done': 5, 'members_total': 5,
+            'bytes_done': 7300, 'bytes_total': 7300,
+        })
+
+    @override_settings(ARCHIVE_WORKERS=4)
+    def test_threaded(self):
+        job = self.make_job(self.files)
+        process_zip_task(job.id)
+        self.assert_imported(job)
+
+    def test_cp866_names(self):
+        job = self.make_job(self.files, legacy_encoding='cp866')
+        process_zip_task(job.id)
+        self.assert_imported(job)
+
+    @override_settings(ARCHIVE_BULK_BATCH_SIZE=2)
+    def test_lab_files_in_batches(self):
+        job = self.make_job(self.files)
+        with CaptureQueriesContext(connection) as ctx:
+            process_zip_task(job.id)
+        inserts = [q for q in ctx.captured_queries if q['sql'].startswith('INSERT INTO "main_labfile"')]
+        self.assertEqual(len(inserts), 3)
+        self.assert_imported(job)
+
+    def test_chunks(self):
+        # то, что делает chord при ARCHIVE_FANOUT_MIN_BYTES, без брокера:
+        # куски по ARCHIVE_CHUNK_BYTES → process_zip_chunk → finalize_zip_task
+        job = self.make_job(self.files)
+        with zipfile.ZipFile(job.archive_file.path) as zf:
+            sizes = [info.file_size for info, _ in _archive_members(zf)]
+        chunks = _split_chunks(sizes, 2500)
+        self.assertEqual(sorted(chain.from_iterable(chunks)), list(range(5)))
+        self.assertEqual(len(chunks), 3)
+        # самый большой файл — отдельным куском
+        self.assertIn([1], chunks)
+
+        results = [process_zip_chunk(job.id, indices) for indices in chunks]
+        finalize_zip_task(list(reversed(results)), job.id)
+        self.assert_imported(job)
+
+    def test_no_fio(self):
+        job = self.make_job({'анализ 05.03.2001.jpeg': b'e' * 100})
+        process_zip_task(job.id)
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'failed')
+        self.assertIsNone(job.record)
+        self.assertEqual(self.stored_files(), [])
+
+    def test_status_log_pages(self):
+        job = self.make_job(self.files)
+        process_zip_task(job.id)
+        self.client.force_authenticate(self.user)
+
+        first = self.client.get(f'/api/task-status/{job.id}/', {'log_limit': 2}).json()
+        self.assertEqual(first['status'], 'done')
+        self.assertEqual(first['log'].splitlines()[0], 'Start processing')
+        self.assertEqual(len(first['log'].splitlines()), 2)
+
+        rest = self.client.get(f'/api/task-status/{job.id}/', {'log_after': first['log_cursor']}).json()
+        self.assertEqual(rest['log'].splitlines()[-1], 'Processing finished successfully')
+        self.assertNotIn('Start processing', rest['log'])
+
+
+class ExtractEntitiesTests(SimpleTestCase):
+    """extract_entities — то же, что extract_fio / extract_dob / extract_phone / extract_email по отдельности."""
+
+    def test_extract_entities_matches_extract_functions(self):
+        for text in (
+            'Иванов-Петров Иван Сергеевич 5 марта 2001 +7 912 345-67-89 ivan@example.com',
+            'Сидорова Анна Павловна 12.11.1985',
+            'scan_0001',
+            '',
+        ):
+            with self.subTest(text=text):
+                self.assertEqual(extract_entities(text), {
+                    'fios': extract_fio(text),
+                    'dobs': extract_dob(text),
+                    'phones': extract_phone(text),
+                    'emails': extract_email(text),
+                })
+        self.assertEqual(extract_fio('Сидорова Анна Павловна 12.11.1985'), ['Сидорова Анна Павловна'])
+        self.assertEqual(extract_dob('Сидорова Анна Павловна 12.11.1985'), ['12.11.1985'])
+
+    def test_overlapping_matches_are_kept(self):
+        found = match_entities('Сидорова Анна Павловна, д. р. 12.11.1985')
+        self.assertEqual(found['dobs'], ['12.11.1985'])
+        self.assertEqual(found['phones'], ['12.11.1985'])
+
+
+class ParseDateTests(SimpleTestCase):
+    """_parse_date: числовые даты и «D <месяц> YYYY» — без dateparser, остальное — через него."""
+
+    def test_parse_date(self):
+        for text in ('5 марта 2001', '05.03.2001', '5/3/2001', '5 мар. 2001', '5 Марта 2001'):
+            with self.subTest(text=text), mock.patch('main.utils._dateparser_parse') as fallback:
+                self.assertEqual(_parse_date(text), datetime(2001, 3, 5))
+                fallback.assert_not_called()
+        self.assertEqual(_parse_date('1 сентября 1999'), datetime(1999, 9, 1))
+        self.assertEqual(_parse_date('15 мая 2010'), datetime(2010, 5, 15))
+
+    def test_parse_date_falls_back_to_dateparser(self):
+        with mock.patch('main.utils._dateparser_parse', return_value=None) as fallback:
+            self.assertIsNone(_parse_date('31.02.2001'))
+            self.assertIsNone(_parse_date('5 брюмера 2001'))
+        self.assertEqual([call.args[0] for call in fallback.call_args_list], ['31.02.2001', '5 брюмера 2001'])
+
+
+class DecodeFilenameTests(SimpleTestCase):
+    """Имена файлов без UTF-8 флага: кодировка архива определяется один раз, decode_filename по ней."""
+
+    def test_decode_filename(self):
+        for encoding in ('cp866', 'windows-1251'):
+            with self.subTest(encoding=encoding):
+                # так zipfile отдаёт имя без UTF-8 флага
+                raw = 'Иванов Иван 5 марта.pdf'.encode(encoding).decode('cp437')
+                self.assertEqual(detect_encoding([raw, 'readme.txt']), encoding)
+                self.assertEqual(decode_filename(raw, encoding), 'Иванов Иван 5 марта.pdf')
+                # без кодировки архива — перебором
+                self.assertEqual(decode_filename(raw), 'Иванов Иван 5 марта.pdf')
+        self.assertIsNone(detect_encoding(['readme.txt', 'Иванов.pdf']))
+        self.assertEqual(decode_filename('Иванов.pdf'), 'Иванов.pdf')
+
+    def test_decode_filename_is_cached(self):
+        raw = 'Протокол.pdf'.encode('cp866').decode('cp437')
+        decode_filename.cache_clear()
+        for _ in range(3):
+            self.assertEqual(decode_filename(raw, 'cp866'), 'Протокол.pdf')
+        info = decode_filename.cache_info()
+        self.assertEqual((info.misses, info.hits), (1, 2))
+
+
+class LazyImportTests(SimpleTestCase):
+    """dateparser и PIL не грузятся при импорте main.utils и на старте воркеров."""
+
+    def test_heavy_imports_are_lazy(self):
+        code = 'import sys, main.utils; print(sorted({"dateparser", "PIL"} & set(sys.modules)))'
+        out = subprocess.run(
+            [sys.executable, '-c', code], cwd=django_settings.BASE_DIR,
+            capture_output=True, text=True, check=True,
+        ).stdout
+        self.assertEqual(out.strip(), '[]')
+
+    def test_wsgi_worker_startup(self):
+        code, lazy = IMPORT_TARGETS['wsgi']
+        loaded = {name.split('.')[0] for name, _, _ in profile_imports(code)}
+        self.assertFalse(loaded & set(lazy), loaded & set(lazy))
+
+
+@override_settings(ARCHIVE_EVENTS_REDIS_URL='')
+class EmailIndexTests(TestCase):
+    """Поиск по email без учёта регистра идёт по функциональным индексам UPPER(email)."""
+
+    def test_index_declared(self):
+        for model, name in ((User, 'user_email_upper_idx'), (Patient, 'patient_email_upper_idx')):
+            self.assertIn(name, [index.name for index in model._meta.indexes])
+
+    def test_iexact_lookup(self):
+        user = User.objects.create_user(username='ann', email='Anna.Ivanova@Example.com')
+        patient = Patient.objects.create(first_name='Анна', last_name='Иванова', email='Anna.Ivanova@Example.com')
+        self.assertEqual(User.objects.get(email__iexact='anna.ivanova@EXAMPLE.COM'), user)
+        self.assertEqual(Patient.objects.get(email__iexact='anna.ivanova@EXAMPLE.COM'), patient)
+        if connection.vendor == 'postgresql':
+            for qs, name in (
+                (User.objects.filter(email__iexact='anna.ivanova@example.com'), 'user_email_upper_idx'),
+                (Patient.objects.filter(email__iexact='anna.ivanova@example.com'), 'patient_email_upper_idx'),
+            ):
+                self.assertIn(name, qs.explain())
+
+
+class TaskStatusStreamAuthTests(APITestCase):
+    """SSE-поток: билет вместо токена в URL, только автору загрузки."""
+
+    def setUp(self):
+        self.owner = User.objects.create_user(username='owner', email='owner@example.com', role='doctor')
+        self.other = User.objects.create_user(username='other', email='other@example.com', role='doctor')
+        self.job = ArchiveJob.objects.create(uploaded_by=self.owner, archive_file='archives/a.zip')
+
+    def ticket(self, user):
+        self.client.force_authenticate(user)
+        return self.client.post(f'/api/task-status/{self.job.id}/stream-ticket/')
+
+    def stream(self, job_id=None, user=None, **params):
+        """GET потока через ASGI-клиент: с билетом в params или с Bearer-токеном user."""
+        headers = {'Authorization': f'Bearer {AccessToken.for_user(user)}'} if user else None
+
+        async def get():
+            return await self.async_client.get(
+                f'/api/task-status/{job_id or self.job.id}/stream/', params, headers=headers,
+            )
+        return async_to_sync(get)()
+
+    def test_owner_ticket(self):
+        ticket = self.ticket(self.owner).data['ticket']
+        # дальше проверок доступа дело дошло: push выключен в этом окружении
+        self.assertEqual(self.stream(ticket=ticket).status_code, 503)
+        self.assertEqual(self.stream(user=self.owner).status_code, 503)
+
+    def test_foreign_job(self):
+        self.assertEqual(self.ticket(self.other).status_code, 404)
+        self.assertEqual(self.stream(user=self.other).status_code, 404)
+
+    def test_bad_tickets(self):
+        ticket = self.ticket(self.owner).data['ticket']
+        other_job = ArchiveJob.objects.create(uploaded_by=self.owner, archive_file='archives/b.zip')
+        self.assertEqual(self.stream(other_job.id, ticket=ticket).status_code, 401)
+        self.assertEqual(self.stream(ticket=ticket + 'x').status_code, 401)
+        self.assertEqual(self.stream().status_code, 401)
+        self.assertEqual(self.stream(token=str(AccessToken.for_user(self.owner))).status_code, 401)
+        with override_settings(ARCHIVE_EVENTS_TICKET_TTL=-1):
+            self.assertEqual(self.stream(ticket=ticket).status_code, 401)
+
+
+class _FakeRedis:
+    """Синхронный Redis для JobProgress: хэши, pipeline и publish в память."""
+
+    def __init__(self):
+        self.hashes = {}
+        self.published = []
+
+    def pipeline(self):
+        return _FakePipeline(self)
+
+    def publish(self, channel, data):
+        self.published.append((channel, json.loads(data)))
+
+
+class _FakePipeline:
+    def __init__(self, redis):
+        self.redis = redis
+        self.calls = []
+
+    def __getattr__(self, name):
+        return lambda *args: self.calls.append((name, args))
+
+    def execute(self):
+        results = []
+        for name, (key, *args) in self.calls:
+            h = self.redis.hashes.setdefault(key, {})
+            if name == 'hset':
+                h[args[0]] = args[1].encode()
+                results.append(1)
+            elif name == 'hincrby':
+                h[args[0]] = h.get(args[0], 0) + args[1]
+                results.append(h[args[0]])
+            elif name == 'hget':
+                results.append(h.get(args[0]))
+            else:
+                results.append(True)
+        return results
+
+
+class JobProgressTests(TestCase):
+    """JobProgress: строки прогресса не чаще интервала, в pub/sub — итоги без агрегата по базе."""
+
+    def setUp(self):
+        user = User.objects.create_user(username='owner', email='owner@example.com', role='doctor')
+        self.job = ArchiveJob.objects.create(
+            uploaded_by=user, archive_file='archives/a.zip', status='processing',
+            members_total=20, bytes_total=2000,
+        )
+        self.now = 0.0
+        patcher = mock.patch('main.progress.time.monotonic', lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    @override_settings(ARCHIVE_PROGRESS_INTERVAL=1.0)
+    def test_rows_throttled(self):
+        progress = JobProgress(self.job)
+        progress.set_phase('storing')  # фаза пишется сразу
+        for n in range(1, 16):
+            self.now = n * 0.1  # 15 файлов за 1.5 с
+            progress.advance(1, 100)
+        progress.flush()
+        progress.flush()  # копить нечего — строки нет
+
+        rows = list(self.job.events.values_list('phase', 'members_done', 'bytes_done').order_by('id'))
+        self.assertEqual(rows, [('storing', 0, 0), ('', 10, 1000), ('', 5, 500)])
+
+    def test_published_totals_across_workers(self):
+        fake = _FakeRedis()
+        with mock.patch('main.progress._client', return_value=fake):
+            JobProgress(self.job).set_phase('storing')
+            # два куска раздачи — у каждого свой JobProgress
+            chunks = [JobProgress(ArchiveJob.objects.get(pk=self.job.pk)) for _ in range(2)]
+            for chunk in chunks:
+                chunk.advance(3, 300)
+                with self.assertNumQueries(1):  # только INSERT, без Sum по событиям
+                    chunk.flush()
+
+        channel, payload = fake.published[-1]
+        self.assertEqual(channel, f'archive-job:{self.job.pk}')
+        self.assertEqual(payload, {'type': 'progress', 'progress': {
+            'phase': 'storing', 'members_done': 6, 'members_total': 20, 'bytes_done': 600, 'bytes_total': 2000,
+        }})
+        self.assertEqual(payload['progress'], self.job.get_progress())
+
+
+class _FakePubSub:
+    """Подписка redis.asyncio: отдаёт заранее заданные сообщения, None — тишина."""
+
+    def __init__(self, payloads):
+        self.channels = []
+        self.closed = False
+        self._messages = [None if p is None else {'data': json.dumps(p)} for p in payloads]
+
+    async def subscribe(self, channel):
+        self.channels.append(channel)
+
+    async def get_message(self, ignore_subscribe_messages=False, timeout=None):
+        return self._messages.pop(0) if self._messages else None
+
+    async def aclose(self):
+        self.closed = True
+
+
+class StreamJobEventsTests(TestCase):
+    """stream_job_events: снимок статуса, события задачи, конец на done/failed."""
+
+    def setUp(self):
+        user = User.objects.create_user(username='owner', email='owner@example.com', role='doctor')
+        self.job = ArchiveJob.objects.create(uploaded_by=user, archive_file='archives/a.zip', status='processing')
+
+    def collect(self, payloads):
+        self.pubsub = _FakePubSub(payloads)
+        client = mock.Mock(pubsub=lambda: self.pubsub)
+
+        async def read():
+            return [chunk async for chunk in stream_job_events(self.job)]
+        with mock.patch('main.progress._async_redis', return_value=client):
+            return async_to_sync(read)()
+
+    def test_events_forwarded_until_final_status(self):
+        for final in FINAL_STATUSES:
+            with self.subTest(final=final):
+                chunks = self.collect([
+                    {'type': 'progress', 'progress': {'members_done': 3}},
+                    None,
+                    {'type': 'log', 'id': 1, 'message': 'файл пропущен'},
+                    {'type': 'status', 'status': final, 'progress': {}},
+                    {'type': 'log', 'id': 2, 'message': 'после конца'},
+                ])
+                self.assertEqual(self.pubsub.channels, [f'archive-job:{self.job.pk}'])
+                self.assertEqual([chunk.split('\n')[0] for chunk in chunks], [
+                    'event: status', 'event: progress', ': keepalive', 'event: log', 'event: status',
+                ])
+                self.assertIn('"status": "processing"', chunks[0])
+                self.assertIn('"members_done": 3', chunks[1])
+                self.assertEqual(json.loads(chunks[3].split('data: ')[1])['message'], 'файл пропущен')
+                self.assertTrue(self.pubsub.closed)
+
+    def test_finished_job_only_snapshot(self):
+        ArchiveJob.objects.filter(pk=self.job.pk).update(status='done')
+        chunks = self.collect([{'type': 'log', 'id': 1, 'message': 'лишнее'}])
+        self.assertEqual(len(chunks), 1)
+        self.assertIn('"status": "done"', chunks[0])
+        self.assertTrue(self.pubsub.closed)
+
+    @override_settings(ARCHIVE_EVENTS_STREAM_TIMEOUT=0.05, ARCHIVE_EVENTS_HEARTBEAT=0.01)
+    def test_stream_lifetime(self):
+        chunks = self.collect([])
+        self.assertEqual(chunks[0].split('\n')[0], 'event: status')
+        self.assertTrue(set(chunks[1:]) <= {': keepalive\n\n'})
+        self.assertTrue(self.pubsub.closed)
@@ -1,11 +1,33 @@
+import logging
 import re
 from datetime import datetime
+from functools import lru_cache
 
-import dateparser
 import string
 
-from PIL import Image
-from PIL.ExifTags import TAGS
+
+# dateparser и PIL здесь не импортируются: модуль тянут и веб-воркеры
+# (views → tasks → utils), а тяжёлые библиотеки нужны только в редких
+# ветках — грузим их при первом обращении.
+
+logger = logging.getLogger(__name__)
+
+# Шаблоны компилируются один раз при импорте модуля: extract_* вызываются
+# на каждое имя файла архива, а пересобирать шаблон на каждый вызов незачем.
+_FIO_RE = re.compile(
+    r'(?:^|[ \-_])'
+    r'([А-ЯЁ][а-яё]+(?:-[А-ЯЁ][а-яё]+)?'
+    r'[ \-_][А-ЯЁ][а-яё]+'
+    r'[ \-_][А-ЯЁ][а-яё]+(?:ович|евич|овна|евна|ична|инична))'
+)
+_DOB_RE = re.compile(r'\b(?:\d{1,2}\s[А-Яа-яЁё]+\s\d{4}|\d{1,2}[./]\d{1,2}[./]\d{4})\b')
+_PHONE_RE = re.compile(r'\+?\d{1,3}?[-.\s]?\(?\d{1,4}?\)?[-.\s]?\d{1,4}[-.\s]?\d{1,9}')
+_EMAIL_RE = re.compile(r'[A-Za-z0-9_.+-]+@[A-Za-z0-9-]+\.[A-Za-z0-9-.]+')
+
+# Дешёвые проверки «может ли шаблон вообще совпасть»: без цифр нет ни дат,
+# ни телефонов, без заглавной кириллицы — ФИО
+_HAS_DIGIT_RE = re.compile(r'\d')
+_HAS_CYR_UPPER_RE = re.compile(r'[А-ЯЁ]')
 
 
 def extract_fio(text: str) -> list[str]:
@@ -13,51 +35,135 @@ def extract_fio(text: str) -> list[str]:
     Находит ФИО вида "Фамилия Имя Отчество" с возможным дефисом в фамилии
     и типичными русскими суффиксами отчества.
     """
-    pattern = (
-        r'(?:^|[ \-_])'
-        r'([А-ЯЁ][а-яё]+(?:-[А-ЯЁ][а-яё]+)?'
-        r'[ \-_][А-ЯЁ][а-яё]+'
-        r'[ \-_][А-ЯЁ][а-яё]+(?:ович|евич|овна|евна|ична|инична))'
-    )
-    return re.findall(pattern, text)
+    return _FIO_RE.findall(text)
 
 
-def extract_dob(text: str) -> list[str]:
+def _month_forms() -> dict[str, int]:
     """
-    Находит даты в формате "DD Month YYYY" или "D.M.YYYY" и
-    возвращает их в формате "DD.MM.YYYY".
+    Все формы названий месяцев → номер месяца: все падежи («январь», «января»,
+    «январю», «январём», «январе»…) и сокращения («янв», «сент»…).
+    «ё» приведена к «е» — так же нормализуется и слово из строки.
+    """
+    soft = ('ь', 'я', 'ю', 'ем', 'е')        # январь, февраль, … декабрь
+    hard = ('', 'а', 'у', 'ом', 'е')          # март, август
+    stems = [
+        ('январ', soft), ('феврал', soft), ('март', hard), ('апрел', soft),
+        ('ма', ('й', 'я', 'ю', 'ем', 'е')), ('июн', soft), ('июл', soft), ('август', hard),
+        ('сентябр', soft), ('октябр', soft), ('ноябр', soft), ('декабр', soft),
+    ]
+    short = [
+        ('янв',), ('фев', 'февр'), ('мар',), ('апр',), (), ('июн',),
+        ('июл',), ('авг',), ('сен', 'сент'), ('окт',), ('ноя', 'нояб'), ('дек',),
+    ]
+    forms = {}
+    for month, ((stem, endings), abbrs) in enumerate(zip(stems, short), start=1):
+        for ending in endings:
+            forms[stem + ending] = month
+        for abbr in abbrs:
+            forms[abbr] = month
+            forms[abbr + '.'] = month
+    return forms
+
+
+_MONTHS = _month_forms()
+_NUMERIC_DATE_RE = re.compile(r'(\d{1,2})[./](\d{1,2})[./](\d{4})')
+_WORD_DATE_RE = re.compile(r'(\d{1,2})\s(\S+)\s(\d{4})')
+
+
+def _dateparser_parse(s: str) -> datetime | None:
+    import dateparser   # секунды на загрузку регулярок и локалей — только по необходимости
+    return dateparser.parse(s, languages=['ru'])
+
+
+def _parse_date(s: str) -> datetime | None:
+    """
+    Разбор даты, найденной _DOB_RE: "D.M.YYYY", "D/M/YYYY" и "D <месяц> YYYY"
+    разбираем сами, всё остальное (в т.ч. несуществующие даты) отдаём dateparser.
     """
-    # Ищем все вхождения по шаблону
-    date_pattern = r'\b(?:\d{1,2}\s[А-Яа-яЁё]+\s\d{4}|\d{1,2}[./]\d{1,2}[./]\d{4})\b'
-    found = re.findall(date_pattern, text)
+    m = _NUMERIC_DATE_RE.fullmatch(s)
+    if m:
+        day, month, year = int(m[1]), int(m[2]), int(m[3])
+    else:
+        m = _WORD_DATE_RE.fullmatch(s)
+        month = _MONTHS.get(m[2].lower().replace('ё', 'е')) if m else None
+        if month is None:
+            return _dateparser_parse(s)
+        day, year = int(m[1]), int(m[3])
+
+    try:
+        return datetime(year, month, day)
+    except ValueError:
+        return _dateparser_parse(s)
+
+
+def _parse_dates(found: list[str]) -> list[str]:
     parsed = []
     for s in found:
-        dt = dateparser.parse(s, languages=['ru'])
+        dt = _parse_date(s)
         if dt:
             parsed.append(dt.strftime('%d.%m.%Y'))
     return parsed
 
 
+def extract_dob(text: str) -> list[str]:
+    """
+    Находит даты в формате "DD Month YYYY" или "D.M.YYYY" и
+    возвращает их в формате "DD.MM.YYYY".
+    """
+    return _parse_dates(_DOB_RE.findall(text))
+
+
 def extract_phone(text: str) -> list[str]:
     """
     Ищет телефонные номера в различных форматах.
     """
-    pattern = r'\+?\d{1,3}?[-.\s]?\(?\d{1,4}?\)?[-.\s]?\d{1,4}[-.\s]?\d{1,9}'
-    return re.findall(pattern, text)
+    return _PHONE_RE.findall(text)
 
 
 def extract_email(text: str) -> list[str]:
     """
     Находит email-адреса.
     """
-    pattern = r'[A-Za-z0-9_.+-]+@[A-Za-z0-9-]+\.[A-Za-z0-9-.]+'
-    return re.findall(pattern, text)
+    return _EMAIL_RE.findall(text)
+
+
+def match_entities(text: str) -> dict[str, list[str]]:
+    """
+    Все совпадения шаблонов в строке, даты — как найдены, без разбора.
+    Перед каждым шаблоном — дешёвая проверка на C-уровне (есть ли цифры,
+    "@", заглавная кириллица), так что шаблоны, которые заведомо не совпадут,
+    не запускаются.
+
+    Один общий шаблон-альтернация сюда не годится: шаблоны пересекаются
+    (дата "12.11.1985" — ещё и телефон), а finditer по альтернации отдаёт
+    каждый участок строки только одной ветке — часть совпадений теряется.
+    """
+    has_digits = _HAS_DIGIT_RE.search(text) is not None
+    return {
+        'fios':   _FIO_RE.findall(text) if _HAS_CYR_UPPER_RE.search(text) else [],
+        'dobs':   _DOB_RE.findall(text) if has_digits else [],
+        'phones': _PHONE_RE.findall(text) if has_digits else [],
+        'emails': _EMAIL_RE.findall(text) if '@' in text else [],
+    }
+
+
+def extract_entities(text: str) -> dict[str, list[str]]:
+    """
+    То же, что extract_fio / extract_dob / extract_phone / extract_email
+    по отдельности, одним вызовом.
+    """
+    found = match_entities(text)
+    found['dobs'] = _parse_dates(found['dobs'])
+    return found
 
 
 def get_exif_date(image_path: str) -> datetime | None:
     """
     Возвращает DateTimeOriginal из EXIF, если есть.
     """
+    from PIL import Image
+    from PIL.ExifTags import TAGS
+
     try:
         with Image.open(image_path) as img:
             exif = img._getexif() or {}
@@ -69,29 +175,80 @@ def get_exif_date(image_path: str) -> datetime | None:
     return None
 
 
+_READABLE_CHARACTERS = frozenset(
+    string.ascii_letters + string.digits + string.punctuation + ' '
+    + 'АБВГДЕЁЖЗИЙКЛМНОПРСТУФХЦЧШЩЪЫЬЭЮЯабвгдеёжзийклмнопрстуфхцчшщъыьэюя'
+)
+_FILENAME_ENCODINGS = ('cp866', 'windows-1251', 'latin1')
+
+
 def is_readable(filename):
-    readable_characters = string.ascii_letters + string.digits + string.punctuation + ' ' + 'АБВГДЕЁЖЗИЙКЛМНОПРСТУФХЦЧШЩЪЫЬЭЮЯабвгдеёжзийклмнопрстуфхцчшщъыьэюя'
-    return all(char in readable_characters for char in filename)
+    return _READABLE_CHARACTERS.issuperset(filename)
 
 
-def decode_filename(filename):
+def _recode(filename: str, encoding: str) -> str | None:
+    """Имя, прочитанное zipfile как cp437, перечитываем в другой кодировке."""
+    try:
+        return filename.encode('cp437').decode(encoding)
+    except UnicodeError:
+        return None
+
+
+def detect_encoding(filenames, sample: int = 20) -> str | None:
+    """
+    Кодировка имён файлов архива — определяется один раз на архив по первым
+    нечитаемым именам (cp866 / windows-1251 / latin1).
+    None — перекодировать нечего или не вышло.
+    """
+    unreadable = []
+    for filename in filenames:
+        if not is_readable(filename):
+            unreadable.append(filename)
+            if len(unreadable) >= sample:
+                break
+    if not unreadable:
+        return None
+
+    # кодировка, в которой читаемыми становится больше всего имён
+    # (при равенстве — раньше в списке)
+    scores = {
+        encoding: sum(is_readable(_recode(f, encoding) or '\ufffd') for f in unreadable)
+        for encoding in _FILENAME_ENCODINGS
+    }
+    encoding = max(_FILENAME_ENCODINGS, key=lambda e: scores[e])
+    if scores[encoding]:
+        logger.info("Archive file names detected as %s", encoding)
+        return encoding
+
+    logger.warning("Could not detect archive file name encoding, e.g. %r", unreadable[0])
+    return None
+
+
+@lru_cache(maxsize=4096)
+def decode_filename(filename, encoding=None):
+    """
+    Читаемое имя файла из архива. encoding — кодировка, определённая для
+    всего архива (detect_encoding): она применяется к имени как есть.
+    Без неё пробуем кодировки по очереди, пока имя не станет читаемым.
+    Результат кэшируется: в архивах одни и те же имена повторяются
+    тысячи раз.
+    """
     # Проверяем, является ли имя читаемым
     if is_readable(filename):
-        print(f"Имя файла уже корректное: {filename}")
         return filename
 
+    if encoding:
+        decoded = _recode(filename, encoding)
+        if decoded is not None:
+            return decoded
+
     # Если имя не читаемое, пробуем другие кодировки
-    encodings = ['cp866', 'windows-1251', 'latin1']
-    for encoding in encodings:
-        try:
-            decoded = filename.encode('cp437').decode(encoding)
-            if is_readable(decoded):
-                print(f"Имя файла успешно декодировано как {encoding}: {decoded}")
-                return decoded
-        except UnicodeDecodeError as e:
-            print(f"Ошибка декодирования с {encoding}: {e}")
-            continue
-
-    # Если ни одна из кодировок не подошла, возвращаем с заменой символов
-    print(f"Не удалось корректно декодировать имя файла")
+    for enc in _FILENAME_ENCODINGS:
+        decoded = _recode(filename, enc)
+        if decoded is not None and is_readable(decoded):
+            logger.debug("File name decoded as %s: %s", enc, decoded)
+            return decoded
+
+    # Если ни одна из кодировок не подошла, возвращаем как есть
+    logger.warning("Could not decode file name %r", filename)
     return filename
@@ -1,4 +1,8 @@
-from django.db.models import Q
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Max, Q
+from django.http import JsonResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
 
 from rest_framework import generics, status, viewsets, parsers
@@ -6,14 +10,34 @@ from rest_framework.permissions import IsAuthenticated, AllowAny
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from rest_framework.decorators import action
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework.exceptions import AuthenticationFailed
 
 from .models import User, Patient, Doctor, MedicalRecord, ArchiveJob, ShareRequest, LabFile, RecordShare
 from .serializers import (UserRegisterSerializer, PatientSerializer, DoctorSerializer,
                           UserMeSerializer, MedicalRecordSerializer, ZipUploadSerializer, ArchiveJobSerializer,
                           RecentUploadSerializer, ShareRequestCreateSerializer, ShareRequestSerializer)
+from main.caching import CachedResponseMixin, ConditionalRetrieveMixin
+from main.permissions import CanViewPatient, doctor_has_patient
+from main.progress import check_stream_ticket, issue_stream_ticket, stream_job_events
 from main.tasks import process_zip_task
 
 
+class EagerLoadingViewMixin:
+    """
+    Применяет к queryset'у вьюхи план выборки её сериализатора
+    (serializers.EagerLoadingMixin): select_related / prefetch_related
+    для всего, что сериализатор читает, — и в списке, и в get_object().
+    """
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        serializer_class = self.get_serializer_class()
+        if hasattr(serializer_class, 'setup_eager_loading'):
+            queryset = serializer_class.setup_eager_loading(queryset)
+        return queryset
+
+
 class CreateUserView(generics.CreateAPIView):
     permission_classes = (AllowAny,)
     queryset           = User.objects.all()
@@ -23,22 +47,24 @@ class CreateUserView(generics.CreateAPIView):
         """
         • Создаём самого `User`
         • Если роль == patient  → сразу же создаём Patient-профиль и привязываем
+        Одной транзакцией — вместе с событием user.registered в EventOutbox.
         """
-        user: User = serializer.save()
+        with transaction.atomic():
+            user: User = serializer.save()
 
-        if user.role == 'patient':
-            # если вдруг перерегистрируются тем же email – карточка уже есть
-            Patient.objects.get_or_create(
-                user=user,
-                defaults={
-                    'first_name':  user.first_name,
-                    'last_name':   user.last_name,
-                    'middle_name': user.middle_name,
-                    'birthday':    user.birthday,
-                    'email':       user.email,
-                    'phone':       user.phone,
-                }
-            )
+            if user.role == 'patient':
+                # если вдруг перерегистрируются тем же email – карточка уже есть
+                Patient.objects.get_or_create(
+                    user=user,
+                    defaults={
+                        'first_name':  user.first_name,
+                        'last_name':   user.last_name,
+                        'middle_name': user.middle_name,
+                        'birthday':    user.birthday,
+                        'email':       user.email,
+                        'phone':       user.phone,
+                    }
+                )
 
 
 
@@ -65,6 +91,7 @@ class PatientListCreate(generics.ListCreateAPIView):
     """
     serializer_class = PatientSerializer
     permission_classes = [IsAuthenticated]
+    ordering = ('last_name', 'first_name', 'id')
 
     # ─────────────────────────────────────────────────────────────────────────
     # С П И С О К
@@ -78,15 +105,15 @@ class PatientListCreate(generics.ListCreateAPIView):
 
         # пациент → только своя карточка
         if user.role == 'patient':
-            return Patient.objects.filter(user=user)
+            return Patient.objects.filter(user=user).with_record_stats()
 
         # админ / суперюзер → все
         if user.is_superuser or user.role == 'admin':
-            return Patient.objects.all()
+            return Patient.objects.with_record_stats()
 
         # доктор → свои привязанные
         if user.role == 'doctor' and hasattr(user, 'doctor_profile'):
-            return user.doctor_profile.patients.all()
+            return user.doctor_profile.patients.with_record_stats()
 
         # остальным – пусто
         return Patient.objects.none()
@@ -136,45 +163,30 @@ class PatientListCreate(generics.ListCreateAPIView):
         )
 
 
-class PatientRetrieveAPIView(generics.RetrieveAPIView):
+class PatientRetrieveAPIView(ConditionalRetrieveMixin, generics.RetrieveAPIView):
     """
     GET /patients/<id>/ — возвращает одного пациента по его id.
     Доступен докторам по своим пациентам, админам, и самому пациенту.
+    ETag — от updated_at пациента и его записей (record_count/last_visit в ответе).
     """
-    queryset = Patient.objects.all()
+    queryset = Patient.objects.with_record_stats().annotate(
+        records_updated=Max('medical_records__updated_at'),
+    )
     serializer_class = PatientSerializer
+    permission_classes = [IsAuthenticated, CanViewPatient]
 
-    def get_object(self):
-        patient = super().get_object()
-        user = self.request.user
-
-        # суперюзер/админ может любого
-        if user.is_superuser or getattr(user, 'role', None) == 'admin':
-            return patient
-
-        # доктор — только своих
-        if getattr(user, 'role', None) == 'doctor':
-            doc = getattr(user, 'doctor_profile', None)
-            if doc and patient in doc.patients.all():
-                return patient
-
-        # пациент — только свои
-        if getattr(user, 'role', None) == 'patient':
-            if patient.user_id == user.id:
-                return patient
-
-        # иначе — 403
-        from rest_framework.exceptions import PermissionDenied
-        raise PermissionDenied("You do not have permission to view this patient.")
+    def etag_parts(self, patient):
+        return patient.pk, patient.updated_at, patient.record_count, patient.records_updated
 
 
-class PatientRecordListCreateAPIView(generics.ListCreateAPIView):
+class PatientRecordListCreateAPIView(EagerLoadingViewMixin, generics.ListCreateAPIView):
     """
     GET  /patients/{patient_id}/records/  — список записей
     POST /patients/{patient_id}/records/  — создать новую запись
     """
     serializer_class = MedicalRecordSerializer
     permission_classes = [IsAuthenticated]
+    ordering = ('-visit_date', '-created_at', '-id')
 
     def get_queryset(self):
         user = self.request.user
@@ -188,12 +200,9 @@ class PatientRecordListCreateAPIView(generics.ListCreateAPIView):
 
         # для доктора и пациента одинаковая логика просмотра:
         # — создатель, или второй владелец, или принявший шаринг
+        # (всё это уже сведено в RecordAccess — один JOIN по индексу)
         if user.role in ('doctor', 'patient'):
-            return base.filter(
-                Q(owner_primary=user)
-                | Q(owner_second=user)
-                | Q(shares__to_user=user, shares__status='accepted')
-            ).distinct()
+            return base.filter(access__user=user)
 
         # остальным — ничего
         return MedicalRecord.objects.none()
@@ -218,9 +227,9 @@ class PatientRecordListCreateAPIView(generics.ListCreateAPIView):
                 uploaded_by=self.request.user
             )
 
-class PatientRecordDetailAPIView(generics.RetrieveUpdateAPIView):
+class PatientRecordDetailAPIView(ConditionalRetrieveMixin, EagerLoadingViewMixin, generics.RetrieveUpdateAPIView):
     """
-    GET    /patients/{patient_id}/records/{pk}/    — получить одну запись
+    GET    /patients/{patient_id}/records/{pk}/    — получить одну запись (с ETag)
     PATCH  /patients/{patient_id}/records/{pk}/    — частично обновить запись
     """
     serializer_class   = MedicalRecordSerializer
@@ -244,22 +253,33 @@ class PatientRecordDetailAPIView(generics.RetrieveUpdateAPIView):
         if user.role == 'patient' and patient.user_id == user.id:
             return MedicalRecord.objects.filter(patient=patient)
 
-        # 3) доктор — два случая:
-        if user.role == 'doctor' and hasattr(user, 'doctor_profile'):
-            doc = user.doctor_profile
-            # а) если это «свой» пациент — он может смотреть все
-            if patient in doc.patients.all():
+        # 3) доктор — если это «свой» пациент, он может смотреть все
+        if user.role == 'doctor':
+            if hasattr(user, 'doctor_profile') and doctor_has_patient(self.request, user.doctor_profile.id, patient.id):
                 return MedicalRecord.objects.filter(patient=patient)
-            # б) если есть шаринг (pending или accepted) — тоже можно посмотреть
-            return MedicalRecord.objects.filter(
-                patient=patient,
-                shares__doctor=doc,
-                shares__status__in=['pending', 'accepted']
-            )
 
-        # иначе — ни посмотреть, ни изменить
+            records = MedicalRecord.objects.filter(patient=patient)
+            # 4) запись по шарингу, который ещё ждёт ответа, — посмотреть
+            #    до принятия (отдельный EXISTS, а не OR с JOIN и DISTINCT)
+            pk = self.kwargs['pk']
+            if RecordShare.objects.filter(record_id=pk, to_user=user, status='pending').exists():
+                return records.filter(pk=pk)
+            # 5) доступ к записи (владелец / принятый шаринг — RecordAccess),
+            #    как и в списке записей
+            return records.filter(access__user=user)
+
+        # иначе (в том числе пациент, но не этот) — ни посмотреть, ни изменить
         return MedicalRecord.objects.none()
 
+    def etag_parts(self, record):
+        # в ответе ещё доктор (ФИО, специализация, место работы — Doctor,
+        # фото — User) и файлы — файлы сдвигают updated_at записи
+        doctor = record.doctor
+        return (
+            record.pk, record.updated_at,
+            doctor and doctor.updated_at, doctor and doctor.user.time_update,
+        )
+
     def perform_update(self, serializer):
         # 1) сохраняем изменения полей notes, visit_date, appointment_location
         record = serializer.save()
@@ -274,14 +294,17 @@ class PatientRecordDetailAPIView(generics.RetrieveUpdateAPIView):
 
 
 
-class DoctorListAPIView(generics.ListAPIView):
+class DoctorListAPIView(CachedResponseMixin, EagerLoadingViewMixin, generics.ListAPIView):
     """
     GET /doctors/ — возвращает всех докторов.
-    Доступен любому аутентифицированному пользователю
+    Доступен любому аутентифицированному пользователю.
+    Ответ кэшируется (группа 'doctors', сброс — сигналы на Doctor/User).
     """
     queryset = Doctor.objects.all()
     serializer_class = DoctorSerializer
     permission_classes = [IsAuthenticated]
+    ordering = ('last_name', 'first_name', 'id')
+    cache_group = 'doctors'
 
 
 class DoctorPatientsAPIView(generics.ListAPIView):
@@ -291,6 +314,7 @@ class DoctorPatientsAPIView(generics.ListAPIView):
     """
     serializer_class = PatientSerializer
     permission_classes = [IsAuthenticated]
+    ordering = ('last_name', 'first_name', 'id')
 
     def get_queryset(self):
         doctor = get_object_or_404(Doctor, pk=self.kwargs['doctor_id'])
@@ -298,10 +322,10 @@ class DoctorPatientsAPIView(generics.ListAPIView):
 
         # суперюзер и админ видят всех
         if user.is_superuser or user.role == 'admin':
-            return doctor.patients.all()
+            return doctor.patients.with_record_stats()
         # доктор видит только своих пациентов
         if user.role == 'doctor' and hasattr(user, 'doctor_profile') and user.doctor_profile.id == doctor.id:
-            return doctor.patients.all()
+            return doctor.patients.with_record_stats()
         # прочим — пустой список
         return Patient.objects.none()
 
@@ -330,16 +354,85 @@ class ProcessZipView(APIView):
 
 
 class TaskStatusView(APIView):
+    """
+    GET /task-status/<id>/?log_after=<log_cursor>&log_limit=<n>
+    Статус задачи, компактный прогресс и страница лога: строки после
+    log_after (не больше log_limit). log_cursor из ответа — следующий log_after.
+    """
+    LOG_PAGE_SIZE = 200
+
     def get(self, request, task_id):
         job = get_object_or_404(ArchiveJob, pk=task_id)
-        serializer = ArchiveJobSerializer(job)
+        try:
+            log_after = int(request.query_params.get('log_after', 0))
+            log_limit = int(request.query_params.get('log_limit', self.LOG_PAGE_SIZE))
+        except ValueError:
+            return Response(
+                {'detail': 'log_after и log_limit должны быть целыми числами'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        serializer = ArchiveJobSerializer(job, context={
+            'log_after': max(log_after, 0),
+            'log_limit': min(max(log_limit, 1), self.LOG_PAGE_SIZE),
+        })
         return Response(serializer.data)
 
 
+class TaskStatusStreamTicketView(APIView):
+    """
+    POST /task-status/<id>/stream-ticket/ → {"ticket": ...}
+    Короткоживущий билет для task_status_stream — только автору загрузки.
+    """
 
-class RecentUploadsAPIView(generics.ListAPIView):
+    def post(self, request, task_id):
+        job = get_object_or_404(ArchiveJob, pk=task_id, uploaded_by=request.user)
+        return Response({'ticket': issue_stream_ticket(job, request.user)})
+
+
+async def task_status_stream(request, task_id):
+    """
+    GET /task-status/<id>/stream/?ticket=<билет из stream-ticket>
+    То же, что TaskStatusView, но push'ем (text/event-stream) вместо опроса:
+    события status / progress / log, которые публикует Celery-задача.
+    Работает только под ASGI. EventSource не умеет заголовки, поэтому
+    браузер приходит с билетом; остальные клиенты — с Authorization: Bearer.
+    Поток — только автору загрузки, чужая задача — 404.
+    """
+    auth = JWTAuthentication()
+    header = auth.get_header(request)
+    if header:
+        try:
+            user, _ = await sync_to_async(auth.authenticate)(request)
+        except AuthenticationFailed as exc:
+            detail = exc.detail if isinstance(exc.detail, dict) else {'detail': exc.detail}
+            return JsonResponse(detail, status=status.HTTP_401_UNAUTHORIZED)
+        user_id = user.pk
+    elif 'ticket' in request.GET:
+        user_id = check_stream_ticket(request.GET['ticket'], task_id)
+        if user_id is None:
+            return JsonResponse({'detail': 'Билет недействителен или истёк.'}, status=status.HTTP_401_UNAUTHORIZED)
+    else:
+        return JsonResponse({'detail': 'Учетные данные не были предоставлены.'}, status=status.HTTP_401_UNAUTHORIZED)
+
+    job = await ArchiveJob.objects.filter(pk=task_id, uploaded_by_id=user_id).afirst()
+    if job is None:
+        return JsonResponse({'detail': 'Не найдено.'}, status=status.HTTP_404_NOT_FOUND)
+
+    if not settings.ARCHIVE_EVENTS_REDIS_URL:
+        # события не публикуются — клиент остаётся на опросе TaskStatusView
+        return JsonResponse({'detail': 'Push-статус отключён'}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+
+    response = StreamingHttpResponse(stream_job_events(job), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+class RecentUploadsAPIView(EagerLoadingViewMixin, generics.ListAPIView):
     serializer_class   = RecentUploadSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class   = None  # и так последние 10
 
     def get_queryset(self):
         # берем свои задания, отсортированные по времени загрузки (новые — первыми)
@@ -348,13 +441,14 @@ class RecentUploadsAPIView(generics.ListAPIView):
         ).order_by('-uploaded_at')[:10]
 
 
-class ShareRequestViewSet(viewsets.ModelViewSet):
+class ShareRequestViewSet(EagerLoadingViewMixin, viewsets.ModelViewSet):
     """
     GET  /share-requests/             — список входящих+исходящих шарингов
     POST /share-requests/             — создать новый ShareRequest
     POST /share-requests/{id}/respond/ — принять/отклонить весь пакет шаринга
     """
     permission_classes = [IsAuthenticated]
+    ordering = ('-created_at', '-id')
 
     def get_queryset(self):
         user = self.request.user
@@ -372,10 +466,14 @@ class ShareRequestViewSet(viewsets.ModelViewSet):
         ser = self.get_serializer(data=request.data)
         ser.is_valid(raise_exception=True)
         share = ser.save()
-        return Response(
-            ShareRequestSerializer(share, context={'request': request}).data,
-            status=status.HTTP_201_CREATED
-        )
+        return Response(self.share_data(share), status=status.HTTP_201_CREATED)
+
+    def share_data(self, share):
+        # перечитываем по плану выборки ShareRequestSerializer — без N+1 по shares
+        share = ShareRequestSerializer.setup_eager_loading(
+            ShareRequest.objects.filter(pk=share.pk)
+        ).get()
+        return ShareRequestSerializer(share, context={'request': self.request}).data
 
     @action(detail=True, methods=['post'])
     def respond(self, request, pk=None):
@@ -393,9 +491,7 @@ class ShareRequestViewSet(viewsets.ModelViewSet):
         else:
             share.decline()
 
-        return Response(
-            ShareRequestSerializer(share, context={'request': request}).data
-        )
+        return Response(self.share_data(share))
 
 class RecordShareRespondAPIView(APIView):
     """
@@ -9,6 +9,13 @@ const api = axios.create({
   baseURL,
 })
 
+// страница списка (keyset-пагинация на бэкенде): next/previous — готовые URL
+export interface CursorPage<T> {
+  next: string | null
+  previous: string | null
+  results: T[]
+}
+
 // перед каждым запросом подставляем актуальный access
 api.interceptors.request.use((config) => {
   const token = useAuthStore.getState().tokens?.access;
@@ -81,7 +81,7 @@ const PatientDashboard: React.FC = () => {
           >
             <div className="flex items-baseline mb-4">
               <span className="text-3xl font-bold text-primary-600">
-                {patientRecords.length}
+                {currentPatient?.recordCount ?? patientRecords.length}
               </span>
               <span className="ml-1 text-gray-500">records</span>
             </div>
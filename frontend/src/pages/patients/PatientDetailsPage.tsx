@@ -30,10 +30,12 @@ export default function PatientDetailsPage() {
   const {
     currentPatient,
     patientRecords,
+    recordsNext,
     isLoading,
     error,
     fetchPatientById,
     fetchPatientRecords,
+    fetchMoreRecords,
     updatePatientRecord,
   } = usePatientsStore()
 
@@ -142,7 +144,7 @@ export default function PatientDetailsPage() {
           <div className="space-y-4">
             <div>
               <p className="text-sm font-medium text-gray-500">Total Records</p>
-              <p className="mt-1 text-2xl font-bold text-primary-600">{patientRecords.length}</p>
+              <p className="mt-1 text-2xl font-bold text-primary-600">{currentPatient.recordCount ?? patientRecords.length}</p>
             </div>
             <div>
               <p className="text-sm font-medium text-gray-500">Last Updated</p>
@@ -200,6 +202,13 @@ export default function PatientDetailsPage() {
                 />
               ))}
             </div>
+            {recordsNext && (
+              <div className="mt-6 flex justify-center">
+                <Button variant="outline" onClick={() => fetchMoreRecords()}>
+                  Load more records
+                </Button>
+              </div>
+            )}
           </>
         )}
 
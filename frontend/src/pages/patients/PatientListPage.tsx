@@ -14,7 +14,9 @@ import api from '../../api/api'
 const PatientListPage: React.FC = () => {
   const {
     filteredPatients,
+    patientsNext,
     fetchPatients,
+    fetchMorePatients,
     searchPatients,
     filterPatientsByDate,
     isLoading,
@@ -246,6 +248,15 @@ const PatientListPage: React.FC = () => {
               </Button>
             </div>
           )}
+
+          {/* Следующая страница с сервера */}
+          {patientsNext && (
+            <div className="flex justify-center px-6 py-3">
+              <Button variant="outline" onClick={() => fetchMorePatients()}>
+                Load more patients
+              </Button>
+            </div>
+          )}
         </Card>
       )}
 
@@ -4,7 +4,7 @@ import { motion } from 'framer-motion';
 import { CheckCircle, AlertTriangle } from 'lucide-react';
 import { Card } from '../../components/common/Card';
 import { Button } from '../../components/common/Button';
-import api from '../../api/api';
+import api, { CursorPage } from '../../api/api';
 
 interface BackendDoctor {
   id: number;
@@ -24,6 +24,7 @@ const DoctorRequestPage: React.FC = () => {
   const navigate = useNavigate();
 
   const [doctors, setDoctors] = useState<Doctor[]>([]);
+  const [nextPage, setNextPage] = useState<string | null>(null);
   const [selectedDoctors, setSelectedDoctors] = useState<string[]>([]);
   const [loading, setLoading] = useState(true);
   const [fetchError, setFetchError] = useState<string | null>(null);
@@ -32,16 +33,20 @@ const DoctorRequestPage: React.FC = () => {
   const [isSuccess, setIsSuccess] = useState(false);
   const [error, setError] = useState<string | null>(null);
 
-  // 1) Загрузка списка врачей с сервера
-  useEffect(() => {
-    api.get<BackendDoctor[]>('/doctors/')
+  // 1) Загрузка списка врачей с сервера (постранично, «Показать ещё» — следующая страница)
+  const loadDoctors = (url: string, append = false) =>
+    api.get<CursorPage<BackendDoctor>>(url)
       .then(({ data }) => {
-        const list = data.map((d) => ({
+        const list = data.results.map((d) => ({
           id: String(d.id),
           name: `${d.user.first_name} ${d.user.last_name}`,
         }));
-        setDoctors(list);
-      })
+        setDoctors((prev) => (append ? [...prev, ...list] : list));
+        setNextPage(data.next);
+      });
+
+  useEffect(() => {
+    loadDoctors('/doctors/')
       .catch((err) => {
         console.error(err);
         setFetchError('Не удалось загрузить список врачей.');
@@ -172,6 +177,14 @@ const DoctorRequestPage: React.FC = () => {
                   </div>
                 </div>
               ))}
+              {nextPage && (
+                <Button
+                  variant="outline"
+                  onClick={() => loadDoctors(nextPage, true).catch(() => setFetchError('Не удалось загрузить список врачей.'))}
+                >
+                  Показать ещё
+                </Button>
+              )}
             </div>
 
             <div className="flex items-center justify-between">
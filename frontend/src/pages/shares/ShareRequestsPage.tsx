@@ -10,7 +10,7 @@ import { useShareRequestsStore } from '../../stores/shareRequestsStore'
 import type { PatientRecord, DoctorInfo } from '../../stores/patientsStore'
 
 export function ShareRequestsPage() {
-  const { requests, isLoading, error, fetchAll, respond } = useShareRequestsStore()
+  const { requests, next, isLoading, error, fetchAll, fetchMore, respond } = useShareRequestsStore()
   const [modalRecord, setModalRecord] = useState<PatientRecord | null>(null)
 
   useEffect(() => {
@@ -81,6 +81,11 @@ export function ShareRequestsPage() {
             </ul>
           </Card>
         ))}
+        {next && (
+          <div className="flex justify-center">
+            <Button variant="outline" onClick={() => fetchMore()}>Показать ещё</Button>
+          </div>
+        )}
       </div>
 
       {modalRecord && (
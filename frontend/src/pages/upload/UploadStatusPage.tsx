@@ -1,5 +1,5 @@
 // src/pages/upload/UploadStatusPage.tsx
-import React, { useEffect, useRef } from 'react'
+import React, { useEffect, useRef, useState } from 'react'
 import { useParams, Link } from 'react-router-dom'
 import { motion } from 'framer-motion'
 import {
@@ -22,33 +22,31 @@ const FIELD_LABELS: Record<string, string> = {
 
 const UploadStatusPage: React.FC = () => {
   const { jobId } = useParams<{ jobId: string }>()
-  const { currentJob, getJobById } = useUploadStore()
+  const { currentJob, getJobById, watchJob } = useUploadStore()
   const timerRef = useRef<number | null>(null)
+  const [pushFailed, setPushFailed] = useState(false)
 
+  // статус приходит push'ем; опрос — только если поток недоступен
   useEffect(() => {
-    async function fetchStatus() {
-      if (jobId) await getJobById(jobId)
-    }
-    fetchStatus()
-
-    timerRef.current = window.setInterval(async () => {
-      if (!currentJob) return
-      if (currentJob.status === 'done' || currentJob.status === 'failed') {
-        if (timerRef.current !== null) {
-          clearInterval(timerRef.current)
-          timerRef.current = null
-        }
-        return
-      }
-      await fetchStatus()
-    }, POLL_INTERVAL)
+    if (!jobId) return
+    getJobById(jobId)
+    if (pushFailed) return
+    return watchJob(jobId, () => setPushFailed(true))
+  }, [jobId, getJobById, watchJob, pushFailed])
+
+  useEffect(() => {
+    if (!jobId || !pushFailed) return
+    if (currentJob?.status === 'done' || currentJob?.status === 'failed') return
+
+    timerRef.current = window.setInterval(() => getJobById(jobId), POLL_INTERVAL)
 
     return () => {
       if (timerRef.current !== null) {
         clearInterval(timerRef.current)
+        timerRef.current = null
       }
     }
-  }, [jobId, getJobById, currentJob?.status])
+  }, [jobId, getJobById, pushFailed, currentJob?.status])
 
   if (!currentJob) {
     return (
@@ -67,6 +65,7 @@ const UploadStatusPage: React.FC = () => {
     uploaded_at,
     completed_at,
     patient_id,
+    progress,
   } = currentJob
 
   const isDone = status === 'done'
@@ -94,7 +93,9 @@ const UploadStatusPage: React.FC = () => {
     : isFailed
     ? `Processing failed: ${log ?? 'Unknown error'}`
     : isProcessing
-    ? 'Your file is being processed…'
+    ? progress?.members_total
+      ? `Your file is being processed… ${progress.members_done} / ${progress.members_total} files`
+      : 'Your file is being processed…'
     : 'Waiting to start.'
 
   const fileName = file?.name ?? '—'
@@ -1,6 +1,6 @@
 // src/stores/patientStore.ts
 import { create } from 'zustand'
-import api from '../api/api'
+import api, { CursorPage } from '../api/api'
 
 export interface Patient {
   id: string
@@ -42,17 +42,46 @@ export interface PatientRecord {
   }[]
 }
 
+const toPatient = (p: any): Patient => ({
+  id: String(p.id),
+  firstName: p.first_name,
+  lastName: p.last_name,
+  middleName: p.middle_name ?? undefined,
+  birthday: p.birthday,
+  email: p.email ?? undefined,
+  phone: p.phone ?? undefined,
+  photoUrl: p.photo_url ?? undefined,
+  lastVisit: p.last_visit ?? undefined,
+  recordCount: p.record_count ?? 0,
+})
+
+const toRecord = (r: any): PatientRecord => ({
+  id: String(r.id),
+  visit_date: r.visit_date,
+  created_at: r.created_at,
+  appointment_location: r.appointment_location,
+  notes: r.notes,
+  doctor: r.doctor ?? undefined,
+  lab_files: r.lab_files ?? [],
+  versions: r.versions ?? [],
+})
+
 interface PatientsState {
   patients: Patient[]
   filteredPatients: Patient[]
   currentPatient: Patient | null
   patientRecords: PatientRecord[]
+  // URL следующей страницы списка (null — загружено всё)
+  patientsNext: string | null
+  recordsNext: string | null
   isLoading: boolean
   error: string | null
 
   fetchPatients: () => Promise<void>
+  fetchMorePatients: () => Promise<void>
   fetchPatientById: (id: string) => Promise<void>
   fetchPatientRecords: (id: string) => Promise<void>
+  fetchMoreRecords: () => Promise<void>
   createPatientRecord: (patientId: string, form: FormData) => Promise<void>
   updatePatientRecord: (patientId: string, recordId: string, form: FormData) => Promise<void>
   shareRecords: (patientId: string, toEmail: string, recordIds: string[]) => Promise<void>
@@ -65,26 +94,17 @@ export const usePatientsStore = create<PatientsState>((set, get) => ({
   filteredPatients: [],
   currentPatient: null,
   patientRecords: [],
+  patientsNext: null,
+  recordsNext: null,
   isLoading: false,
   error: null,
 
   fetchPatients: async () => {
     set({ isLoading: true, error: null })
     try {
-      const { data } = await api.get<any[]>('/patients/')
-      const patients: Patient[] = data.map(p => ({
-        id: String(p.id),
-        firstName: p.first_name,
-        lastName: p.last_name,
-        middleName: p.middle_name ?? undefined,
-        birthday: p.birthday,
-        email: p.email ?? undefined,
-        phone: p.phone ?? undefined,
-        photoUrl: p.photo_url ?? undefined,
-        lastVisit: p.last_visit ?? undefined,
-        recordCount: p.record_count ?? 0,
-      }))
-      set({ patients, filteredPatients: patients, isLoading: false })
+      const { data } = await api.get<CursorPage<any>>('/patients/')
+      const patients = data.results.map(toPatient)
+      set({ patients, filteredPatients: patients, patientsNext: data.next, isLoading: false })
     } catch (e: any) {
       set({
         error: e.response?.data?.detail || 'Failed to fetch patients',
@@ -93,23 +113,25 @@ export const usePatientsStore = create<PatientsState>((set, get) => ({
     }
   },
 
+  // следующая страница дописывается к уже загруженным; поиск и фильтр
+  // по дате работают по загруженному
+  fetchMorePatients: async () => {
+    const next = get().patientsNext
+    if (!next) return
+    try {
+      const { data } = await api.get<CursorPage<any>>(next)
+      const patients = [...get().patients, ...data.results.map(toPatient)]
+      set({ patients, filteredPatients: patients, patientsNext: data.next })
+    } catch (e: any) {
+      set({ error: e.response?.data?.detail || 'Failed to fetch patients' })
+    }
+  },
+
   fetchPatientById: async id => {
     set({ isLoading: true, error: null, currentPatient: null })
     try {
       const { data: p } = await api.get<any>(`/patients/${id}/`)
-      const patient: Patient = {
-        id: String(p.id),
-        firstName: p.first_name,
-        lastName: p.last_name,
-        middleName: p.middle_name ?? undefined,
-        birthday: p.birthday,
-        email: p.email ?? undefined,
-        phone: p.phone ?? undefined,
-        photoUrl: p.photo_url ?? undefined,
-        lastVisit: p.last_visit ?? undefined,
-        recordCount: p.record_count ?? 0,
-      }
-      set({ currentPatient: patient, isLoading: false })
+      set({ currentPatient: toPatient(p), isLoading: false })
     } catch (e: any) {
       set({
         error: e.response?.data?.detail || 'Failed to fetch patient',
@@ -119,20 +141,10 @@ export const usePatientsStore = create<PatientsState>((set, get) => ({
   },
 
   fetchPatientRecords: async patientId => {
-    set({ isLoading: true, error: null, patientRecords: [] })
+    set({ isLoading: true, error: null, patientRecords: [], recordsNext: null })
     try {
-      const { data } = await api.get<any[]>(`/patients/${patientId}/records/`)
-      const recs: PatientRecord[] = data.map(r => ({
-        id: String(r.id),
-        visit_date: r.visit_date,
-        created_at: r.created_at,
-        appointment_location: r.appointment_location,
-        notes: r.notes,
-        doctor: r.doctor ?? undefined,
-        lab_files: r.lab_files ?? [],
-        versions: r.versions ?? [],
-      }))
-      set({ patientRecords: recs, isLoading: false })
+      const { data } = await api.get<CursorPage<any>>(`/patients/${patientId}/records/`)
+      set({ patientRecords: data.results.map(toRecord), recordsNext: data.next, isLoading: false })
     } catch (e: any) {
       set({
         error: e.response?.data?.detail || 'Failed to fetch records',
@@ -141,6 +153,20 @@ export const usePatientsStore = create<PatientsState>((set, get) => ({
     }
   },
 
+  fetchMoreRecords: async () => {
+    const next = get().recordsNext
+    if (!next) return
+    try {
+      const { data } = await api.get<CursorPage<any>>(next)
+      set(state => ({
+        patientRecords: [...state.patientRecords, ...data.results.map(toRecord)],
+        recordsNext: data.next,
+      }))
+    } catch (e: any) {
+      set({ error: e.response?.data?.detail || 'Failed to fetch records' })
+    }
+  },
+
   createPatientRecord: async (patientId, form) => {
     set({ isLoading: true, error: null })
     try {
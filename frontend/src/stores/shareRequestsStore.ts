@@ -1,6 +1,6 @@
 // src/stores/shareRequestsStore.ts
 import { create } from 'zustand'
-import api from '../api/api'
+import api, { CursorPage } from '../api/api'
 
 export interface SharedRecord {
   id: number
@@ -27,10 +27,12 @@ export interface ShareRequest {
 
 interface ShareRequestsState {
   requests: ShareRequest[]
+  next: string | null
   isLoading: boolean
   error: string | null
 
   fetchAll: () => Promise<void>
+  fetchMore: () => Promise<void>
   respond: (
     shareRequestId: number,
     recordShareId: number,
@@ -38,16 +40,17 @@ interface ShareRequestsState {
   ) => Promise<void>
 }
 
-export const useShareRequestsStore = create<ShareRequestsState>((set) => ({
+export const useShareRequestsStore = create<ShareRequestsState>((set, get) => ({
   requests: [],
+  next: null,
   isLoading: false,
   error: null,
 
   fetchAll: async () => {
     set({ isLoading: true, error: null })
     try {
-      const { data } = await api.get<ShareRequest[]>('/share-requests/')
-      set({ requests: data, isLoading: false })
+      const { data } = await api.get<CursorPage<ShareRequest>>('/share-requests/')
+      set({ requests: data.results, next: data.next, isLoading: false })
     } catch (e: any) {
       set({
         error: e.response?.data?.detail || e.message || 'Не удалось загрузить шаринги',
@@ -56,6 +59,17 @@ export const useShareRequestsStore = create<ShareRequestsState>((set) => ({
     }
   },
 
+  fetchMore: async () => {
+    const next = get().next
+    if (!next) return
+    try {
+      const { data } = await api.get<CursorPage<ShareRequest>>(next)
+      set(state => ({ requests: [...state.requests, ...data.results], next: data.next }))
+    } catch (e: any) {
+      set({ error: e.response?.data?.detail || e.message || 'Не удалось загрузить шаринги' })
+    }
+  },
+
   respond: async (shareRequestId, recordShareId, action) => {
     set({ isLoading: true, error: null })
     try {
@@ -18,6 +18,7 @@ export interface UploadJob {
   record_id?:   number
   patient_id?:  number
   file_name:    string
+  progress?:    JobProgress
 
   // наше локальное расширение
   file?: {
@@ -27,6 +28,16 @@ export interface UploadJob {
   }
 }
 
+export interface JobProgress {
+  phase:         string
+  members_done:  number
+  members_total: number
+  bytes_done:    number
+  bytes_total:   number
+}
+
+const FINAL_STATUSES: UploadJob['status'][] = ['done', 'failed']
+
 interface UploadState {
   currentUpload: File | null
   currentJob:    UploadJob | null
@@ -36,6 +47,7 @@ interface UploadState {
   setCurrentUpload:   (file: File | null) => void
   uploadFile:         (file: File) => Promise<string>
   getJobById:         (id: string) => Promise<void>
+  watchJob:           (id: string, onError: () => void) => () => void
   updateExtractedData:(
     jobId: string,
     data: Partial<UploadJob['raw_extracted']>
@@ -97,6 +109,66 @@ export const useUploadStore = create<UploadState>((set, get) => ({
     }
   },
 
+  // push-статус вместо опроса: SSE-поток /task-status/<id>/stream/.
+  // EventSource не умеет заголовки — в URL идёт короткоживущий билет,
+  // а не access-токен. Возвращает функцию отписки; onError — сигнал
+  // перейти на опрос
+  watchJob: (id, onError) => {
+    let source: EventSource | null = null
+    let stopped = false
+
+    const patch = (upd: Partial<UploadJob>) => {
+      const j = get().currentJob
+      if (j && String(j.id) === String(id)) set({ currentJob: { ...j, ...upd } })
+    }
+
+    const connect = async () => {
+      let ticket: string
+      try {
+        const { data } = await api.post<{ ticket: string }>(`/task-status/${id}/stream-ticket/`)
+        ticket = data.ticket
+      } catch {
+        if (!stopped) onError()
+        return
+      }
+      if (stopped) return
+
+      let opened = false
+      source = new EventSource(
+        `${api.defaults.baseURL}/task-status/${id}/stream/?ticket=${encodeURIComponent(ticket)}`
+      )
+      source.onopen = () => { opened = true }
+      source.addEventListener('progress', e => {
+        patch({ progress: JSON.parse((e as MessageEvent).data).progress })
+      })
+      source.addEventListener('status', e => {
+        const { status, progress } = JSON.parse((e as MessageEvent).data)
+        patch({ status, progress })
+        if (FINAL_STATUSES.includes(status)) {
+          // итог (record, raw_extracted, лог) — одним обычным запросом
+          stopped = true
+          source?.close()
+          get().getJobById(id)
+        }
+      })
+      source.onerror = () => {
+        source?.close()
+        if (stopped) return
+        // поток был и оборвался (таймаут сервера) — переподключаемся
+        // с новым билетом: старый к этому времени мог истечь.
+        // Не открылся вовсе (401/404/503, нет ASGI) — на опрос
+        if (opened) connect()
+        else onError()
+      }
+    }
+
+    connect()
+    return () => {
+      stopped = true
+      source?.close()
+    }
+  },
+
   updateExtractedData: (jobId, upd) =>
     set(state => {
       const j = state.currentJob